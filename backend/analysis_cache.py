@@ -0,0 +1,183 @@
+"""
+Result cache for the per-region analysis stages.
+
+Entries are keyed by track content hash + region + stage parameters, so
+re-running a preview or an analysis on the same region (e.g. with only a new
+prompt) skips the decode, spectrogram, tempo and chord work. Two tiers:
+
+    memory: LRU bounded by the pickled size of the values
+    disk:   optional (ANALYSIS_CACHE_DIR), survives restarts, LRU by file mtime
+
+Only successful stage results are stored; fallbacks from failed or timed-out
+stages never are.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES") or 256 * 1024 ** 2)
+# Empty disables the disk tier
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") or ""
+ANALYSIS_CACHE_DISK_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_BYTES") or 2 * 1024 ** 3)
+
+# Bump when a stage's output format or algorithm changes to orphan old entries
+_KEY_VERSION = 1
+# The disk tier is swept for eviction every this many writes
+_DISK_SWEEP_EVERY = 32
+
+_lock = threading.Lock()
+_memory: "OrderedDict[str, bytes]" = OrderedDict()
+_memory_bytes = 0
+_disk_writes = 0
+_stats = {
+    "memoryHits": 0,
+    "diskHits": 0,
+    "misses": 0,
+    "memoryEvictions": 0,
+    "diskEvictions": 0,
+}
+
+if ANALYSIS_CACHE_DIR:
+    os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+
+
+def make_key(stage: str, track_id: str, start_sec: float, end_sec: float, params: Dict) -> str:
+    """
+    Cache key for one stage over one region.
+
+    Args:
+        stage: Stage name ("spectrogram", "tempo", "chords", ...)
+        track_id: Content hash of the source track
+        start_sec, end_sec: Region as requested (rounded to the millisecond)
+        params: Everything else that changes the output (n_mels, fmax, engine, ...)
+    """
+    ident = json.dumps({
+        "v": _KEY_VERSION,
+        "stage": stage,
+        "track": track_id,
+        "start": round(float(start_sec), 3),
+        "end": round(float(end_sec), 3),
+        "params": params,
+    }, sort_keys=True)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(ANALYSIS_CACHE_DIR, key[:2], key + ".pkl")
+
+
+def _remember(key: str, blob: bytes) -> None:
+    """Insert into the memory tier and evict from the cold end. Caller holds _lock."""
+    global _memory_bytes
+    if len(blob) > ANALYSIS_CACHE_MAX_BYTES:
+        return
+    old = _memory.pop(key, None)
+    if old is not None:
+        _memory_bytes -= len(old)
+    _memory[key] = blob
+    _memory_bytes += len(blob)
+    while _memory_bytes > ANALYSIS_CACHE_MAX_BYTES:
+        _, evicted = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted)
+        _stats["memoryEvictions"] += 1
+
+
+def _evict_disk() -> None:
+    """Drop least-recently-used disk entries until the tier fits its budget."""
+    entries = []
+    total = 0
+    for root, _, names in os.walk(ANALYSIS_CACHE_DIR):
+        for name in names:
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= ANALYSIS_CACHE_DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        with _lock:
+            _stats["diskEvictions"] += 1
+
+
+def get(key: str) -> Optional[Any]:
+    """Cached value for key, or None on a miss."""
+    with _lock:
+        blob = _memory.get(key)
+        if blob is not None:
+            _memory.move_to_end(key)
+            _stats["memoryHits"] += 1
+            return pickle.loads(blob)
+
+    if ANALYSIS_CACHE_DIR:
+        path = _disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.utime(path)
+        except OSError:
+            blob = None
+        if blob is not None:
+            with _lock:
+                _stats["diskHits"] += 1
+                _remember(key, blob)
+            return pickle.loads(blob)
+
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+
+def put(key: str, value: Any) -> None:
+    """Store a value in every enabled tier."""
+    global _disk_writes
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    with _lock:
+        _remember(key, blob)
+        _disk_writes += 1
+        sweep = _disk_writes % _DISK_SWEEP_EVERY == 0
+
+    if ANALYSIS_CACHE_DIR:
+        path = _disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+            if sweep:
+                _evict_disk()
+        except OSError as e:
+            print(f"Analysis cache write failed: {e}")
+
+
+def stats() -> Dict[str, int]:
+    """Hit/miss/eviction counters and current memory usage."""
+    with _lock:
+        return dict(
+            _stats,
+            memoryEntries=len(_memory),
+            memoryBytes=_memory_bytes,
+            maxMemoryBytes=ANALYSIS_CACHE_MAX_BYTES,
+            diskEnabled=bool(ANALYSIS_CACHE_DIR),
+        )
@@ -0,0 +1,141 @@
+"""
+Concurrent execution of the independent analysis stages of a request.
+
+Spectrogram, tempo and chord extraction only share the decoded audio, so they
+run side by side: librosa work in the DSP process pool (it is CPU-bound and
+holds the GIL for long stretches), the Chordino subprocess in a thread (it
+mostly waits). Request latency becomes roughly the slowest stage instead of the sum.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import analysis_cache
+import dsp_executor
+
+load_dotenv()
+
+# Per-stage timeouts in seconds, measured from when the stage graph starts
+STAGE_TIMEOUTS: Dict[str, float] = {
+    "spectrogram": float(os.getenv("SPECTROGRAM_TIMEOUT_SEC") or "60"),
+    "tempo": float(os.getenv("TEMPO_TIMEOUT_SEC") or "60"),
+    "chords": float(os.getenv("CHORDS_TIMEOUT_SEC") or "120"),
+}
+_DEFAULT_TIMEOUT = 120.0
+
+_thread_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STAGE_THREADS") or "8"),
+    thread_name_prefix="analysis-stage",
+)
+
+# Marks stages that have no fallback: their failure fails the request
+_REQUIRED = object()
+
+
+class StageError(RuntimeError):
+    """A required stage failed or exceeded its timeout (timed_out tells which)."""
+
+    def __init__(self, stage: str, message: str, timed_out: bool = False):
+        super().__init__(f"{stage} stage {message}")
+        self.stage = stage
+        self.timed_out = timed_out
+
+
+@dataclass
+class Stage:
+    """
+    One node of the stage graph.
+
+    executor: "process" for CPU-bound DSP (first arg must be the AudioBuffer),
+              "thread" for subprocess/IO-bound work
+    fallback: value used when the stage fails or times out; omit to make it required
+    cache_key: analysis_cache key; a successful result is stored under it
+               unless it equals the fallback
+    """
+    name: str
+    fn: Callable
+    args: tuple = ()
+    executor: str = "process"
+    fallback: Any = field(default=_REQUIRED)
+    cache_key: Optional[str] = None
+
+
+def _submit_all(stages: List[Stage]) -> Dict[str, Future]:
+    """Start every stage; on DSP back-pressure cancel what was already started."""
+    futures = {}
+    try:
+        for stage in stages:
+            if stage.executor == "process":
+                futures[stage.name] = dsp_executor.submit(stage.fn, *stage.args)
+            else:
+                futures[stage.name] = _thread_pool.submit(stage.fn, *stage.args)
+    except dsp_executor.DSPBusyError:
+        for future in futures.values():
+            future.cancel()
+        raise
+    return futures
+
+
+async def _on_success(stage: Stage, result: Any) -> Any:
+    # Chordino reports failures (missing binary, timeout, non-zero exit) as [],
+    # the chords fallback; a result equal to the fallback may be one and is
+    # not cached, or one bad run would pin it for that audio
+    if stage.fallback is not _REQUIRED and result == stage.fallback:
+        return result
+    if stage.cache_key:
+        # Pickling, the disk write and the periodic eviction sweep stay off the loop
+        await asyncio.to_thread(analysis_cache.put, stage.cache_key, result)
+    return result
+
+
+def _on_timeout(stage: Stage, timeout: float) -> Any:
+    if stage.fallback is _REQUIRED:
+        raise StageError(stage.name, f"timed out after {timeout:.0f}s", timed_out=True)
+    print(f"{stage.name} stage timed out after {timeout:.0f}s, using fallback")
+    return stage.fallback
+
+
+def _on_failure(stage: Stage, error: Exception) -> Any:
+    if stage.fallback is _REQUIRED:
+        raise StageError(stage.name, f"failed: {error}") from error
+    print(f"{stage.name} stage failed, using fallback: {error}")
+    return stage.fallback
+
+
+async def run_stages_async(stages: List[Stage]) -> Dict[str, Any]:
+    """
+    Start every stage at once and await the results.
+
+    Returns:
+        Dict of stage name -> result (or its fallback)
+
+    Raises:
+        StageError: if a required stage fails or times out
+        dsp_executor.DSPBusyError: if the DSP pool is saturated
+    """
+    started = time.monotonic()
+    # Submitting can block on DSP back-pressure, so it happens off the loop
+    futures = await asyncio.to_thread(_submit_all, stages)
+
+    results = {}
+    for stage in stages:
+        future = futures[stage.name]
+        timeout = STAGE_TIMEOUTS.get(stage.name, _DEFAULT_TIMEOUT)
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+            results[stage.name] = await _on_success(stage, result)
+        except asyncio.TimeoutError:
+            # A running stage can't be interrupted; its result is simply discarded
+            future.cancel()
+            results[stage.name] = _on_timeout(stage, timeout)
+        except Exception as e:
+            results[stage.name] = _on_failure(stage, e)
+
+    return results
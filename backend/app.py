@@ -1,29 +1,69 @@
+import asyncio
 import base64
+import json
 import os
-import tempfile
-from typing import Optional
+import uuid
+from typing import Dict, Optional, Tuple
 
-from fastapi import FastAPI, File, Form, UploadFile
+from fastapi import BackgroundTasks, FastAPI, File, Form, HTTPException, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from audio_processor import trim_audio_to_temp, generate_mel_spectrogram_png
+from analysis_pipeline import Stage, StageError, run_stages_async
+import analysis_cache
+import audio_encoder
+import chat_history
+import dsp_executor
+import llm_response_cache
+import provider_clients
+import session_store
+import singleflight
+from audio_processor import decode_audio, compute_mel_db, generate_mel_spectrogram_png, MEL_HOP_LENGTH
 from gemini_client import (
     start_audio_chat_session as gemini_start_session,
     send_chat_message as gemini_send_message,
+    stream_audio_chat_session as gemini_stream_session,
+    stream_chat_message as gemini_stream_message,
+    upload_audio as gemini_upload_audio,
+    file_cache_stats as gemini_file_cache_stats,
 )
 from openai_client import (
     start_audio_chat_session as openai_start_session,
     send_chat_message as openai_send_message,
+    stream_audio_chat_session as openai_stream_session,
+    stream_chat_message as openai_stream_message,
 )
 from midi_engine import extract_and_generate_midi
-from tempo_analyzer import detect_tempo
-from chordino import extract_chords, chords_to_beats, format_chords_for_llm
+from tempo_analyzer import FAST_TEMPO_SR, TEMPO_MODE, detect_tempo
+from chordino import CHORD_ENGINE, extract_chords, chords_to_beats, format_chords_for_llm
+from spectrogram_tiles import ensure_pyramid, get_tile_path
+from waveform_peaks import ensure_peaks, get_peaks
+from spectrogram_data import encode_mel_payload, SUPPORTED_DTYPES
+from spectrogram_renderer import SPECTROGRAM_RENDERER, render_spectrogram_png
+from feature_store import (
+    FEATURE_FMAX,
+    FEATURE_N_MELS,
+    ensure_features,
+    features_ready,
+    region_chords,
+    region_mel_db,
+    region_tempo,
+)
+from track_store import save_track, get_track_path, get_track_meta
 
 app = FastAPI(title="Gemini Audio Engineer API")
 
-# Track which provider each session uses for follow-up routing
-_session_providers: dict[str, str] = {}  # session_id -> "gemini" | "openai"
+# Chordino waits on a subprocess (thread); the NumPy engine is CPU-bound (DSP pool)
+_CHORDS_EXECUTOR = "process" if CHORD_ENGINE == "numpy" else "thread"
+
+# Parameters that change each region stage's output; part of its cache key
+_STAGE_PARAMS = {
+    "spectrogram": {"nMels": 128, "fmax": 16000, "renderer": SPECTROGRAM_RENDERER},
+    "tempo": {"mode": TEMPO_MODE, "fastSr": FAST_TEMPO_SR, "beats": False},
+    "chords": {"engine": CHORD_ENGINE},
+}
 
 # Create static directory for MIDI files
 MIDI_OUTPUT_DIR = "static/midi"
@@ -45,85 +85,438 @@ app.add_middleware(
 )
 
 
-def _save_upload_to_temp(upload: UploadFile) -> str:
-    suffix = os.path.splitext(upload.filename or "")[1].lower() or ".wav"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(upload.file.read())
-        return tmp.name
+async def _resolve_source(
+    upload: Optional[UploadFile],
+    track_id: Optional[str],
+) -> Tuple[str, str]:
+    """
+    Resolve the audio source of a request to (track_id, path).
+
+    Clients either reference a previously uploaded track by ID or send the
+    file inline; inline uploads go through the same content-addressed store.
+    """
+    if track_id:
+        try:
+            return track_id, get_track_path(track_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Track not found. Upload it again.")
+
+    if upload is None:
+        raise HTTPException(status_code=400, detail="Provide either 'file' or 'trackId'.")
+
+    # Hashing and copying the upload is blocking file IO
+    track_id, _ = await run_in_threadpool(save_track, upload.file, upload.filename)
+    return track_id, get_track_path(track_id)
+
+
+async def _run_stages_http(stages):
+    """run_stages_async with its errors mapped to HTTP: 504 on timeout, 500 on failure, 503 when busy."""
+    try:
+        return await run_stages_async(stages)
+    except StageError as e:
+        raise HTTPException(status_code=504 if e.timed_out else 500, detail=str(e))
+    except dsp_executor.DSPBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+def _cached_stage_results(track_id: str, start_sec: float, end_sec: float, names: Tuple[str, ...]):
+    """
+    Look up region stages in the analysis cache.
+
+    Returns:
+        Tuple of (cached results by stage name, cache key by stage name)
+    """
+    keys = {
+        name: analysis_cache.make_key(name, track_id, start_sec, end_sec, _STAGE_PARAMS[name])
+        for name in names
+    }
+    results = {}
+    for name, key in keys.items():
+        value = analysis_cache.get(key)
+        # Empty chord lists cached before failed runs were skipped are recomputed
+        if value is not None and not (name == "chords" and not value):
+            results[name] = value
+    return results, keys
+
+
+def _region_stages(audio, names, keys: dict, wav_path: Optional[str] = None):
+    """Stage graph for the region stages that still need computing."""
+    stages = []
+    if "spectrogram" in names:
+        stages.append(Stage("spectrogram", generate_mel_spectrogram_png, (audio,), cache_key=keys["spectrogram"]))
+    if "tempo" in names:
+        stages.append(Stage("tempo", detect_tempo, (audio, False), cache_key=keys["tempo"]))
+    if "chords" in names:
+        stages.append(Stage(
+            "chords", extract_chords, (audio, wav_path),
+            executor=_CHORDS_EXECUTOR, fallback=[], cache_key=keys["chords"],
+        ))
+    return stages
 
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {
+        "ok": True,
+        "dsp": dsp_executor.stats(),
+        "analysisCache": analysis_cache.stats(),
+        "geminiFiles": gemini_file_cache_stats(),
+        "audioEncoder": audio_encoder.stats(),
+        "sessions": session_store.stats(),
+        "openaiHistory": chat_history.stats(),
+        "providers": provider_clients.stats(),
+        "singleflight": singleflight.stats(),
+        "llmCache": llm_response_cache.stats(),
+    }
+
+
+def _precompute_track(track_id: str) -> None:
+    """
+    Background work after an upload: waveform peaks first (the UI waits on them),
+    then the full-track features region requests are sliced from. The feature
+    pass builds the spectrogram pyramid from the same decode.
+    """
+    builds = (
+        ("Waveform peaks", ensure_peaks),
+        ("Track features", ensure_features),
+    )
+    for name, build in builds:
+        try:
+            build(track_id)
+        except Exception as e:
+            print(f"{name} build failed for {track_id}: {e}")
+
+
+def _sliced_results(track_id: str, start_sec: float, end_sec: float, stages: Tuple[str, ...]) -> dict:
+    """
+    Answer region stages from the precomputed feature store instead of decoding.
+    Returns the same keys run_stages_async would for the requested stage names,
+    except chords when the track has no stored chord timeline.
+    Callers only use the BPM, so tempo skips the beat grid.
+    """
+    results = {}
+    if "spectrogram" in stages:
+        S_dB, sr, hop = region_mel_db(track_id, start_sec, end_sec)
+        results["spectrogram"] = render_spectrogram_png(S_dB, sr, hop_length=hop, fmax=FEATURE_FMAX)
+    if "tempo" in stages:
+        results["tempo"] = region_tempo(track_id, start_sec, end_sec, beats=False)
+    if "chords" in stages:
+        chords = region_chords(track_id, start_sec, end_sec)
+        if chords is not None:
+            results["chords"] = chords
+    return results
+
+
+def _lookup_region(track_id: str, start_sec: float, end_sec: float, names: Tuple[str, ...]):
+    """
+    Everything that can be answered without decoding: sliced features when the
+    track has them, otherwise whatever the analysis cache holds.
+
+    Returns:
+        Tuple of (results by stage name, cache keys for the stages still to compute)
+    """
+    if not features_ready(track_id):
+        return _cached_stage_results(track_id, start_sec, end_sec, names)
+
+    results = _sliced_results(track_id, start_sec, end_sec, names)
+    # Chords fall back to the clip when the full-track pass produced none
+    rest = tuple(name for name in names if name not in results)
+    if not rest:
+        return results, {}
+    cached, keys = _cached_stage_results(track_id, start_sec, end_sec, rest)
+    results.update(cached)
+    return results, keys
+
+
+@app.post("/api/tracks")
+async def upload_track(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """
+    Store an audio file once under its content hash.
+    Re-uploading identical bytes returns the existing track.
+    """
+    track_id, created = await run_in_threadpool(save_track, file.file, file.filename)
+    meta = get_track_meta(track_id)
+    # Precompute peaks and the zoom pyramid while the user picks a region
+    background_tasks.add_task(_precompute_track, track_id)
+    return {
+        "trackId": track_id,
+        "created": created,
+        "sizeBytes": meta.get("sizeBytes"),
+    }
+
+
+@app.get("/api/tracks/{track_id}")
+def get_track(track_id: str):
+    """
+    Look up a stored track, so clients can skip uploading bytes the server already has.
+    """
+    try:
+        return get_track_meta(track_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Track not found.")
+
+
+@app.get("/api/tracks/{track_id}/peaks")
+def waveform_peaks(track_id: str, maxPeaks: int = 16000):
+    """
+    Precomputed min/max peaks for drawing the waveform without decoding in the browser.
+    Returns the finest cached level with at most maxPeaks points.
+    """
+    try:
+        return get_peaks(track_id, max_peaks=maxPeaks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Track not found.")
+
+
+@app.get("/api/tracks/{track_id}/spectrogram/pyramid")
+def spectrogram_pyramid(track_id: str):
+    """
+    Metadata for the track's tiled spectrogram pyramid (levels, tile size, seconds per column).
+    Builds the pyramid on first access.
+    """
+    try:
+        return ensure_pyramid(track_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Track not found.")
+
+
+@app.get("/api/tracks/{track_id}/spectrogram/tiles/{level}/{index}.png")
+def spectrogram_tile(track_id: str, level: int, index: int):
+    """
+    One cached PNG tile of the pyramid (TILE_WIDTH columns x n_mels rows, no axes).
+    """
+    try:
+        tile_path = get_tile_path(track_id, level, index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (KeyError, IndexError):
+        raise HTTPException(status_code=404, detail="Tile not found.")
+    return FileResponse(
+        tile_path,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
 
 
 @app.post("/api/spectrogram")
-def spectrogram(
-    file: UploadFile = File(...),
+async def spectrogram(
+    file: Optional[UploadFile] = File(None),
+    trackId: Optional[str] = Form(None),
     startSec: float = Form(...),
     endSec: float = Form(...),
+    includeImage: bool = Form(True),  # False when the client renders /api/spectrogram/data itself
 ):
     """
     Returns a Mel spectrogram PNG (base64), detected BPM, and chord progression.
     This does NOT call Gemini — it's just a preview.
     """
-    original_path = _save_upload_to_temp(file)
-    trimmed_path = trim_audio_to_temp(original_path, startSec, endSec, export_format="wav")
-    spec_png = generate_mel_spectrogram_png(trimmed_path)
-    
-    # Detect tempo
-    bpm, beat_times = detect_tempo(trimmed_path)
+    track_id, original_path = await _resolve_source(file, trackId)
+
+    wanted = ("tempo", "chords", "spectrogram") if includeImage else ("tempo", "chords")
+    # Sliced features or cached results need no decoding
+    results, keys = await run_in_threadpool(_lookup_region, track_id, startSec, endSec, wanted)
+    missing = [name for name in wanted if name not in results]
+    if missing:
+        # Decode once; every stage below reads the same in-memory buffer
+        audio = await run_in_threadpool(decode_audio, original_path, startSec, endSec)
+        # Spectrogram, tempo and chords are independent; run them side by side
+        results.update(await _run_stages_http(_region_stages(audio, missing, keys)))
+
+    spec_png = results.get("spectrogram")
+    bpm, beat_times = results["tempo"]
     
-    # Extract chords and convert to beat-based format
-    raw_chords = extract_chords(trimmed_path)
-    chords = chords_to_beats(raw_chords, bpm)
+    # Convert chords to beat-based format
+    chords = chords_to_beats(results["chords"], bpm)
     
     return {
-        "spectrogramPngBase64": base64.b64encode(spec_png).decode("utf-8"),
+        "trackId": track_id,
+        "spectrogramPngBase64": base64.b64encode(spec_png).decode("utf-8") if spec_png else None,
         "bpm": round(bpm, 1),
         "chords": chords
     }
 
 
-@app.post("/api/analyze")
-def analyze(
-    file: UploadFile = File(...),
+@app.post("/api/spectrogram/data")
+async def spectrogram_data(
+    file: Optional[UploadFile] = File(None),
+    trackId: Optional[str] = Form(None),
     startSec: float = Form(...),
     endSec: float = Form(...),
-    prompt: str = Form(...),
-    modelId: str = Form(...),
-    temperature: float = Form(0.2),
-    thinkingBudget: int = Form(0),
-    mode: str = Form("engineer"),
-    bpm: Optional[float] = Form(None),  # User-edited BPM from frontend
-    chords: Optional[str] = Form(None),  # User-edited chords JSON from frontend
+    dtype: str = Form("uint8"),  # "uint8" (quantized) or "float16"
+    nMels: int = Form(128),
+    fmax: int = Form(16000),
 ):
     """
-    Trims audio, generates spectrogram, starts Chat Session with Gemini or OpenAI.
-    Returns initial advice + session ID.
+    Returns the Mel dB matrix as a compact binary payload (see spectrogram_data.py)
+    so the frontend can render, zoom and re-color it without another round trip.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise HTTPException(status_code=400, detail=f"dtype must be one of {SUPPORTED_DTYPES}")
+
+    track_id, original_path = await _resolve_source(file, trackId)
+
+    sliced = nMels == FEATURE_N_MELS and fmax == FEATURE_FMAX and features_ready(track_id)
+    cache_key = analysis_cache.make_key(
+        "melData", track_id, startSec, endSec, {"nMels": nMels, "fmax": fmax, "dtype": dtype},
+    )
+    payload = None if sliced else await run_in_threadpool(analysis_cache.get, cache_key)
+
+    if payload is None:
+        if sliced:
+            S_dB, sr, hop_length = await run_in_threadpool(region_mel_db, track_id, startSec, endSec)
+        else:
+            audio = await run_in_threadpool(decode_audio, original_path, startSec, endSec)
+            try:
+                S_dB = await dsp_executor.run_async(compute_mel_db, audio, nMels, fmax)
+            except dsp_executor.DSPBusyError as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+            sr, hop_length = audio.sr, MEL_HOP_LENGTH
+
+        payload = await run_in_threadpool(
+            encode_mel_payload,
+            S_dB,
+            sr=sr,
+            hop_length=hop_length,
+            fmax=fmax,
+            start_sec=max(0.0, startSec),
+            dtype=dtype,
+        )
+        if not sliced:
+            await run_in_threadpool(analysis_cache.put, cache_key, payload)
+    return Response(
+        content=payload,
+        media_type="application/octet-stream",
+        headers={"X-Track-Id": track_id},
+    )
+
+
+async def _prepare_analysis(
+    track_id: str,
+    original_path: str,
+    start_sec: float,
+    end_sec: float,
+    prompt: str,
+    mode: str,
+    bpm: Optional[float],
+    chords: Optional[str],
+    model_id: str,
+) -> dict:
+    """
+    Local part of an analysis: trim, spectrogram and (Producer mode) tempo/chords.
+
+    Identical concurrent requests (same track, region, mode, BPM/chords and
+    provider) share one computation, including the Gemini upload.
+
+    Returns:
+        Dict with trackId, audioPath (provider-encoded region), spectrogramPng,
+        bpm, chords, the prompt to send (with the musical context prepended)
+        and uploadTask (the pending Gemini upload, None for OpenAI; await it
+        through asyncio.shield, other requests may share it). Pass audioPath
+        to _release_audio once the provider has the audio.
+    """
+    provider = "openai" if model_id.startswith("gpt-") else "gemini"
+    key = singleflight.make_key("prepare", {
+        "track": track_id, "start": start_sec, "end": end_sec, "mode": mode,
+        "bpm": bpm, "chords": chords, "provider": provider,
+    })
+    region, _ = await singleflight.do(key, lambda: _prepare_region(
+        track_id, original_path, start_sec, end_sec, mode, bpm, chords, provider,
+    ))
+    # No await since the region was produced, so the file can't have been released yet
+    _hold_audio(region["audioPath"])
+
+    # The dict may be shared with coalesced requests
+    region = dict(region)
+    musical_context = region.pop("musicalContext")
+    # Prepend musical context to user prompt if available
+    region["prompt"] = f"{musical_context}\n\n{prompt}" if musical_context else prompt
+    return region
+
+
+# Encoded region file -> requests still using it. Coalesced requests share
+# one prepared region, so its file is deleted when the last of them is done.
+_audio_users: Dict[str, int] = {}
+
+
+def _hold_audio(path: str) -> None:
+    _audio_users[path] = _audio_users.get(path, 0) + 1
+
+
+def _release_audio(path: str) -> None:
+    """Drop one request's use of an encoded region, deleting the file after the last."""
+    users = _audio_users.pop(path, 1) - 1
+    if users > 0:
+        _audio_users[path] = users
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def _prepare_region(
+    track_id: str,
+    original_path: str,
+    start_sec: float,
+    end_sec: float,
+    mode: str,
+    bpm: Optional[float],
+    chords: Optional[str],
+    provider: str,
+) -> dict:
     """
-    original_path = _save_upload_to_temp(file)
-    trimmed_path = trim_audio_to_temp(original_path, startSec, endSec, export_format="wav")
-    spec_png = generate_mel_spectrogram_png(trimmed_path)
+    The prompt-independent part of _prepare_analysis.
+
+    The region is encoded for the target provider (see audio_encoder). For
+    Gemini the upload (and the wait for the file to become ACTIVE) only depends
+    on that file, so it starts right away and runs while the DSP stages compute.
+    """
+    audio = await run_in_threadpool(decode_audio, original_path, start_sec, end_sec)
+    encoded = await run_in_threadpool(audio_encoder.encode_for_provider, audio, provider, mode)
+    upload_task = asyncio.create_task(gemini_upload_audio(encoded.path)) if provider == "gemini" else None
     
     # For Producer mode, use user-provided BPM/chords OR detect if not provided
-    import json
     musical_context = ""
     final_bpm = bpm
     final_chords = []
     
-    if mode == "producer":
+    if mode == "producer" and chords:
         # Parse chords JSON if provided
-        if chords:
-            try:
-                final_chords = json.loads(chords)
-            except json.JSONDecodeError:
-                final_chords = []
-        
-        # If no user-provided data, detect it
-        if not final_bpm or not final_chords:
-            detected_bpm, beat_times = detect_tempo(trimmed_path)
-            raw_chords = extract_chords(trimmed_path)
+        try:
+            final_chords = json.loads(chords)
+        except json.JSONDecodeError:
+            final_chords = []
+
+    # If no user-provided data, detect it alongside the spectrogram
+    detect = mode == "producer" and (not final_bpm or not final_chords)
+    wanted = ("spectrogram", "tempo", "chords") if detect else ("spectrogram",)
+    try:
+        results, keys = await run_in_threadpool(_lookup_region, track_id, start_sec, end_sec, wanted)
+        missing = [name for name in wanted if name not in results]
+        if missing:
+            results.update(await _run_stages_http(_region_stages(audio, missing, keys)))
+    except BaseException:
+        # The request is failing; don't leave the upload running unobserved
+        if upload_task:
+            upload_task.cancel()
+        try:
+            os.remove(encoded.path)
+        except OSError:
+            pass
+        raise
+    
+    if mode == "producer":
+        if detect:
+            detected_bpm, beat_times = results["tempo"]
+            raw_chords = results["chords"]
             
             if not final_bpm:
                 final_bpm = detected_bpm
@@ -134,62 +527,359 @@ def analyze(
         if final_chords and final_bpm:
             musical_context = format_chords_for_llm(final_chords, final_bpm)
     
-    # Prepend musical context to user prompt if available
-    enhanced_prompt = f"{musical_context}\n\n{prompt}" if musical_context else prompt
+    return {
+        "trackId": track_id,
+        "audioPath": encoded.path,
+        "spectrogramPng": results["spectrogram"],
+        "bpm": final_bpm,
+        "chords": final_chords,
+        "musicalContext": musical_context,
+        "uploadTask": upload_task,
+    }
+
+
+async def _start_analysis_session(
+    prepared: dict,
+    model_id: str,
+    temperature: float,
+    thinking_budget: int,
+    mode: str,
+    cache_key: Optional[str],
+) -> Tuple[str, str, Optional[str], str]:
+    """
+    Start the provider chat for a prepared analysis and extract its MIDI.
+    With a cache_key (see _llm_cache_key) the reply is stored in llm_response_cache.
 
+    Returns:
+        Tuple of (session_id, advice without the MIDI block, MIDI filename or None,
+        cache status: "miss" or "bypass")
+    """
     # Route to appropriate provider based on model ID
-    if modelId.startswith("gpt-"):
-        session_id, advice = openai_start_session(
-            audio_path=trimmed_path,
-            spectrogram_png_bytes=spec_png,
-            user_prompt=enhanced_prompt,
-            model_id=modelId,
-            temperature=float(temperature),
+    if model_id.startswith("gpt-"):
+        session_id, advice = await openai_start_session(
+            audio_path=prepared["audioPath"],
+            spectrogram_png_bytes=prepared["spectrogramPng"],
+            user_prompt=prepared["prompt"],
+            model_id=model_id,
+            temperature=temperature,
             mode=mode,
         )
-        _session_providers[session_id] = "openai"
     else:
-        session_id, advice = gemini_start_session(
-            audio_path=trimmed_path,
-            spectrogram_png_bytes=spec_png,
-            user_prompt=enhanced_prompt,
-            model_id=modelId,
-            temperature=float(temperature),
-            thinking_budget=thinkingBudget,
+        session_id, advice = await gemini_start_session(
+            audio_path=prepared["audioPath"],
+            spectrogram_png_bytes=prepared["spectrogramPng"],
+            user_prompt=prepared["prompt"],
+            model_id=model_id,
+            temperature=temperature,
+            thinking_budget=thinking_budget,
             mode=mode,
+            uploaded_audio=await asyncio.shield(prepared["uploadTask"]),
         )
-        _session_providers[session_id] = "gemini"
 
     # Process MIDI data from response (Producer mode)
-    clean_advice, midi_filename = extract_and_generate_midi(advice, MIDI_OUTPUT_DIR)
+    clean_advice, midi_filename = await run_in_threadpool(extract_and_generate_midi, advice, MIDI_OUTPUT_DIR)
+    if cache_key:
+        await run_in_threadpool(_cache_reply, cache_key, prepared, session_id, advice, clean_advice, midi_filename)
+    return session_id, clean_advice, midi_filename, "miss" if cache_key else "bypass"
+
+
+def _llm_cache_key(
+    track_id: str,
+    start_sec: float,
+    end_sec: float,
+    prompt: str,
+    mode: str,
+    model_id: str,
+    temperature: float,
+    thinking_budget: int,
+    bpm: Optional[float],
+    chords: Optional[str],
+) -> Optional[str]:
+    """
+    Response cache key for this analysis, or None if the request may not use the cache.
+    Built from request inputs only, so it is checked before any decoding or upload.
+    """
+    if not llm_response_cache.cacheable(temperature):
+        return None
+    provider = "openai" if model_id.startswith("gpt-") else "gemini"
+    preset = repr(audio_encoder.get_preset(provider, mode))
+    return llm_response_cache.make_key(
+        track_id, start_sec, end_sec, preset, prompt, mode, model_id, thinking_budget, bpm, chords,
+    )
+
+
+async def _cached_analysis(cache_key: Optional[str]) -> Optional[dict]:
+    """Cached entry for the key with its session copied under a new sessionId, or None on a miss."""
+    if not cache_key:
+        return None
+    cached = llm_response_cache.get(cache_key)
+    if cached is None:
+        return None
+    session_id = await run_in_threadpool(_copy_session, cached["session"])
+    return dict(cached, sessionId=session_id)
+
+
+def _cache_reply(
+    cache_key: str,
+    prepared: dict,
+    session_id: str,
+    raw_advice: str,
+    clean_advice: str,
+    midi_filename: Optional[str],
+) -> None:
+    """Store a fresh reply with its MIDI file, the analysis results and a snapshot of the new session."""
+    session = session_store.get_session(session_id)
+    if session is None:
+        return
+    midi_path = os.path.join(MIDI_OUTPUT_DIR, midi_filename) if midi_filename else None
+    llm_response_cache.put(cache_key, raw_advice, clean_advice, midi_filename, midi_path, prepared, session)
+
+
+def _copy_session(session: dict) -> str:
+    """Save a copy of a session record under a new ID and return it."""
+    session_id = str(uuid.uuid4())
+    session_store.save_session(session_id, session)
+    return session_id
+
+
+def _fork_session(session_id: str) -> str:
+    """Copy a session under a new ID so another client can continue it independently."""
+    session = session_store.get_session(session_id)
+    if session is None:
+        return session_id
+    return _copy_session(session)
+
+
+@app.post("/api/analyze")
+async def analyze(
+    file: Optional[UploadFile] = File(None),
+    trackId: Optional[str] = Form(None),
+    startSec: float = Form(...),
+    endSec: float = Form(...),
+    prompt: str = Form(...),
+    modelId: str = Form(...),
+    temperature: float = Form(0.2),
+    thinkingBudget: int = Form(0),
+    mode: str = Form("engineer"),
+    bpm: Optional[float] = Form(None),  # User-edited BPM from frontend
+    chords: Optional[str] = Form(None),  # User-edited chords JSON from frontend
+    includeImage: bool = Form(True),  # The PNG is always sent to the model; this only controls the response
+):
+    """
+    Trims audio, generates spectrogram, starts Chat Session with Gemini or OpenAI.
+    Returns initial advice + session ID.
+    """
+    track_id, original_path = await _resolve_source(file, trackId)
+    cache_key = _llm_cache_key(
+        track_id, startSec, endSec, prompt, mode, modelId, float(temperature), thinkingBudget, bpm, chords,
+    )
+    cached = await _cached_analysis(cache_key)
+    if cached is not None:
+        # Served without decoding, DSP, upload or a provider call
+        return {
+            "sessionId": cached["sessionId"],
+            "trackId": track_id,
+            "advice": cached["advice"],
+            "spectrogramPngBase64": base64.b64encode(cached["spectrogramPng"]).decode("utf-8") if includeImage else None,
+            "midiDownloadUrl": f"/static/midi/{cached['midiFilename']}" if cached["midiFilename"] else None,
+            "bpm": cached["bpm"],
+            "chords": cached["chords"],
+            "cacheStatus": "hit",
+        }
+
+    prepared = await _prepare_analysis(track_id, original_path, startSec, endSec, prompt, mode, bpm, chords, modelId)
+    spec_png = prepared["spectrogramPng"]
+
+    async def start():
+        return await _start_analysis_session(prepared, modelId, float(temperature), thinkingBudget, mode, cache_key)
+
+    try:
+        if float(temperature) == 0:
+            # Deterministic settings: identical concurrent requests share one LLM call
+            key = singleflight.make_key("llm", {
+                "track": prepared["trackId"], "start": startSec, "end": endSec, "mode": mode,
+                "model": modelId, "thinkingBudget": thinkingBudget, "prompt": prepared["prompt"],
+            })
+            (session_id, clean_advice, midi_filename, cache_status), shared = await singleflight.do(key, start)
+            if shared:
+                # Follow-ups must not interleave with the leader's conversation
+                session_id = await run_in_threadpool(_fork_session, session_id)
+        else:
+            session_id, clean_advice, midi_filename, cache_status = await start()
+    finally:
+        _release_audio(prepared["audioPath"])
     midi_url = f"/static/midi/{midi_filename}" if midi_filename else None
 
     return {
         "sessionId": session_id,
+        "trackId": prepared["trackId"],
         "advice": clean_advice,
-        "spectrogramPngBase64": base64.b64encode(spec_png).decode("utf-8"),
+        "spectrogramPngBase64": base64.b64encode(spec_png).decode("utf-8") if includeImage else None,
         "midiDownloadUrl": midi_url,
-        "bpm": final_bpm,
-        "chords": final_chords,
+        "bpm": prepared["bpm"],
+        "chords": prepared["chords"],
+        "cacheStatus": cache_status,
     }
 
 
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _relay_tokens(chunks, parts: list):
+    """
+    Relay provider text chunks as "token" events, collecting the text into parts.
+    """
+    async for text in chunks:
+        parts.append(text)
+        yield _sse("token", {"text": text})
+
+
+async def _cached_events(cached: dict, track_id: str, include_image: bool):
+    """The /api/analyze/stream events for a response cache hit."""
+    png = cached["spectrogramPng"]
+    yield _sse("preamble", {
+        "trackId": track_id,
+        "spectrogramPngBase64": base64.b64encode(png).decode("utf-8") if include_image else None,
+        "bpm": cached["bpm"],
+        "chords": cached["chords"],
+    })
+    yield _sse("token", {"text": cached["advice"]})
+    yield _sse("done", {
+        "sessionId": cached["sessionId"],
+        "advice": cached["advice"],
+        "midiDownloadUrl": f"/static/midi/{cached['midiFilename']}" if cached["midiFilename"] else None,
+        "cacheStatus": "hit",
+    })
+
+
+@app.post("/api/analyze/stream")
+async def analyze_stream(
+    file: Optional[UploadFile] = File(None),
+    trackId: Optional[str] = Form(None),
+    startSec: float = Form(...),
+    endSec: float = Form(...),
+    prompt: str = Form(...),
+    modelId: str = Form(...),
+    temperature: float = Form(0.2),
+    thinkingBudget: int = Form(0),
+    mode: str = Form("engineer"),
+    bpm: Optional[float] = Form(None),
+    chords: Optional[str] = Form(None),
+    includeImage: bool = Form(True),
+):
+    """
+    Streaming /api/analyze over server-sent events:
+
+        preamble  {trackId, spectrogramPngBase64, bpm, chords}  before the model is called
+        token     {text}                                        model output as it arrives
+        done      {sessionId, advice, midiDownloadUrl,          cleaned advice + MIDI link
+                   cacheStatus}
+        error     {detail}                                      provider failure mid-stream
+
+    Local analysis errors are still returned as plain HTTP errors before the stream starts.
+    A response cache hit arrives as a single token with the whole advice.
+    """
+    track_id, original_path = await _resolve_source(file, trackId)
+    cache_key = _llm_cache_key(
+        track_id, startSec, endSec, prompt, mode, modelId, float(temperature), thinkingBudget, bpm, chords,
+    )
+    cached = await _cached_analysis(cache_key)
+    if cached is not None:
+        return _sse_response(_cached_events(cached, track_id, includeImage))
+
+    prepared = await _prepare_analysis(track_id, original_path, startSec, endSec, prompt, mode, bpm, chords, modelId)
+    spec_png = prepared["spectrogramPng"]
+
+    async def events():
+        # The encoded region is released however the stream ends
+        try:
+            yield _sse("preamble", {
+                "trackId": prepared["trackId"],
+                "spectrogramPngBase64": base64.b64encode(spec_png).decode("utf-8") if includeImage else None,
+                "bpm": prepared["bpm"],
+                "chords": prepared["chords"],
+            })
+            try:
+                if modelId.startswith("gpt-"):
+                    session_id, chunks = await openai_stream_session(
+                        audio_path=prepared["audioPath"],
+                        spectrogram_png_bytes=spec_png,
+                        user_prompt=prepared["prompt"],
+                        model_id=modelId,
+                        temperature=float(temperature),
+                        mode=mode,
+                    )
+                else:
+                    session_id, chunks = await gemini_stream_session(
+                        audio_path=prepared["audioPath"],
+                        spectrogram_png_bytes=spec_png,
+                        user_prompt=prepared["prompt"],
+                        model_id=modelId,
+                        temperature=float(temperature),
+                        thinking_budget=thinkingBudget,
+                        mode=mode,
+                        uploaded_audio=await asyncio.shield(prepared["uploadTask"]),
+                    )
+                parts = []
+                async for event in _relay_tokens(chunks, parts):
+                    yield event
+            except Exception as e:
+                print(f"Streaming analysis failed: {e}")
+                yield _sse("error", {"detail": str(e)})
+                return
+
+            # MIDI is extracted from the assembled text, so its link arrives last
+            advice = "".join(parts)
+            clean_advice, midi_filename = await run_in_threadpool(extract_and_generate_midi, advice, MIDI_OUTPUT_DIR)
+            if cache_key:
+                await run_in_threadpool(_cache_reply, cache_key, prepared, session_id, advice, clean_advice, midi_filename)
+            yield _sse("done", {
+                "sessionId": session_id,
+                "advice": clean_advice,
+                "midiDownloadUrl": f"/static/midi/{midi_filename}" if midi_filename else None,
+                "cacheStatus": "miss" if cache_key else "bypass",
+            })
+        finally:
+            _release_audio(prepared["audioPath"])
+
+    return _sse_response(events())
+
+
+async def _load_session(session_id: str) -> dict:
+    """Session record for a follow-up, or 404 once it expired or was evicted."""
+    session = await run_in_threadpool(session_store.get_session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return session
+
+
 @app.post("/api/chat")
-def chat_reply(
+async def chat_reply(
     sessionId: str = Form(...),
     message: str = Form(...),
 ):
     """
     Send a follow-up message to an active session.
     """
-    provider = _session_providers.get(sessionId, "gemini")
-    if provider == "openai":
-        reply = openai_send_message(sessionId, message)
+    session = await _load_session(sessionId)
+    if session["provider"] == "openai":
+        reply = await openai_send_message(sessionId, message, session=session)
     else:
-        reply = gemini_send_message(sessionId, message)
+        reply = await gemini_send_message(sessionId, message, session=session)
 
     # Process MIDI data from response
-    clean_reply, midi_filename = extract_and_generate_midi(reply, MIDI_OUTPUT_DIR)
+    clean_reply, midi_filename = await run_in_threadpool(extract_and_generate_midi, reply, MIDI_OUTPUT_DIR)
     midi_url = f"/static/midi/{midi_filename}" if midi_filename else None
 
     return {
@@ -197,3 +887,34 @@ def chat_reply(
         "midiDownloadUrl": midi_url,
     }
 
+
+@app.post("/api/chat/stream")
+async def chat_reply_stream(
+    sessionId: str = Form(...),
+    message: str = Form(...),
+):
+    """
+    Streaming /api/chat: "token" events as the reply arrives, then
+    "done" {reply, midiDownloadUrl}, or "error" {detail}.
+    """
+    # Checked before the stream opens so a stale session is a plain 404
+    session = await _load_session(sessionId)
+    stream_message = openai_stream_message if session["provider"] == "openai" else gemini_stream_message
+
+    async def events():
+        parts = []
+        try:
+            async for event in _relay_tokens(stream_message(sessionId, message, session=session), parts):
+                yield event
+        except Exception as e:
+            print(f"Streaming chat reply failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+            return
+
+        clean_reply, midi_filename = await run_in_threadpool(extract_and_generate_midi, "".join(parts), MIDI_OUTPUT_DIR)
+        yield _sse("done", {
+            "reply": clean_reply,
+            "midiDownloadUrl": f"/static/midi/{midi_filename}" if midi_filename else None,
+        })
+
+    return _sse_response(events())
@@ -0,0 +1,189 @@
+"""
+Per-provider encoding of the audio sent to the LLM.
+
+The trimmed region is decoded at the source's rate and channel count, which
+makes a 2-minute 48 kHz stereo WAV about 23 MB (30 MB once base64'd for
+OpenAI). Neither provider needs that:
+
+    Gemini: downmixes to one channel and resamples to 16 kHz on ingest, so a
+            16 kHz mono FLAC carries everything the model actually hears.
+    OpenAI: input_audio accepts only WAV and MP3; a 24 kHz mono WAV keeps the
+            full speech/music band the audio models are trained on.
+
+Presets are chosen per provider and mode and can be overridden with
+AUDIO_PRESET_<PROVIDER>_<MODE> (e.g. AUDIO_PRESET_OPENAI_PRODUCER=mp3:24000:1:96k),
+or set to "original" to send the decoded region unchanged.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+from dotenv import load_dotenv
+from pydub import AudioSegment
+
+from audio_processor import AudioBuffer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AudioPreset:
+    """Target encoding: container/codec, sample rate (None = keep), channels (None = keep), MP3 bitrate."""
+    fmt: str
+    sr: Optional[int] = None
+    channels: Optional[int] = None
+    bitrate: Optional[str] = None
+
+
+@dataclass
+class EncodedAudio:
+    path: str
+    fmt: str
+    mime_type: str
+    bytes: int
+    original_bytes: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.original_bytes - self.bytes)
+
+
+_MIME_TYPES = {"wav": "audio/wav", "flac": "audio/flac", "mp3": "audio/mpeg"}
+
+# Formats each provider accepts for inline/uploaded audio
+PROVIDER_FORMATS = {
+    "gemini": ("wav", "flac", "mp3"),
+    "openai": ("wav", "mp3"),
+}
+
+DEFAULT_PRESETS: Dict[str, Dict[str, AudioPreset]] = {
+    "gemini": {
+        "engineer": AudioPreset("flac", 16000, 1),
+        "producer": AudioPreset("flac", 16000, 1),
+    },
+    "openai": {
+        "engineer": AudioPreset("wav", 24000, 1),
+        "producer": AudioPreset("mp3", 24000, 1, "96k"),
+    },
+}
+
+_stats_lock = threading.Lock()
+_stats = {"encoded": 0, "originalBytes": 0, "sentBytes": 0}
+
+
+def parse_preset(spec: str) -> Optional[AudioPreset]:
+    """
+    Parse "fmt[:sr[:channels[:bitrate]]]"; "original" means no re-encoding.
+    Empty fields keep the source value, e.g. "flac::2".
+    """
+    spec = spec.strip().lower()
+    if not spec or spec == "original":
+        return None
+    parts = spec.split(":") + [""] * 3
+    fmt, sr, channels, bitrate = parts[:4]
+    return AudioPreset(
+        fmt=fmt,
+        sr=int(sr) if sr else None,
+        channels=int(channels) if channels else None,
+        bitrate=bitrate or None,
+    )
+
+
+def get_preset(provider: str, mode: str) -> Optional[AudioPreset]:
+    """Preset for a provider/mode, honouring AUDIO_PRESET_<PROVIDER>_<MODE>."""
+    override = (os.getenv(f"AUDIO_PRESET_{provider.upper()}_{mode.upper()}") or "").strip()
+    # Empty (as shipped in .env.example) keeps the default; "original" disables encoding
+    if override:
+        preset = parse_preset(override)
+    else:
+        preset = DEFAULT_PRESETS.get(provider, {}).get(mode) or DEFAULT_PRESETS.get(provider, {}).get("engineer")
+
+    if preset is not None and preset.fmt not in PROVIDER_FORMATS.get(provider, ()):
+        logger.warning("Audio preset format '%s' not accepted by %s; sending WAV", preset.fmt, provider)
+        preset = AudioPreset("wav", preset.sr, preset.channels)
+    return preset
+
+
+def _pcm16_wav_bytes(audio: AudioBuffer) -> int:
+    """Size of the region as a 16-bit WAV at its native rate and channel count."""
+    return audio.frames * audio.channels * 2 + 44
+
+
+def encode_for_provider(audio: AudioBuffer, provider: str, mode: str = "engineer") -> EncodedAudio:
+    """
+    Write the region in the cheapest format the provider accepts for this mode.
+
+    Args:
+        audio: Decoded region
+        provider: "gemini" or "openai"
+        mode: "engineer" or "producer"
+
+    Returns:
+        EncodedAudio with the temp file path and size accounting; the caller
+        deletes the file once the provider has the audio
+    """
+    preset = get_preset(provider, mode)
+    original_bytes = _pcm16_wav_bytes(audio)
+
+    if preset is None:
+        path = audio.export_temp("wav")
+        fmt = "wav"
+    else:
+        samples = audio.samples
+        if preset.channels == 1 and audio.channels > 1:
+            samples = audio.mono()[np.newaxis, :]
+        sr = audio.sr
+        if preset.sr and preset.sr < audio.sr:
+            samples = librosa.resample(samples, orig_sr=audio.sr, target_sr=preset.sr, res_type="soxr_hq", axis=-1)
+            sr = preset.sr
+        # Resampling can overshoot slightly; PCM_16 clips hard at full scale
+        samples = np.clip(samples, -1.0, 1.0)
+
+        fmt = preset.fmt
+        if fmt == "mp3":
+            path = _write_mp3(samples, sr, preset.bitrate or "128k")
+        else:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{fmt}") as tmp:
+                sf.write(tmp.name, samples.T, sr, format=fmt.upper(), subtype="PCM_16")
+                path = tmp.name
+
+    encoded = EncodedAudio(
+        path=path,
+        fmt=fmt,
+        mime_type=_MIME_TYPES[fmt],
+        bytes=os.path.getsize(path),
+        original_bytes=original_bytes,
+    )
+    with _stats_lock:
+        _stats["encoded"] += 1
+        _stats["originalBytes"] += encoded.original_bytes
+        _stats["sentBytes"] += encoded.bytes
+    logger.debug(
+        "Encoded %s/%s audio as %s: %.1f MB (saved %.1f MB vs 16-bit WAV)",
+        provider, mode, fmt, encoded.bytes / 1e6, encoded.bytes_saved / 1e6,
+    )
+    return encoded
+
+
+def _write_mp3(samples: np.ndarray, sr: int, bitrate: str) -> str:
+    """Encode through ffmpeg (pydub); libsndfile MP3 support is not guaranteed."""
+    pcm = (samples.T * 32767.0).astype("<i2").tobytes()
+    segment = AudioSegment(data=pcm, sample_width=2, frame_rate=sr, channels=samples.shape[0])
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
+        segment.export(tmp.name, format="mp3", bitrate=bitrate)
+        return tmp.name
+
+
+def stats() -> Dict[str, int]:
+    """Totals across all encoded payloads, including bytes saved."""
+    with _stats_lock:
+        return dict(_stats, bytesSaved=max(0, _stats["originalBytes"] - _stats["sentBytes"]))
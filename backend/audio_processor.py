@@ -1,14 +1,19 @@
-import io
+import json
 import os
+import subprocess
 import tempfile
-from typing import Tuple
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Tuple
 
 import librosa
-import librosa.display
-import matplotlib.pyplot as plt
 import numpy as np
+import soundfile as sf
 from dotenv import load_dotenv
 from pydub import AudioSegment
+from pydub.utils import get_prober_name
+
+import pcm_cache
+from spectrogram_renderer import render_spectrogram_png
 
 # Load environment variables and configure FFmpeg path for pydub
 load_dotenv()
@@ -19,62 +24,312 @@ if _ffmpeg_path and os.path.isdir(_ffmpeg_path):
     AudioSegment.converter = os.path.join(_ffmpeg_path, "ffmpeg.exe")
     AudioSegment.ffprobe = os.path.join(_ffmpeg_path, "ffprobe.exe")
 
+# Containers libsndfile can seek frame-accurately; everything else goes through ffmpeg
+_SNDFILE_EXTENSIONS = {".wav", ".flac", ".aif", ".aiff", ".ogg"}
 
-def trim_audio_to_temp(
+# Extra audio decoded before the region start so codec priming settles (ffmpeg path only)
+DECODE_PAD_SEC = float(os.getenv("DECODE_PAD_SEC") or "0.5")
+
+
+@dataclass
+class AudioBuffer:
+    """
+    Decoded PCM shared by every analysis stage of a request.
+
+    samples: float32 array shaped (channels, frames), values in [-1, 1]
+             (may be a read-only memmap view for cached long recordings)
+    sr: sample rate in Hz
+    """
+    samples: np.ndarray
+    sr: int
+    _mono: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def frames(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def duration(self) -> float:
+        return self.frames / float(self.sr)
+
+    def mono(self) -> np.ndarray:
+        """Channel-averaged signal (same downmix as ``librosa.load(mono=True)``), computed once."""
+        if self._mono is None:
+            if self.channels == 1:
+                self._mono = np.ascontiguousarray(self.samples[0])
+            else:
+                self._mono = self.samples.mean(axis=0, dtype=np.float32)
+        return self._mono
+
+    def export_temp(self, export_format: str = "wav") -> str:
+        """
+        Write the buffer to a 16-bit temp file.
+        Only for stages that hand audio to an external tool or API.
+        """
+        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{export_format}") as tmp:
+            sf.write(tmp.name, self.samples.T, self.sr, format=export_format.upper(), subtype="PCM_16")
+            return tmp.name
+
+
+def _ffprobe_bin() -> str:
+    return getattr(AudioSegment, "ffprobe", None) or get_prober_name()
+
+
+def probe_audio(audio_path: str) -> Tuple[int, int, float]:
+    """
+    Read stream parameters without decoding.
+
+    Returns:
+        Tuple of (sample_rate, channels, duration_sec)
+    """
+    if os.path.splitext(audio_path)[1].lower() in _SNDFILE_EXTENSIONS:
+        try:
+            info = sf.info(audio_path)
+            return info.samplerate, info.channels, info.frames / float(info.samplerate)
+        except RuntimeError:
+            pass  # Unsupported subtype, let ffprobe handle it
+
+    cmd = [
+        _ffprobe_bin(),
+        "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate,channels:format=duration",
+        "-of", "json",
+        audio_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    info = json.loads(result.stdout)
+    stream = info["streams"][0]
+    return int(stream["sample_rate"]), int(stream["channels"]), float(info["format"]["duration"])
+
+
+def _read_range_sndfile(audio_path: str, start_frame: int, frames: int) -> AudioBuffer:
+    """Frame-accurate read of a window from WAV/FLAC/AIFF/OGG."""
+    with sf.SoundFile(audio_path) as f:
+        f.seek(start_frame)
+        data = f.read(frames, dtype="float32", always_2d=True)
+        return AudioBuffer(samples=np.ascontiguousarray(data.T), sr=f.samplerate)
+
+
+def _read_range_ffmpeg(
+    audio_path: str,
+    start_frame: int,
+    frames: int,
+    sr: int,
+    channels: int,
+) -> AudioBuffer:
+    """
+    Decode a window with an ffmpeg input seek, so only the region (plus a
+    small pre-roll pad) is decoded. The pad is dropped sample-accurately.
+    """
+    start_sec = start_frame / float(sr)
+    pad_sec = min(DECODE_PAD_SEC, start_sec)
+    window_sec = frames / float(sr) + 2 * DECODE_PAD_SEC
+
+    cmd = [
+        AudioSegment.converter,
+        "-v", "error",
+        "-ss", f"{start_sec - pad_sec:.6f}",
+        "-i", audio_path,
+        "-t", f"{window_sec + pad_sec:.6f}",
+        "-vn",
+        "-f", "f32le",
+        "-acodec", "pcm_f32le",
+        "-ac", str(channels),
+        "-ar", str(sr),
+        "-",
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+
+    samples = np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, channels)
+    skip = int(round(pad_sec * sr))
+    samples = samples[skip:skip + frames]
+    return AudioBuffer(samples=np.ascontiguousarray(samples.T), sr=sr)
+
+
+def decode_frames(
+    audio_path: str,
+    start_frame: int,
+    frames: int,
+    sr: int,
+    channels: int,
+    duration_sec: float,
+) -> AudioBuffer:
+    """
+    Decode ``frames`` sample frames starting at ``start_frame``.
+
+    Stream parameters come from ``probe_audio`` so callers reading many
+    windows of the same file only probe once.
+    """
+    if duration_sec >= pcm_cache.PCM_CACHE_MIN_SEC:
+        try:
+            samples, cached_sr = pcm_cache.read_region(audio_path, start_frame, frames, sr, channels)
+            return AudioBuffer(samples=samples, sr=cached_sr)
+        except Exception as e:
+            print(f"PCM cache unavailable, falling back to ranged decode: {e}")
+
+    if os.path.splitext(audio_path)[1].lower() in _SNDFILE_EXTENSIONS:
+        try:
+            return _read_range_sndfile(audio_path, start_frame, frames)
+        except RuntimeError:
+            pass
+
+    return _read_range_ffmpeg(audio_path, start_frame, frames, sr, channels)
+
+
+def _stream_ffmpeg(audio_path: str, sr: int, channels: int, block_frames: int) -> Iterator[AudioBuffer]:
+    """One ffmpeg decode of the whole file, read from its stdout in fixed-size blocks."""
+    cmd = [
+        AudioSegment.converter,
+        "-v", "error",
+        "-i", audio_path,
+        "-vn",
+        "-f", "f32le",
+        "-acodec", "pcm_f32le",
+        "-ac", str(channels),
+        "-ar", str(sr),
+        "-",
+    ]
+    block_bytes = block_frames * channels * 4
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            chunk = proc.stdout.read(block_bytes)
+            # Drop a trailing partial sample frame
+            chunk = chunk[:len(chunk) - len(chunk) % (channels * 4)]
+            if not chunk:
+                break
+            samples = np.frombuffer(chunk, dtype=np.float32).reshape(-1, channels)
+            yield AudioBuffer(samples=np.ascontiguousarray(samples.T), sr=sr)
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {stderr.decode(errors='replace')}")
+    finally:
+        # The consumer may stop early
+        if proc.poll() is None:
+            proc.kill()
+            proc.communicate()
+
+
+def stream_frames(
+    audio_path: str,
+    sr: int,
+    channels: int,
+    duration_sec: float,
+    block_frames: int,
+) -> Iterator[AudioBuffer]:
+    """
+    Decode a whole file front to back in blocks of ``block_frames`` sample
+    frames (the last block may be shorter).
+
+    Unlike repeated ``decode_frames`` calls this is a single sequential
+    decode: one ffmpeg process for compressed formats, a plain sequential read
+    for libsndfile formats, memmap slices for sources in the PCM cache.
+    Stream parameters come from ``probe_audio``.
+    """
+    if duration_sec >= pcm_cache.PCM_CACHE_MIN_SEC:
+        try:
+            mm, cached_sr = pcm_cache.open_pcm(audio_path, sr, channels)
+        except Exception as e:
+            print(f"PCM cache unavailable, falling back to streaming decode: {e}")
+        else:
+            for start in range(0, mm.shape[0], block_frames):
+                yield AudioBuffer(samples=pcm_cache.to_float32(mm[start:start + block_frames]), sr=cached_sr)
+            return
+
+    if os.path.splitext(audio_path)[1].lower() in _SNDFILE_EXTENSIONS:
+        try:
+            f = sf.SoundFile(audio_path)
+        except RuntimeError:
+            f = None
+        if f is not None:
+            with f:
+                for block in f.blocks(blocksize=block_frames, dtype="float32", always_2d=True):
+                    yield AudioBuffer(samples=np.ascontiguousarray(block.T), sr=f.samplerate)
+            return
+
+    yield from _stream_ffmpeg(audio_path, sr, channels, block_frames)
+
+
+def decode_audio(
     audio_path: str,
     start_sec: float,
     end_sec: float,
-    export_format: str = "wav",
-) -> str:
+) -> AudioBuffer:
     """
-    Trim an audio file to [start_sec, end_sec] and export to a temp file.
+    Decode [start_sec, end_sec] of an audio file into memory.
+
+    Only the requested window is decoded (seek-based), so memory and latency
+    scale with the region length rather than the file length. Very long
+    sources are decoded once into the PCM cache and sliced via memmap.
 
     Returns:
-        path to trimmed file
+        AudioBuffer with the region's samples
     """
-    audio = AudioSegment.from_file(audio_path)
+    sr, channels, duration_sec = probe_audio(audio_path)
 
-    duration_sec = len(audio) / 1000.0
     start_sec = max(0.0, float(start_sec))
     end_sec = min(duration_sec, float(end_sec))
 
     if end_sec <= start_sec:
         end_sec = min(duration_sec, start_sec + 0.1)
 
-    start_ms = int(start_sec * 1000)
-    end_ms = int(end_sec * 1000)
-
-    trimmed = audio[start_ms:end_ms]
+    start_frame = int(start_sec * sr)
+    frames = max(0, int(end_sec * sr) - start_frame)
 
-    suffix = f".{export_format}"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        trimmed.export(tmp.name, format=export_format)
-        return tmp.name
+    return decode_frames(audio_path, start_frame, frames, sr, channels, duration_sec)
 
 
-def generate_mel_spectrogram_png(
+def trim_audio_to_temp(
     audio_path: str,
+    start_sec: float,
+    end_sec: float,
+    export_format: str = "wav",
+) -> str:
+    """
+    Trim an audio file to [start_sec, end_sec] and export to a temp file.
+
+    Returns:
+        path to trimmed file
+    """
+    return decode_audio(audio_path, start_sec, end_sec).export_temp(export_format)
+
+
+# melspectrogram's default STFT hop
+MEL_HOP_LENGTH = 512
+
+
+def compute_mel_db(
+    audio: AudioBuffer,
     n_mels: int = 128,
     fmax: int = 16000,
-) -> bytes:
+) -> np.ndarray:
     """
-    Generate Mel spectrogram (PNG bytes).
+    Mel spectrogram in dB relative to the region's peak.
+
+    Returns:
+        (n_mels, frames) float32 matrix
     """
-    y, sr = librosa.load(audio_path, sr=None, mono=True)
+    y, sr = audio.mono(), audio.sr
     if y.size == 0:
         raise ValueError("Audio appears to be empty.")
 
-    S = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=n_mels, fmax=fmax)
-    S_dB = librosa.power_to_db(S, ref=np.max)
+    S = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=n_mels, fmax=fmax, hop_length=MEL_HOP_LENGTH)
+    return librosa.power_to_db(S, ref=np.max)
 
-    plt.figure(figsize=(10, 4))
-    librosa.display.specshow(S_dB, x_axis="time", y_axis="mel", sr=sr, fmax=fmax)
-    plt.colorbar(format="%+2.0f dB")
-    plt.title("Mel-frequency spectrogram")
-    plt.tight_layout()
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=160)
-    buf.seek(0)
-    plt.close()
-    return buf.getvalue()
+def generate_mel_spectrogram_png(
+    audio: AudioBuffer,
+    n_mels: int = 128,
+    fmax: int = 16000,
+    overlays: bool = True,
+) -> bytes:
+    """
+    Generate Mel spectrogram (PNG bytes).
+    """
+    S_dB = compute_mel_db(audio, n_mels=n_mels, fmax=fmax)
+    return render_spectrogram_png(S_dB, audio.sr, hop_length=MEL_HOP_LENGTH, fmax=fmax, overlays=overlays)
@@ -0,0 +1,95 @@
+"""
+Benchmark the NumPy chord engine against Chordino.
+
+Usage:
+    python bench_chords.py song1.wav song2.mp3 ...
+
+For every file both engines run on the same decoded audio. Accuracy is the
+share of time (on a 0.1 s grid) where the NumPy label matches Chordino's label
+reduced to major/minor triads (e.g. "Am7" -> "Am", "Bb/D" -> "Bb").
+Chordino's output is the reference; requires SONIC_ANNOTATOR_EXE and VAMP_PATH.
+"""
+
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import chord_engine
+import chordino
+from audio_processor import decode_audio, probe_audio
+
+_GRID_SEC = 0.1
+_ENHARMONIC = {"Db": "C#", "D#": "Eb", "Gb": "F#", "G#": "Ab", "A#": "Bb"}
+
+
+def reduce_to_majmin(label: str) -> str:
+    """Map a Chordino label to the triad vocabulary of chord_engine."""
+    if not label or label in ("N", "X"):
+        return "N"
+    label = label.split("/")[0]
+    root = label[:2] if len(label) > 1 and label[1] in "#b" else label[:1]
+    quality = label[len(root):]
+    root = _ENHARMONIC.get(root, root)
+    is_minor = quality.startswith("m") and not quality.startswith("maj")
+    return root + ("m" if is_minor else "")
+
+
+def to_grid(chords: List[Dict], duration: float, reduce: bool) -> np.ndarray:
+    grid = np.full(int(np.ceil(duration / _GRID_SEC)), "N", dtype=object)
+    for c in chords:
+        label = reduce_to_majmin(c["chord"]) if reduce else c["chord"]
+        i0 = int(c["time"] / _GRID_SEC)
+        i1 = int((c["time"] + c["duration"]) / _GRID_SEC)
+        grid[i0:i1] = label
+    return grid
+
+
+def benchmark(path: str) -> Dict:
+    _, _, duration = probe_audio(path)
+    audio = decode_audio(path, 0.0, duration)
+
+    t0 = time.perf_counter()
+    reference = chordino.extract_chords(audio)
+    chordino_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    candidate = chord_engine.extract_chords(audio)
+    numpy_sec = time.perf_counter() - t0
+
+    ref_grid = to_grid(reference, audio.duration, reduce=True)
+    cand_grid = to_grid(candidate, audio.duration, reduce=False)
+    n = min(ref_grid.size, cand_grid.size)
+    accuracy = float(np.mean(ref_grid[:n] == cand_grid[:n])) if n else 0.0
+
+    return {
+        "file": path,
+        "duration": audio.duration,
+        "chordinoSec": chordino_sec,
+        "numpySec": numpy_sec,
+        "accuracy": accuracy,
+    }
+
+
+def main(paths: List[str]) -> None:
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+
+    rows = [benchmark(p) for p in paths]
+    print(f"{'file':40} {'dur(s)':>8} {'chordino(s)':>12} {'numpy(s)':>9} {'speedup':>8} {'accuracy':>9}")
+    for r in rows:
+        speedup = r["chordinoSec"] / r["numpySec"] if r["numpySec"] > 0 else float("inf")
+        print(
+            f"{r['file'][-40:]:40} {r['duration']:8.1f} {r['chordinoSec']:12.2f} "
+            f"{r['numpySec']:9.2f} {speedup:7.1f}x {r['accuracy']:9.1%}"
+        )
+
+    total = sum(r["duration"] for r in rows)
+    weighted = sum(r["accuracy"] * r["duration"] for r in rows) / total if total else 0.0
+    print(f"\nDuration-weighted accuracy vs Chordino (maj/min): {weighted:.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
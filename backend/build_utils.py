@@ -0,0 +1,44 @@
+"""
+Helpers shared by the on-disk caches built from a stored track (PCM cache,
+waveform peaks, spectrogram pyramid, feature store).
+
+Each build runs at most once per key at a time: other callers wait on the same
+lock and then read the finished result. A build writes its data files first
+and its JSON metadata last, so the metadata file's presence marks a complete
+build and an interrupted one is simply redone.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Tuple
+
+_build_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def lock_for(kind: str, key: str) -> threading.Lock:
+    """
+    Build lock for one cache entry.
+
+    Args:
+        kind: Cache the entry belongs to ("peaks", "pyramid", ...), so builds
+            of different caches for the same track don't block each other
+        key: Track ID or cache key
+    """
+    with _build_locks_guard:
+        return _build_locks.setdefault((kind, key), threading.Lock())
+
+
+def write_meta(meta_path: str, meta: Dict) -> None:
+    """Write a build's metadata; call it after every data file is in place."""
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def read_meta(meta_path: str) -> Dict:
+    """Metadata of a completed build."""
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,175 @@
+"""
+History compaction for OpenAI chat sessions.
+
+Chat Completions is stateless, so every follow-up resends the whole message
+list, including the base64 input_audio of the first turn. Left alone, each
+follow-up re-uploads the clip and the prompt grows with every exchange.
+
+Strategies (OPENAI_HISTORY_STRATEGY), each including the ones before it:
+    full:       resend everything (the original behaviour)
+    drop_audio: after the first reply, replace the audio with a short text note;
+                the reply itself already describes what the model heard
+    budget:     keep the history under OPENAI_HISTORY_MAX_TOKENS by dropping the
+                oldest follow-up exchanges (default)
+    summarize:  like budget, but dropped exchanges are folded into a running
+                summary by OPENAI_SUMMARY_MODEL instead of being forgotten
+
+The system prompt, the first user turn and the first reply (the analysis) are
+always kept. When trimming, the history is cut to half the budget so the
+summary call runs every few turns rather than on every one.
+"""
+
+import os
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_STRATEGIES = ("full", "drop_audio", "budget", "summarize")
+
+OPENAI_HISTORY_STRATEGY = (os.getenv("OPENAI_HISTORY_STRATEGY") or "budget").strip().lower()
+OPENAI_HISTORY_MAX_TOKENS = int(os.getenv("OPENAI_HISTORY_MAX_TOKENS") or "8000")
+
+if OPENAI_HISTORY_STRATEGY not in _STRATEGIES:
+    print(f"Unknown OPENAI_HISTORY_STRATEGY '{OPENAI_HISTORY_STRATEGY}', using budget")
+    OPENAI_HISTORY_STRATEGY = "budget"
+
+# system prompt, first user turn (audio + prompt), first reply
+_ANCHOR_MESSAGES = 3
+# Rough English average for OpenAI tokenizers; only used for budgeting
+_CHARS_PER_TOKEN = 4
+
+_stats_lock = threading.Lock()
+_stats = {"audioDropped": 0, "turnsDropped": 0, "summaries": 0, "summaryFailures": 0}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _level(strategy: str) -> int:
+    return _STRATEGIES.index(strategy)
+
+
+def estimate_tokens(message: Dict) -> int:
+    """Approximate token count of one message; audio parts count by their base64 size."""
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return len(content) // _CHARS_PER_TOKEN + 4
+    chars = 0
+    for part in content:
+        if part.get("type") == "text":
+            chars += len(part.get("text", ""))
+        elif part.get("type") == "input_audio":
+            chars += len(part["input_audio"].get("data", ""))
+    return chars // _CHARS_PER_TOKEN + 4
+
+
+def _summary_message(summary: str) -> Dict:
+    return {"role": "system", "content": f"Summary of the earlier follow-up conversation:\n{summary}"}
+
+
+def request_messages(session: Dict) -> List[Dict]:
+    """Messages to send for the next turn: the stored history with its running summary."""
+    messages = session["messages"]
+    summary = session.get("summary")
+    if not summary:
+        return list(messages)
+    return messages[:_ANCHOR_MESSAGES] + [_summary_message(summary)] + messages[_ANCHOR_MESSAGES:]
+
+
+def drop_audio(messages: List[Dict]) -> bool:
+    """Replace input_audio parts with a text note. Returns True if anything changed."""
+    changed = False
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for i, part in enumerate(content):
+            if part.get("type") != "input_audio":
+                continue
+            audio = part["input_audio"]
+            size_kb = len(audio.get("data", "")) * 3 // 4 // 1024
+            content[i] = {
+                "type": "text",
+                "text": (
+                    f"[Audio clip ({audio.get('format', 'audio')}, {size_kb} KB) was analysed in "
+                    "your first reply; it is not resent with follow-up questions.]"
+                ),
+            }
+            changed = True
+    if changed:
+        _count("audioDropped")
+    return changed
+
+
+def _format_turns(turns: List[Dict]) -> str:
+    return "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in turns)
+
+
+async def compact(
+    session: Dict,
+    summarize: Optional[Callable[[str], Awaitable[str]]] = None,
+    strategy: Optional[str] = None,
+) -> Dict:
+    """
+    Compact a session's history in place after a completed turn.
+
+    Args:
+        session: Record with "messages" and optionally "summary"
+        summarize: async fn(text) -> summary, used by the summarize strategy
+        strategy: Overrides OPENAI_HISTORY_STRATEGY
+
+    Returns:
+        The same session record
+    """
+    level = _level(strategy or OPENAI_HISTORY_STRATEGY)
+    messages = session["messages"]
+    if level < _level("drop_audio") or len(messages) < _ANCHOR_MESSAGES:
+        return session
+
+    drop_audio(messages[:_ANCHOR_MESSAGES])
+    if level < _level("budget"):
+        return session
+
+    total = sum(estimate_tokens(m) for m in request_messages(session))
+    if total <= OPENAI_HISTORY_MAX_TOKENS:
+        return session
+
+    # Drop whole exchanges from the oldest end down to half the budget,
+    # always keeping the latest one
+    anchor, tail = messages[:_ANCHOR_MESSAGES], messages[_ANCHOR_MESSAGES:]
+    target = OPENAI_HISTORY_MAX_TOKENS // 2
+    cut = 0
+    while cut + 2 < len(tail) and total > target:
+        total -= estimate_tokens(tail[cut]) + estimate_tokens(tail[cut + 1])
+        cut += 2
+    if not cut:
+        return session
+
+    dropped = tail[:cut]
+    session["messages"] = anchor + tail[cut:]
+    _count("turnsDropped", cut // 2)
+
+    if level >= _level("summarize") and summarize is not None:
+        previous = session.get("summary")
+        text = _format_turns(dropped)
+        if previous:
+            text = f"Earlier summary:\n{previous}\n\nLater exchanges:\n{text}"
+        try:
+            session["summary"] = await summarize(text)
+            _count("summaries")
+        except Exception as e:
+            # Keep the previous summary; the dropped turns are simply forgotten
+            print(f"History summary failed: {e}")
+            _count("summaryFailures")
+    return session
+
+
+def stats() -> Dict:
+    """Compaction counters and the active strategy."""
+    with _stats_lock:
+        return dict(_stats, strategy=OPENAI_HISTORY_STRATEGY, maxTokens=OPENAI_HISTORY_MAX_TOKENS)
@@ -0,0 +1,190 @@
+"""
+In-process chord recognizer (NumPy), an alternative to Chordino.
+
+Computes a chromagram, scores every frame against major/minor triad templates
+plus a no-chord state, and decodes the most likely chord sequence with a
+vectorized Viterbi pass. Output uses the same schema as ``chordino.extract_chords``
+(``time``, ``duration``, ``chord``) so ``chords_to_beats`` consumes it unchanged.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import librosa
+import numpy as np
+
+from audio_processor import AudioBuffer
+
+# Analysis rate and frame size: chords change slowly, so a coarse grid is enough
+ENGINE_SR = 22050
+ENGINE_N_FFT = 8192
+ENGINE_HOP = 2048
+
+# Chordino-style root spellings
+PITCH_NAMES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+NO_CHORD = "N"
+
+# Emission sharpness and probability of staying on the same chord per frame
+_EMISSION_BETA = 12.0
+_SELF_TRANSITION = 0.92
+# Frames quieter than this (relative to the loudest frame) are treated as no-chord
+_SILENCE_DB = -45.0
+# Similarity the no-chord state scores on every frame
+_NO_CHORD_SCORE = 0.55
+
+
+def _build_templates() -> Tuple[np.ndarray, List[str]]:
+    """24 L2-normalised triad templates (12 major, 12 minor)."""
+    templates = []
+    labels = []
+    for quality, third in (("", 4), ("m", 3)):
+        for root in range(12):
+            t = np.zeros(12, dtype=np.float32)
+            t[[root, (root + third) % 12, (root + 7) % 12]] = 1.0
+            templates.append(t / np.linalg.norm(t))
+            labels.append(PITCH_NAMES[root] + quality)
+    return np.stack(templates), labels
+
+
+_TEMPLATES, _LABELS = _build_templates()
+_ALL_LABELS = _LABELS + [NO_CHORD]
+
+
+def _log_transitions(n_states: int) -> np.ndarray:
+    trans = np.full((n_states, n_states), (1.0 - _SELF_TRANSITION) / (n_states - 1), dtype=np.float64)
+    np.fill_diagonal(trans, _SELF_TRANSITION)
+    return np.log(trans)
+
+
+_LOG_TRANS = _log_transitions(len(_ALL_LABELS))
+
+
+def chroma_frames(y: np.ndarray, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Raw chromagram and frame RMS for a signal at ENGINE_SR.
+
+    Returns:
+        Tuple of (chroma shaped (12, frames), rms shaped (frames,))
+    """
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr, n_fft=ENGINE_N_FFT, hop_length=ENGINE_HOP, norm=None)
+    rms = librosa.feature.rms(y=y, frame_length=ENGINE_N_FFT, hop_length=ENGINE_HOP)[0]
+    n = min(chroma.shape[1], rms.size)
+    return chroma[:, :n], rms[:n]
+
+
+def emission_scores(chroma: np.ndarray, rms: np.ndarray) -> np.ndarray:
+    """
+    Log-emission scores shaped (n_states, frames).
+    """
+    norms = np.linalg.norm(chroma, axis=0)
+    chroma = chroma / np.maximum(norms, 1e-9)
+
+    similarity = _TEMPLATES @ chroma  # (24, frames)
+    no_chord = np.full((1, similarity.shape[1]), _NO_CHORD_SCORE, dtype=similarity.dtype)
+
+    # Silent frames carry no harmonic information
+    peak = float(rms.max()) if rms.size else 0.0
+    rms_db = librosa.amplitude_to_db(rms, ref=peak if peak > 0 else 1.0)
+    silent = rms_db < _SILENCE_DB
+    similarity[:, silent] = 0.0
+    no_chord[:, silent] = 1.0
+
+    scores = np.vstack([similarity, no_chord]) * _EMISSION_BETA
+    # Normalise per frame to log-probabilities
+    return scores - np.logaddexp.reduce(scores, axis=0, keepdims=True)
+
+
+def viterbi(log_emissions: np.ndarray, log_trans: np.ndarray) -> np.ndarray:
+    """
+    Most likely state path.
+
+    Args:
+        log_emissions: (n_states, frames) log-probabilities
+        log_trans: (n_states, n_states) log transition matrix, [from, to]
+
+    Returns:
+        State index per frame
+    """
+    n_states, frames = log_emissions.shape
+    if frames == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    backptr = np.empty((frames, n_states), dtype=np.int32)
+    delta = log_emissions[:, 0] - np.log(n_states)
+    for t in range(1, frames):
+        candidates = delta[:, None] + log_trans
+        backptr[t] = np.argmax(candidates, axis=0)
+        delta = candidates[backptr[t], np.arange(n_states)] + log_emissions[:, t]
+
+    path = np.empty(frames, dtype=np.int64)
+    path[-1] = int(np.argmax(delta))
+    for t in range(frames - 1, 0, -1):
+        path[t - 1] = backptr[t, path[t]]
+    return path
+
+
+def extract_chords(audio: AudioBuffer, wav_path: Optional[str] = None) -> List[Dict]:
+    """
+    Recognise the chord progression of decoded audio.
+
+    Args:
+        audio: Decoded audio region
+        wav_path: Unused; accepted for signature compatibility with Chordino
+
+    Returns:
+        List of chord dicts: [{"time": float, "duration": float, "chord": str}, ...]
+    """
+    y = audio.mono()
+    if y.size == 0:
+        return []
+
+    sr = audio.sr
+    if sr != ENGINE_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=ENGINE_SR)
+
+    chroma, rms = chroma_frames(y, ENGINE_SR)
+    times = np.arange(chroma.shape[1]) * (ENGINE_HOP / float(ENGINE_SR))
+    return decode_chords(chroma, rms, times, y.size / float(ENGINE_SR))
+
+
+def decode_chords(
+    chroma: np.ndarray,
+    rms: np.ndarray,
+    times: np.ndarray,
+    total_sec: float,
+) -> List[Dict]:
+    """
+    Viterbi-decode a chromagram into chord segments.
+
+    Args:
+        chroma: (12, frames) raw chromagram from ``chroma_frames``
+        rms: (frames,) frame RMS
+        times: (frames,) start time of every frame in seconds
+        total_sec: End time of the last frame's audio
+
+    Returns:
+        List of chord dicts: [{"time": float, "duration": float, "chord": str}, ...]
+    """
+    path = viterbi(emission_scores(chroma, rms), _LOG_TRANS)
+    if path.size == 0:
+        return []
+
+    # Collapse runs of the same state into segments
+    change = np.flatnonzero(np.diff(path)) + 1
+    starts = np.concatenate([[0], change])
+    ends = np.concatenate([change, [path.size]])
+
+    chords = []
+    for s, e in zip(starts, ends):
+        time = float(times[s])
+        end_time = float(times[e]) if e < times.size else total_sec
+        duration = min(end_time, total_sec) - time
+        chord = _ALL_LABELS[path[s]]
+        # Same rule as the Chordino CSV parser: drop very short no-chord gaps
+        if chord == NO_CHORD and duration < 0.5:
+            continue
+        chords.append({
+            "time": round(time, 3),
+            "duration": round(duration, 3),
+            "chord": chord,
+        })
+    return chords
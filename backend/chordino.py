@@ -3,15 +3,35 @@ Chordino chord extraction using Sonic Annotator with the NNLS Chroma VAMP plugin
 """
 
 import csv
+import io
 import os
+import queue
 import subprocess
-import tempfile
-from typing import List, Dict, Optional
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
+from audio_processor import AudioBuffer
+
 load_dotenv()
 
+# "chordino" (Sonic Annotator + NNLS Chroma) or "numpy" (in-process chord_engine)
+CHORD_ENGINE = (os.getenv("CHORD_ENGINE") or "chordino").lower()
+
+# Sonic Annotator processes allowed at once
+CHORDINO_MAX_PROCS = int(os.getenv("CHORDINO_MAX_PROCS") or "2")
+# Files passed to one invocation when requests queue up
+CHORDINO_BATCH_SIZE = int(os.getenv("CHORDINO_BATCH_SIZE") or "8")
+# How long a worker waits for more queued files before starting a batch
+CHORDINO_BATCH_WINDOW_SEC = float(os.getenv("CHORDINO_BATCH_WINDOW_SEC") or "0.05")
+# Timeout per file in a batch
+CHORDINO_TIMEOUT_SEC = float(os.getenv("CHORDINO_TIMEOUT_SEC") or "120")
+# Timeout for the full-track pass of the feature store
+CHORDINO_TRACK_TIMEOUT_SEC = float(os.getenv("CHORDINO_TRACK_TIMEOUT_SEC") or "3600")
+
 
 def get_sonic_annotator_path() -> str:
     """Get path to sonic-annotator executable from environment."""
@@ -35,74 +55,205 @@ def get_vamp_path() -> str:
     return path
 
 
-def extract_chords(audio_path: str) -> List[Dict]:
+def extract_chords(audio: AudioBuffer, wav_path: Optional[str] = None) -> List[Dict]:
     """
-    Extract chord progression from audio using Chordino VAMP plugin.
+    Extract chord progression from decoded audio using Chordino VAMP plugin,
+    or the in-process NumPy engine when CHORD_ENGINE=numpy.
+    
+    Sonic Annotator needs a file, so the buffer is written to a temp WAV
+    unless the caller already has one for the same audio.
     
     Args:
-        audio_path: Path to audio file (WAV recommended)
+        audio: Decoded audio region
+        wav_path: Optional existing WAV export of ``audio``
         
     Returns:
         List of chord dicts: [{"time": float, "duration": float, "chord": str}, ...]
     """
+    if CHORD_ENGINE == "numpy":
+        from chord_engine import extract_chords as extract_chords_numpy
+        return extract_chords_numpy(audio)
+
+    if wav_path:
+        return _extract_chords_from_file(wav_path)
+
+    temp_wav = audio.export_temp("wav")
+    try:
+        return _extract_chords_from_file(temp_wav)
+    finally:
+        os.remove(temp_wav)
+
+
+class _ChordinoPool:
+    """
+    Bounded pool of chord-extraction workers.
+
+    Each worker thread runs at most one Sonic Annotator process at a time, so
+    CHORDINO_MAX_PROCS caps concurrency. When requests queue up, a worker
+    takes up to CHORDINO_BATCH_SIZE of them and passes all files to a single
+    invocation, reading the CSV from stdout instead of temp files. Sonic
+    Annotator has no server mode, so batching is what amortises process
+    start-up and plugin discovery.
+    """
+
+    def __init__(self, max_procs: int, batch_size: int, batch_window_sec: float):
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._max_procs = max_procs
+        self._batch_size = max(1, batch_size)
+        self._batch_window_sec = batch_window_sec
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, audio_path: str) -> Future:
+        self._ensure_workers()
+        future: Future = Future()
+        self._queue.put((audio_path, future))
+        return future
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            while len(self._workers) < self._max_procs:
+                worker = threading.Thread(target=self._run, name="chordino-worker", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Give concurrent requests a brief window to join this invocation
+            deadline = time.monotonic() + self._batch_window_sec
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            paths = [path for path, _ in batch]
+            try:
+                results = _run_sonic_annotator(paths)
+            except Exception as e:
+                print(f"Chord extraction error: {e}")
+                results = {}
+
+            # A failed batch shouldn't zero every request in it: retry files individually
+            if not results and len(paths) > 1:
+                for path in paths:
+                    try:
+                        results.update(_run_sonic_annotator([path]))
+                    except Exception as e:
+                        print(f"Chord extraction error for {path}: {e}")
+
+            for path, future in batch:
+                if not future.cancelled():
+                    future.set_result(results.get(path, []))
+
+
+def _run_sonic_annotator(audio_paths: List[str], timeout: Optional[float] = None) -> Dict[str, List[Dict]]:
+    """
+    Run Sonic Annotator + Chordino over one or more files in a single process.
+
+    Args:
+        timeout: Seconds for the whole run (default CHORDINO_TIMEOUT_SEC per file)
+
+    Returns:
+        Dict of audio path -> chord list (empty dict if the run failed)
+    """
     sonic_annotator = get_sonic_annotator_path()
     vamp_path = get_vamp_path()
-    
-    # Create temp directory for output
-    temp_dir = tempfile.mkdtemp()
-    
+
+    # Set VAMP_PATH environment for plugin discovery
+    env = os.environ.copy()
+    env["VAMP_PATH"] = vamp_path
+
+    # Run sonic-annotator with Chordino
+    # Using simplechord output (chord labels with timestamps), written to stdout
+    cmd = [
+        sonic_annotator,
+        "-d", "vamp:nnls-chroma:chordino:simplechord",
+        "-w", "csv",
+        "--csv-stdout",
+        *audio_paths,
+    ]
+
     try:
-        # Set VAMP_PATH environment for plugin discovery
-        env = os.environ.copy()
-        env["VAMP_PATH"] = vamp_path
-        
-        # Run sonic-annotator with Chordino
-        # Using simplechord output (chord labels with timestamps)
-        # Note: sonic-annotator outputs to same dir as input or uses --csv-basedir
-        cmd = [
-            sonic_annotator,
-            "-d", "vamp:nnls-chroma:chordino:simplechord",
-            "-w", "csv",
-            "--csv-basedir", temp_dir,
-            "--csv-force",
-            audio_path
-        ]
-        
         result = subprocess.run(
             cmd,
             env=env,
             capture_output=True,
             text=True,
-            timeout=120  # 2 minute timeout
+            timeout=timeout or CHORDINO_TIMEOUT_SEC * len(audio_paths),
         )
-        
-        if result.returncode != 0:
-            print(f"Sonic Annotator error: {result.stderr}")
-            return []
-        
-        # Find the output CSV file (sonic-annotator creates filename based on input)
-        csv_files = [f for f in os.listdir(temp_dir) if f.endswith('.csv')]
-        if not csv_files:
-            print("No CSV output found from Sonic Annotator")
-            return []
-        
-        output_path = os.path.join(temp_dir, csv_files[0])
-        
-        # Parse CSV output
-        chords = parse_chord_csv(output_path)
-        return chords
-        
     except subprocess.TimeoutExpired:
         print("Chord extraction timed out")
-        return []
+        return {}
+
+    if result.returncode != 0:
+        print(f"Sonic Annotator error: {result.stderr}")
+        return {}
+
+    return parse_chord_stdout(result.stdout, audio_paths)
+
+
+def parse_chord_stdout(output: str, audio_paths: List[str]) -> Dict[str, List[Dict]]:
+    """
+    Parse ``--csv-stdout`` output of a (possibly multi-file) run.
+
+    Each file's block starts with a row whose first column is the source
+    identifier; following rows leave it empty: source, timestamp, chord_label
+    """
+    by_name = {os.path.basename(p): p for p in audio_paths}
+    groups: Dict[str, List[List[str]]] = {}
+    order = iter(audio_paths)
+    current: Optional[str] = None
+
+    for row in csv.reader(io.StringIO(output)):
+        if not row:
+            continue
+        source = row[0].strip()
+        if source:
+            source = source[len("file://"):] if source.startswith("file://") else source
+            # Match on the full path, then the file name, then invocation order
+            current = source if source in audio_paths else by_name.get(os.path.basename(source))
+            if current is None:
+                current = next(order, None)
+            groups.setdefault(current, [])
+        if current is not None:
+            groups[current].append(row[1:])
+
+    return {path: _rows_to_chords(rows) for path, rows in groups.items()}
+
+
+def _extract_chords_from_file(audio_path: str) -> List[Dict]:
+    """Queue a file on the shared Chordino pool and wait for its chords."""
+    try:
+        return _pool.submit(audio_path).result()
     except Exception as e:
         print(f"Chord extraction error: {e}")
         return []
-    finally:
-        # Clean up temp directory
-        import shutil
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def extract_track_chords(audio_path: str) -> List[Dict]:
+    """
+    Chords of a whole track for the feature store.
+
+    Runs as its own Sonic Annotator invocation, one track at a time, outside
+    the interactive pool: a long master neither joins a batch with region
+    requests nor occupies the pool's workers, and gets
+    CHORDINO_TRACK_TIMEOUT_SEC instead of the per-region timeout.
+
+    Returns:
+        Chord list, empty if the run failed
+    """
+    with _track_lock:
+        try:
+            return _run_sonic_annotator([audio_path], timeout=CHORDINO_TRACK_TIMEOUT_SEC).get(audio_path, [])
+        except Exception as e:
+            print(f"Full-track chord extraction error: {e}")
+            return []
 
 
 def parse_chord_csv(csv_path: str) -> List[Dict]:
@@ -111,50 +262,57 @@ def parse_chord_csv(csv_path: str) -> List[Dict]:
     
     CSV format: timestamp, duration, chord_label
     """
-    chords = []
-    
     if not os.path.exists(csv_path):
-        return chords
+        return []
     
     try:
         with open(csv_path, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows = list(reader)
-            
-            for i, row in enumerate(rows):
-                if len(row) < 2:
-                    continue
-                    
-                try:
-                    time = float(row[0])
-                    chord = row[1].strip() if len(row) > 1 else "N"
-                    
-                    # Calculate duration (time until next chord)
-                    if i + 1 < len(rows) and len(rows[i + 1]) >= 1:
-                        next_time = float(rows[i + 1][0])
-                        duration = next_time - time
-                    else:
-                        # Last chord - estimate 4 beats at 120 BPM = 2 seconds
-                        duration = 2.0
-                    
-                    # Skip "N" (no chord) entries that are very short
-                    if chord == "N" and duration < 0.5:
-                        continue
-                    
-                    chords.append({
-                        "time": time,
-                        "duration": duration,
-                        "chord": chord
-                    })
-                except (ValueError, IndexError):
-                    continue
-                    
+            return _rows_to_chords(list(csv.reader(f)))
     except Exception as e:
         print(f"Error parsing chord CSV: {e}")
+        return []
+
+
+def _rows_to_chords(rows: List[List[str]]) -> List[Dict]:
+    """Convert (timestamp, chord_label) rows to chord dicts with durations."""
+    chords = []
+    
+    for i, row in enumerate(rows):
+        if len(row) < 2:
+            continue
+            
+        try:
+            time = float(row[0])
+            chord = row[1].strip() if len(row) > 1 else "N"
+            
+            # Calculate duration (time until next chord)
+            if i + 1 < len(rows) and len(rows[i + 1]) >= 1:
+                next_time = float(rows[i + 1][0])
+                duration = next_time - time
+            else:
+                # Last chord - estimate 4 beats at 120 BPM = 2 seconds
+                duration = 2.0
+            
+            # Skip "N" (no chord) entries that are very short
+            if chord == "N" and duration < 0.5:
+                continue
+            
+            chords.append({
+                "time": time,
+                "duration": duration,
+                "chord": chord
+            })
+        except (ValueError, IndexError):
+            continue
     
     return chords
 
 
+_pool = _ChordinoPool(CHORDINO_MAX_PROCS, CHORDINO_BATCH_SIZE, CHORDINO_BATCH_WINDOW_SEC)
+# Serializes full-track passes so background precompute runs one process at a time
+_track_lock = threading.Lock()
+
+
 def chords_to_beats(chords: List[Dict], bpm: float) -> List[Dict]:
     """
     Convert time-based chords to beat-based format.
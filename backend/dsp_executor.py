@@ -0,0 +1,209 @@
+"""
+Dedicated process pool for CPU-bound DSP (mel spectrograms, beat tracking).
+
+Audio is handed to workers through ``multiprocessing.shared_memory`` instead of
+being pickled: the parent copies the samples into a shared block once and each
+worker maps it as a NumPy array. Full-track builds, which stream the file
+themselves, are submitted without a buffer via ``submit_call``. The number of in-flight jobs is bounded; when
+the pool is saturated, new work waits briefly and is then rejected with
+``DSPBusyError`` so request threads and chat endpoints are not starved.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from audio_processor import AudioBuffer
+
+load_dotenv()
+
+DSP_WORKERS = int(os.getenv("DSP_WORKERS") or "0") or (os.cpu_count() or 1)
+# Jobs allowed in flight (running + queued) before callers start waiting
+DSP_MAX_PENDING = int(os.getenv("DSP_MAX_PENDING") or "0") or DSP_WORKERS * 2
+# How long a caller waits for a free slot before the request is rejected
+DSP_QUEUE_TIMEOUT_SEC = float(os.getenv("DSP_QUEUE_TIMEOUT_SEC") or "10")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DSP_MAX_PENDING)
+_stats_lock = threading.Lock()
+_stats = {"inFlight": 0, "completed": 0, "rejected": 0, "poolRestarts": 0}
+
+
+class DSPBusyError(RuntimeError):
+    """The DSP pool is saturated; the caller should retry later."""
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=DSP_WORKERS)
+        return _pool
+
+
+def _discard_pool(broken: ProcessPoolExecutor) -> None:
+    """
+    Drop a pool whose worker died (e.g. OOM-killed); the next submit starts a
+    fresh one. Without this every later job would fail with BrokenProcessPool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return
+        _pool = None
+    with _stats_lock:
+        _stats["poolRestarts"] += 1
+    print("DSP process pool broke, starting a new one")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_to_pool(*args) -> Tuple[ProcessPoolExecutor, Future]:
+    """Submit to the current pool, replacing it once if it is already broken."""
+    pool = _get_pool()
+    try:
+        return pool, pool.submit(*args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        pool = _get_pool()
+        return pool, pool.submit(*args)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to a block owned by the parent without the worker's resource tracker unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # Python < 3.13 has no track flag and registers every attach. A worker that
+    # inherited the parent's tracker (fork, or a spawn child handed its fd)
+    # only repeats the parent's registration, which the parent's unlink clears;
+    # unregistering there would drop it early and make that unlink fail.
+    # Only a tracker the worker starts itself would unlink the block on exit.
+    from multiprocessing import resource_tracker
+    owns_tracker = getattr(resource_tracker._resource_tracker, "_fd", None) is None
+    shm = shared_memory.SharedMemory(name=name)
+    if owns_tracker:
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+def _run_with_shared_audio(fn: Callable, shm_name: str, shape: tuple, sr: int, args: tuple):
+    """Worker entry point: rebuild the AudioBuffer on top of shared memory and run fn."""
+    shm = _attach(shm_name)
+    try:
+        samples = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        audio = AudioBuffer(samples=samples, sr=sr)
+        result = fn(audio, *args)
+        # Views into the block must be gone before it can be closed
+        del audio, samples
+        return result
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+def _acquire_slot(timeout: Optional[float]) -> None:
+    if not _slots.acquire(timeout=timeout):
+        with _stats_lock:
+            _stats["rejected"] += 1
+        raise DSPBusyError("DSP workers are busy, try again shortly.")
+
+
+def _track(pool: ProcessPoolExecutor, future: Future, cleanup: Optional[Callable] = None) -> None:
+    """Count the job in flight and free its slot (and run cleanup) once it finishes."""
+    with _stats_lock:
+        _stats["inFlight"] += 1
+
+    def _release(done: Future) -> None:
+        if cleanup is not None:
+            cleanup()
+        _slots.release()
+        with _stats_lock:
+            _stats["inFlight"] -= 1
+            _stats["completed"] += 1
+        if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+            _discard_pool(pool)
+
+    future.add_done_callback(_release)
+
+
+def submit(fn: Callable, audio: AudioBuffer, *args) -> Future:
+    """
+    Run ``fn(audio, *args)`` in the DSP pool.
+
+    ``fn`` must be a module-level function (picklable by reference).
+
+    Raises:
+        DSPBusyError: if no slot frees up within DSP_QUEUE_TIMEOUT_SEC
+    """
+    _acquire_slot(DSP_QUEUE_TIMEOUT_SEC)
+
+    shm = None
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, audio.samples.nbytes))
+        shared = np.ndarray(audio.samples.shape, dtype=np.float32, buffer=shm.buf)
+        shared[:] = audio.samples
+        del shared
+        pool, future = _submit_to_pool(_run_with_shared_audio, fn, shm.name, audio.samples.shape, audio.sr, args)
+    except Exception:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        _slots.release()
+        raise
+
+    def _free_shm() -> None:
+        shm.close()
+        shm.unlink()
+
+    _track(pool, future, _free_shm)
+    return future
+
+
+def submit_call(fn: Callable, *args, timeout: Optional[float] = DSP_QUEUE_TIMEOUT_SEC) -> Future:
+    """
+    Run ``fn(*args)`` in the DSP pool, for jobs that read their own input
+    (e.g. full-track builds that stream the file in the worker).
+
+    Args:
+        timeout: How long to wait for a slot; None waits as long as it takes,
+            for builds whose result is kept on disk and must not be dropped
+
+    Raises:
+        DSPBusyError: if no slot frees up within ``timeout``
+    """
+    _acquire_slot(timeout)
+    try:
+        pool, future = _submit_to_pool(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+
+    _track(pool, future)
+    return future
+
+
+async def run_async(fn: Callable, audio: AudioBuffer, *args):
+    """Awaitable wrapper around ``submit``; waiting for a slot happens off the event loop."""
+    future = await asyncio.to_thread(submit, fn, audio, *args)
+    return await asyncio.wrap_future(future)
+
+
+def stats() -> Dict[str, int]:
+    """Current pool utilisation."""
+    with _stats_lock:
+        return dict(_stats, workers=DSP_WORKERS, maxPending=DSP_MAX_PENDING)
@@ -0,0 +1,358 @@
+"""
+Per-track feature store: full-track features computed once, sliced per region.
+
+After upload the whole track is analysed once: mel spectrogram (shared with the
+tile pyramid), onset-strength envelope, beat grid, chroma and chord timeline.
+Region requests then slice these arrays along the frame axis instead of
+decoding and re-analysing the clip, so scrubbing the selection costs almost
+no CPU.
+
+Agreement with a clip-only computation:
+    - Mel spectrogram: identical interior frames. The first/last ~2 frames
+      (n_fft/2 = 1024 samples, ~23 ms at 44.1 kHz) differ because the clip
+      computation zero-pads at its edges while the slice sees the real
+      neighbouring audio. Frame boundaries may be offset from the region start
+      by up to hop/2 (~6 ms). Colours use the same per-region peak reference.
+    - Tempo: same beat tracker on the same onset envelope, up to the first
+      frames at the edges; BPM typically agrees within 1 BPM. The envelope is
+      derived from the 0-16 kHz mel bands rather than 0-sr/2.
+    - Chords: decoded with full-track context, so labels within about one
+      chord frame (~93 ms) of the region edges can differ from a clip-only run.
+"""
+
+import json
+import os
+import tempfile
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+import chord_engine
+import dsp_executor
+from audio_processor import MEL_HOP_LENGTH, probe_audio, stream_frames
+from build_utils import lock_for, read_meta, write_meta
+from chordino import CHORD_ENGINE, extract_track_chords
+from spectrogram_tiles import (
+    PYRAMID_FMAX,
+    PYRAMID_N_FFT,
+    PYRAMID_N_MELS,
+    PYRAMID_TOP_DB,
+    finish_pyramid,
+    mel_db_path,
+    open_mel,
+    pyramid_lock,
+    pyramid_ready,
+)
+from tempo_analyzer import tempo_from_onset_envelope
+from track_store import get_track_dir, get_track_path
+
+# Mel settings the store can answer; other parameters fall back to clip computation
+FEATURE_N_MELS = PYRAMID_N_MELS
+FEATURE_FMAX = PYRAMID_FMAX
+
+# Audio decoded per block for the chroma pass (seconds)
+_CHROMA_BLOCK_SEC = 60.0
+# Mel frames processed per block for the onset envelope
+_ONSET_BLOCK_FRAMES = 8192
+
+
+def _feature_dir(track_id: str) -> str:
+    return os.path.join(get_track_dir(track_id), "features")
+
+
+def _onset_envelope(mel_path: str) -> np.ndarray:
+    """
+    Spectral-flux onset strength from the stored mel dB matrix.
+
+    Mirrors ``librosa.onset.onset_strength(aggregate=np.median)`` with
+    centering: lag-1 positive difference, median over bands, delayed by
+    n_fft / (2 * hop) frames.
+    """
+    mel = np.load(mel_path, mmap_mode="r")
+    frames = mel.shape[1]
+    env = np.zeros(frames, dtype=np.float32)
+
+    for f0 in range(1, frames, _ONSET_BLOCK_FRAMES):
+        f1 = min(frames, f0 + _ONSET_BLOCK_FRAMES)
+        block = np.asarray(mel[:, f0 - 1:f1], dtype=np.float32)
+        flux = np.maximum(0.0, np.diff(block, axis=1))
+        env[f0:f1] = np.median(flux, axis=0)
+
+    shift = PYRAMID_N_FFT // (2 * MEL_HOP_LENGTH)
+    if shift:
+        env = np.concatenate([np.zeros(shift, dtype=np.float32), env[:-shift]])
+    return env
+
+
+class _ChromaStream:
+    """
+    Chord engine chroma front end over a track fed front to back in mono
+    blocks of any size. Audio is analysed in _CHROMA_BLOCK_SEC pieces.
+    """
+
+    def __init__(self, sr: int):
+        self.sr = sr
+        self._block = int(_CHROMA_BLOCK_SEC * sr)
+        self._pending: List[np.ndarray] = []
+        self._pending_size = 0
+        self._start = 0
+        self._chromas, self._rmses, self._times = [], [], []
+
+    def feed(self, y: np.ndarray) -> None:
+        self._pending.append(y)
+        self._pending_size += y.size
+        while self._pending_size >= self._block:
+            buf = np.concatenate(self._pending)
+            self._analyse(buf[:self._block])
+            rest = buf[self._block:]
+            self._pending = [rest] if rest.size else []
+            self._pending_size = rest.size
+
+    def close(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tuple of (chroma (12, frames), rms (frames,), frame start times)
+        """
+        if self._pending_size:
+            self._analyse(np.concatenate(self._pending))
+            self._pending, self._pending_size = [], 0
+        if not self._chromas:
+            return np.zeros((12, 0), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0)
+        return np.hstack(self._chromas), np.concatenate(self._rmses), np.concatenate(self._times)
+
+    def _analyse(self, y: np.ndarray) -> None:
+        start = self._start
+        self._start += y.size
+        if self.sr != chord_engine.ENGINE_SR:
+            y = librosa.resample(y, orig_sr=self.sr, target_sr=chord_engine.ENGINE_SR)
+        chroma, rms = chord_engine.chroma_frames(y, chord_engine.ENGINE_SR)
+        # Keep whole frames only so blocks tile the timeline without overlap
+        n = min(chroma.shape[1], max(1, y.size // chord_engine.ENGINE_HOP))
+        self._chromas.append(chroma[:, :n])
+        self._rmses.append(rms[:n])
+        self._times.append(start / float(self.sr) + np.arange(n) * (chord_engine.ENGINE_HOP / float(chord_engine.ENGINE_SR)))
+
+
+def _analyze_track(track_id: str, build_mel: bool, wav_path: Optional[str]) -> Dict:
+    """
+    DSP worker entry point: every full-track feature from one streaming decode.
+
+    Each decoded block feeds the mel spectrogram (when the pyramid does not
+    exist yet), the chroma front end and, for Chordino, a mono WAV that Sonic
+    Annotator reads instead of the source (it can't open every container the
+    store accepts, e.g. m4a).
+
+    Returns:
+        Dict with sr, frames (mel columns), duration, bpm and the chord
+        timeline when the NumPy engine is used
+    """
+    audio_path = get_track_path(track_id)
+    feature_dir = _feature_dir(track_id)
+    mel_path = mel_db_path(track_id)
+    sr, channels, duration_sec = probe_audio(audio_path)
+
+    mel = mel_stream = wav = None
+    if build_mel:
+        mel, mel_stream = open_mel(mel_path, sr, duration_sec)
+    chroma_stream = _ChromaStream(sr)
+    if wav_path:
+        wav = sf.SoundFile(wav_path, "w", samplerate=sr, channels=1, subtype="PCM_16")
+    try:
+        for block in stream_frames(audio_path, sr, channels, duration_sec, int(_CHROMA_BLOCK_SEC * sr)):
+            y = block.mono()
+            chroma_stream.feed(y)
+            if mel_stream is not None:
+                mel_stream.feed(y)
+            if wav is not None:
+                wav.write(y)
+    finally:
+        if wav is not None:
+            wav.close()
+
+    if mel is not None:
+        mel_stream.close()
+        mel.flush()
+        finish_pyramid(track_id, sr, mel.shape[1])
+
+    onset_env = _onset_envelope(mel_path)
+    np.save(os.path.join(feature_dir, "onset_env.npy"), onset_env)
+
+    bpm, beat_times = tempo_from_onset_envelope(onset_env, sr, MEL_HOP_LENGTH)
+    np.save(os.path.join(feature_dir, "beats.npy"), np.asarray(beat_times, dtype=np.float64))
+
+    chroma, rms, chroma_times = chroma_stream.close()
+    np.savez(os.path.join(feature_dir, "chroma.npz"), chroma=chroma, rms=rms, times=chroma_times)
+
+    return {
+        "sr": sr,
+        "frames": int(onset_env.size),
+        "duration": duration_sec,
+        "bpm": bpm,
+        "chords": chord_engine.decode_chords(chroma, rms, chroma_times, duration_sec) if CHORD_ENGINE == "numpy" else None,
+    }
+
+
+def ensure_features(track_id: str) -> Dict:
+    """
+    Compute the full-track feature set if needed.
+
+    The work runs in the DSP process pool and decodes the track once; the
+    pyramid's mel comes out of the same pass unless it already exists. A
+    Chordino pass that fails or finds nothing (e.g. it timed out on a long
+    master) is not stored: meta["chords"] is False and region requests run
+    the chord stage on the clip instead.
+
+    Returns:
+        Feature metadata
+    """
+    feature_dir = _feature_dir(track_id)
+    meta_path = os.path.join(feature_dir, "meta.json")
+
+    with lock_for("features", track_id):
+        if not os.path.exists(meta_path):
+            get_track_path(track_id)  # KeyError for unknown tracks before anything is created
+            os.makedirs(feature_dir, exist_ok=True)
+            os.makedirs(os.path.dirname(mel_db_path(track_id)), exist_ok=True)
+
+            wav_path = None
+            if CHORD_ENGINE != "numpy":
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+                    wav_path = tmp.name
+            try:
+                with ExitStack() as stack:
+                    build_mel = not pyramid_ready(track_id)
+                    if build_mel:
+                        # Tile requests wait for the pyramid this pass produces
+                        stack.enter_context(pyramid_lock(track_id))
+                        build_mel = not pyramid_ready(track_id)
+                    result = dsp_executor.submit_call(
+                        _analyze_track, track_id, build_mel, wav_path, timeout=None,
+                    ).result()
+
+                chords = result["chords"]
+                if wav_path:
+                    chords = extract_track_chords(wav_path)
+            finally:
+                if wav_path:
+                    os.remove(wav_path)
+
+            chords_path = os.path.join(feature_dir, "chords.json")
+            if chords:
+                with open(chords_path, "w", encoding="utf-8") as f:
+                    json.dump(chords, f)
+            elif os.path.exists(chords_path):
+                os.remove(chords_path)
+
+            write_meta(meta_path, {
+                "trackId": track_id,
+                "sr": result["sr"],
+                "hopLength": MEL_HOP_LENGTH,
+                "frames": result["frames"],
+                "duration": result["duration"],
+                "bpm": result["bpm"],
+                "chordEngine": CHORD_ENGINE,
+                "chords": bool(chords),
+            })
+
+    return read_meta(meta_path)
+
+
+def features_ready(track_id: str) -> bool:
+    """True once the feature set for a track has been fully computed."""
+    try:
+        return os.path.exists(os.path.join(_feature_dir(track_id), "meta.json"))
+    except ValueError:
+        return False
+
+
+def _load_meta(track_id: str) -> Dict:
+    return read_meta(os.path.join(_feature_dir(track_id), "meta.json"))
+
+
+def _clamp_region(meta: Dict, start_sec: float, end_sec: float) -> Tuple[float, float]:
+    """Same clamping rules as ``audio_processor.decode_audio``."""
+    duration = meta["duration"]
+    start_sec = max(0.0, float(start_sec))
+    end_sec = min(duration, float(end_sec))
+    if end_sec <= start_sec:
+        end_sec = min(duration, start_sec + 0.1)
+    return start_sec, end_sec
+
+
+def _frame_range(meta: Dict, start_sec: float, end_sec: float) -> Tuple[int, int]:
+    frame_sec = meta["hopLength"] / float(meta["sr"])
+    f0 = int(round(start_sec / frame_sec))
+    # A clip of n samples has 1 + n // hop centered frames
+    f1 = f0 + 1 + int((end_sec - start_sec) * meta["sr"]) // meta["hopLength"]
+    return f0, min(f1, meta["frames"])
+
+
+def region_mel_db(track_id: str, start_sec: float, end_sec: float) -> Tuple[np.ndarray, int, int]:
+    """
+    Mel dB matrix for a region, referenced to the region's own peak like
+    ``compute_mel_db``.
+
+    Returns:
+        Tuple of ((n_mels, frames) float32 dB matrix, sample_rate, hop_length)
+    """
+    meta = _load_meta(track_id)
+    start_sec, end_sec = _clamp_region(meta, start_sec, end_sec)
+    f0, f1 = _frame_range(meta, start_sec, end_sec)
+
+    mel = np.load(mel_db_path(track_id), mmap_mode="r")
+    S = np.asarray(mel[:, f0:f1], dtype=np.float32)
+    if S.size == 0:
+        raise ValueError("Audio appears to be empty.")
+    S = S - S.max()
+    return np.maximum(S, -PYRAMID_TOP_DB), meta["sr"], meta["hopLength"]
+
+
+def region_tempo(track_id: str, start_sec: float, end_sec: float, beats: bool = True) -> Tuple[float, List[float]]:
+    """
+    BPM and beat times (relative to the region start) from the stored onset envelope.
+    With beats=False only the BPM is estimated and the beat list is empty.
+    """
+    meta = _load_meta(track_id)
+    start_sec, end_sec = _clamp_region(meta, start_sec, end_sec)
+    f0, f1 = _frame_range(meta, start_sec, end_sec)
+
+    onset_env = np.load(os.path.join(_feature_dir(track_id), "onset_env.npy"), mmap_mode="r")
+    return tempo_from_onset_envelope(np.asarray(onset_env[f0:f1]), meta["sr"], meta["hopLength"], beats=beats)
+
+
+def region_chords(track_id: str, start_sec: float, end_sec: float) -> Optional[List[Dict]]:
+    """
+    Chord timeline clipped to the region, with times relative to the region start.
+
+    Returns:
+        The clipped chords, or None when the track has no stored chord
+        timeline (failed or empty full-track pass) and the caller should
+        extract chords from the clip
+    """
+    meta = _load_meta(track_id)
+    start_sec, end_sec = _clamp_region(meta, start_sec, end_sec)
+
+    chords_path = os.path.join(_feature_dir(track_id), "chords.json")
+    if not meta.get("chords", True) or not os.path.exists(chords_path):
+        return None
+    with open(chords_path, "r", encoding="utf-8") as f:
+        chords = json.load(f)
+    # Feature sets built before failed passes were skipped stored them as []
+    if not chords:
+        return None
+
+    clipped = []
+    for c in chords:
+        begin = max(c["time"], start_sec)
+        end = min(c["time"] + c["duration"], end_sec)
+        if end <= begin:
+            continue
+        clipped.append({
+            "time": round(begin - start_sec, 3),
+            "duration": round(end - begin, 3),
+            "chord": c["chord"],
+        })
+    return clipped
@@ -1,59 +1,43 @@
+import asyncio
+import hashlib
 import os
+import time
 import uuid
-from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+import provider_clients
+import session_store
 from prompts import get_system_prompt
 
 load_dotenv()
 
-# In-memory storage for active chat sessions
-# Dict[str, genai.chats.Chat]
-_sessions: Dict[str, object] = {}
+# How long to wait for an uploaded file to leave the PROCESSING state
+GEMINI_FILE_ACTIVE_TIMEOUT_SEC = float(os.getenv("GEMINI_FILE_ACTIVE_TIMEOUT_SEC") or "60")
+_FILE_POLL_INTERVAL_SEC = 0.5
 
-# Singleton client instance - keeps httpx connection alive across sessions
-_client: Optional[genai.Client] = None
+# Uploaded files are reused for identical audio until shortly before they expire
+GEMINI_FILE_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_FILE_CACHE_MAX_ENTRIES") or "512")
+GEMINI_FILE_REUSE_MARGIN_SEC = float(os.getenv("GEMINI_FILE_REUSE_MARGIN_SEC") or "600")
 
+# Content hash of the uploaded audio -> Files API handle
+_file_cache: "OrderedDict[str, types.File]" = OrderedDict()
+_file_cache_stats = {"hits": 0, "misses": 0, "expired": 0, "invalid": 0, "uploads": 0}
 
-def _get_client() -> genai.Client:
-    """Get or create a singleton Gemini client instance."""
-    global _client
-    if _client is None:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "Missing GEMINI_API_KEY. Create backend/.env with:\n\n"
-                "GEMINI_API_KEY=YOUR_KEY_HERE\n"
-            )
-        _client = genai.Client(api_key=api_key)
-    return _client
-
-
-def start_audio_chat_session(
-    audio_path: str,
-    spectrogram_png_bytes: bytes,
-    user_prompt: str,
+def _create_chat(
+    client: genai.Client,
     model_id: str,
-    temperature: float = 0.2,
-    thinking_budget: Optional[int] = None,
-    mode: str = "engineer",
-) -> Tuple[str, str]:
-    """
-    Starts a new chat session with the audio context.
-    Returns (session_id, initial_response_text).
-    """
-    client = _get_client()
-
-    uploaded_audio = client.files.upload(file=audio_path)
-
-    spectrogram_part = types.Part.from_bytes(
-        data=spectrogram_png_bytes,
-        mime_type="image/png",
-    )
-
+    temperature: float,
+    thinking_budget: Optional[int],
+    mode: str,
+    history: Optional[List[types.Content]] = None,
+):
+    """Create a chat with the mode's system prompt and generation settings, optionally resuming a history."""
     # Configure Thinking if requested (assuming model supports it)
     # Note: 'thinking_config' is strictly for models that support it (e.g. gemini-2.0-flash-thinking-exp)
     # Start with standard config
@@ -67,30 +51,244 @@ def start_audio_chat_session(
         # For this starter, we'll pass it if the user provides it, assuming a compatible model.
         config_args["thinking_config"] = {"include_thoughts": True}
 
-    chat = client.chats.create(
+    return client.aio.chats.create(
         model=model_id,
         config=types.GenerateContentConfig(**config_args),
+        history=history,
     )
 
-    # Send initial message with context
-    response = chat.send_message(
-        message=[user_prompt, uploaded_audio, spectrogram_part]
+
+async def _save_chat(session_id: str, chat, settings: Dict) -> None:
+    """Persist the chat's settings and full history (including the uploaded file reference)."""
+    record = dict(
+        settings,
+        provider="gemini",
+        history=[content.model_dump_json(exclude_none=True) for content in chat.get_history()],
     )
+    await asyncio.to_thread(session_store.save_session, session_id, record)
+
+
+async def _load_chat(session_id: str, session: Optional[Dict] = None):
+    """Rebuild a chat from its stored record. Returns (chat, settings)."""
+    if session is None:
+        session = await asyncio.to_thread(session_store.get_session, session_id)
+    if not session:
+        raise ValueError("Session not found or expired.")
+
+    settings = {k: session[k] for k in ("model", "temperature", "thinkingBudget", "mode")}
+    history = [types.Content.model_validate_json(item) for item in session["history"]]
+    chat = _create_chat(
+        provider_clients.gemini(), settings["model"], settings["temperature"], settings["thinkingBudget"], settings["mode"], history,
+    )
+    return chat, settings
+
+
+def _state_name(file) -> str:
+    state = getattr(file, "state", None)
+    return getattr(state, "name", str(state or "ACTIVE"))
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _seconds_to_expiry(file) -> float:
+    expires = getattr(file, "expiration_time", None)
+    if expires is None:
+        return float("inf")
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    return (expires - datetime.now(timezone.utc)).total_seconds()
+
+
+async def _reusable_file(content_hash: str):
+    """
+    Cached handle for this audio if it is far enough from expiry and the
+    Files API still reports it ACTIVE; otherwise drop it and return None.
+    """
+    cached = _file_cache.get(content_hash)
+    if cached is None:
+        _file_cache_stats["misses"] += 1
+        return None
+
+    if _seconds_to_expiry(cached) < GEMINI_FILE_REUSE_MARGIN_SEC:
+        _file_cache.pop(content_hash, None)
+        _file_cache_stats["expired"] += 1
+        return None
+
+    try:
+        async with provider_clients.track("gemini"):
+            current = await provider_clients.gemini().aio.files.get(name=cached.name)
+    except Exception as e:
+        print(f"Cached Gemini file {cached.name} is no longer available: {e}")
+        current = None
+    if current is None or _state_name(current) != "ACTIVE":
+        _file_cache.pop(content_hash, None)
+        _file_cache_stats["invalid"] += 1
+        return None
+
+    _file_cache.move_to_end(content_hash)
+    _file_cache_stats["hits"] += 1
+    return current
+
+
+def _remember_file(content_hash: str, uploaded) -> None:
+    _file_cache[content_hash] = uploaded
+    _file_cache.move_to_end(content_hash)
+    while len(_file_cache) > GEMINI_FILE_CACHE_MAX_ENTRIES:
+        _file_cache.popitem(last=False)
+
+
+def file_cache_stats() -> Dict[str, int]:
+    """Reuse counters for uploaded audio files."""
+    return dict(_file_cache_stats, entries=len(_file_cache))
+
+
+async def upload_audio(audio_path: str):
+    """
+    Upload audio to the Files API and wait until it can be referenced.
+
+    Identical audio (by content hash) reuses a previous upload while the
+    handle is still valid. Independent of the spectrogram and chords, so
+    /api/analyze starts it as soon as the trimmed WAV exists and lets it run
+    alongside the local DSP.
+
+    Returns:
+        The ACTIVE uploaded file
+    """
+    content_hash = await asyncio.to_thread(_file_sha256, audio_path)
+    reusable = await _reusable_file(content_hash)
+    if reusable is not None:
+        return reusable
+
+    client = provider_clients.gemini()
+    async with provider_clients.track("gemini"):
+        uploaded = await client.aio.files.upload(file=audio_path)
+    _file_cache_stats["uploads"] += 1
+
+    deadline = time.monotonic() + GEMINI_FILE_ACTIVE_TIMEOUT_SEC
+    while _state_name(uploaded) == "PROCESSING":
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Gemini file {uploaded.name} still processing after {GEMINI_FILE_ACTIVE_TIMEOUT_SEC:.0f}s")
+        await asyncio.sleep(_FILE_POLL_INTERVAL_SEC)
+        async with provider_clients.track("gemini"):
+            uploaded = await client.aio.files.get(name=uploaded.name)
+
+    if _state_name(uploaded) == "FAILED":
+        raise RuntimeError(f"Gemini could not process the uploaded audio ({uploaded.name}).")
+
+    _remember_file(content_hash, uploaded)
+    return uploaded
+
+
+async def _initial_message(audio_path: str, spectrogram_png_bytes: bytes, user_prompt: str, uploaded_audio=None) -> list:
+    """Build the first message: prompt, audio file, spectrogram image. Uploads the audio unless given."""
+    if uploaded_audio is None:
+        uploaded_audio = await upload_audio(audio_path)
+
+    spectrogram_part = types.Part.from_bytes(
+        data=spectrogram_png_bytes,
+        mime_type="image/png",
+    )
+    return [user_prompt, uploaded_audio, spectrogram_part]
+
+
+async def _stream_text(pending_stream, on_done) -> AsyncIterator[str]:
+    """
+    Await a send_message_stream call and yield the text of each chunk, skipping empty ones.
+    Awaits on_done() once the stream completed (the chat has recorded the reply by then).
+    """
+    async with provider_clients.track("gemini"):
+        async for chunk in await pending_stream:
+            if chunk.text:
+                yield chunk.text
+    await on_done()
+
+
+async def start_audio_chat_session(
+    audio_path: str,
+    spectrogram_png_bytes: bytes,
+    user_prompt: str,
+    model_id: str,
+    temperature: float = 0.2,
+    thinking_budget: Optional[int] = None,
+    mode: str = "engineer",
+    uploaded_audio=None,
+) -> Tuple[str, str]:
+    """
+    Starts a new chat session with the audio context.
+    Pass uploaded_audio (from upload_audio) to skip uploading audio_path again.
+    Returns (session_id, initial_response_text).
+    """
+    client = provider_clients.gemini()
+    message = await _initial_message(audio_path, spectrogram_png_bytes, user_prompt, uploaded_audio)
+    chat = _create_chat(client, model_id, temperature, thinking_budget, mode)
+
+    # Send initial message with context
+    async with provider_clients.track("gemini"):
+        response = await chat.send_message(message=message)
 
     session_id = str(uuid.uuid4())
-    _sessions[session_id] = chat
+    settings = {"model": model_id, "temperature": temperature, "thinkingBudget": thinking_budget, "mode": mode}
+    await _save_chat(session_id, chat, settings)
 
     return session_id, response.text
 
 
-def send_chat_message(session_id: str, user_message: str) -> str:
+async def stream_audio_chat_session(
+    audio_path: str,
+    spectrogram_png_bytes: bytes,
+    user_prompt: str,
+    model_id: str,
+    temperature: float = 0.2,
+    thinking_budget: Optional[int] = None,
+    mode: str = "engineer",
+    uploaded_audio=None,
+) -> Tuple[str, AsyncIterator[str]]:
+    """
+    Streaming variant of start_audio_chat_session.
+    Returns (session_id, text_chunks); the session is stored once the
+    iterator is exhausted.
+    """
+    client = provider_clients.gemini()
+    message = await _initial_message(audio_path, spectrogram_png_bytes, user_prompt, uploaded_audio)
+    chat = _create_chat(client, model_id, temperature, thinking_budget, mode)
+
+    session_id = str(uuid.uuid4())
+    settings = {"model": model_id, "temperature": temperature, "thinkingBudget": thinking_budget, "mode": mode}
+
+    return session_id, _stream_text(
+        chat.send_message_stream(message=message),
+        lambda: _save_chat(session_id, chat, settings),
+    )
+
+
+async def send_chat_message(session_id: str, user_message: str, session: Optional[Dict] = None) -> str:
     """
     Sends a follow-up message to an existing session.
+    Pass the already loaded session record to skip reading it again.
     """
-    chat = _sessions.get(session_id)
-    if not chat:
-        raise ValueError("Session not found or expired.")
+    chat, settings = await _load_chat(session_id, session)
 
-    response = chat.send_message(message=user_message)
+    async with provider_clients.track("gemini"):
+        response = await chat.send_message(message=user_message)
+    await _save_chat(session_id, chat, settings)
     return response.text
 
+
+async def stream_chat_message(session_id: str, user_message: str, session: Optional[Dict] = None) -> AsyncIterator[str]:
+    """
+    Streaming variant of send_chat_message; yields text chunks as they arrive.
+    The turn is stored only when the stream completes.
+    """
+    chat, settings = await _load_chat(session_id, session)
+
+    async for text in _stream_text(
+        chat.send_message_stream(message=user_message),
+        lambda: _save_chat(session_id, chat, settings),
+    ):
+        yield text
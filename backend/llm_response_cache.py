@@ -0,0 +1,155 @@
+"""
+Opt-in cache of zero-temperature analysis replies.
+
+At temperature 0 the same audio, prompt, mode and model give effectively the
+same advice, so a repeat analysis can skip the provider call entirely. An
+entry keeps the raw reply, the cleaned advice, the MIDI file generated from
+it, the spectrogram/BPM/chords of the response and a snapshot of the chat
+session, which a hit copies into a fresh session so follow-up questions
+still work.
+
+The key only uses request inputs (track content hash, region, settings), so
+it is checked before any decoding, DSP or Gemini upload: a hit does no work
+beyond copying the session.
+
+    LLM_CACHE_ENABLED:      "1"/"true" to enable (off by default)
+    LLM_CACHE_TTL_SEC:      entry lifetime (default 24 h). Gemini sessions reference
+                            the uploaded audio, which the Files API keeps for 48 h
+    LLM_CACHE_MAX_ENTRIES:  LRU bound (default 256)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = (os.getenv("LLM_CACHE_ENABLED") or "").strip().lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_SEC = float(os.getenv("LLM_CACHE_TTL_SEC") or 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES") or "256")
+
+_lock = threading.Lock()
+# key -> (stored_at, entry)
+_entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "expired": 0, "stale": 0, "evicted": 0, "stored": 0}
+
+
+def cacheable(temperature: float) -> bool:
+    """Whether a request with this temperature may use the cache."""
+    return LLM_CACHE_ENABLED and float(temperature) == 0
+
+
+def make_key(
+    track_id: str,
+    start_sec: float,
+    end_sec: float,
+    audio_preset: str,
+    prompt: str,
+    mode: str,
+    model_id: str,
+    thinking_budget: Optional[int],
+    bpm: Optional[float],
+    chords: Optional[str],
+) -> str:
+    """
+    Cache key for one analysis.
+
+    Args:
+        track_id: Content hash of the source track
+        start_sec, end_sec: Region (rounded to the millisecond)
+        audio_preset: Encoding the region is sent in (see audio_encoder.get_preset)
+        prompt: The user's prompt, before musical context is prepended
+        mode: "engineer" or "producer"
+        model_id: Provider model ID
+        thinking_budget: Gemini thinking budget (changes the reply)
+        bpm, chords: User-edited BPM/chords; together with the region they
+            determine the musical context added to the prompt
+    """
+    ident = json.dumps({
+        "track": track_id,
+        "start": round(float(start_sec), 3),
+        "end": round(float(end_sec), 3),
+        "audio": audio_preset,
+        "prompt": prompt,
+        "mode": mode,
+        "model": model_id,
+        "thinkingBudget": thinking_budget,
+        "bpm": bpm,
+        "chords": chords,
+    }, sort_keys=True)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[Dict]:
+    """
+    Cached entry {rawAdvice, advice, midiFilename, midiPath, spectrogramPng, bpm,
+    chords, session}, or None.
+    Entries whose MIDI file has since been deleted count as stale misses.
+    """
+    now = time.time()
+    with _lock:
+        item = _entries.get(key)
+        if item is None:
+            _stats["misses"] += 1
+            return None
+        stored_at, entry = item
+        if now - stored_at > LLM_CACHE_TTL_SEC:
+            del _entries[key]
+            _stats["expired"] += 1
+            _stats["misses"] += 1
+            return None
+        if entry["midiPath"] and not os.path.exists(entry["midiPath"]):
+            del _entries[key]
+            _stats["stale"] += 1
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry
+
+
+def put(
+    key: str,
+    raw_advice: str,
+    advice: str,
+    midi_filename: Optional[str],
+    midi_path: Optional[str],
+    prepared: Dict,
+    session: Dict,
+) -> None:
+    """
+    Store a completed analysis.
+
+    Args:
+        prepared: The analysis' spectrogramPng, bpm and chords are kept from it
+        session: The session record right after the first reply
+    """
+    entry = {
+        "rawAdvice": raw_advice,
+        "advice": advice,
+        "midiFilename": midi_filename,
+        "midiPath": midi_path,
+        "spectrogramPng": prepared["spectrogramPng"],
+        "bpm": prepared["bpm"],
+        "chords": prepared["chords"],
+        "session": session,
+    }
+    with _lock:
+        _entries[key] = (time.time(), entry)
+        _entries.move_to_end(key)
+        _stats["stored"] += 1
+        while len(_entries) > LLM_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evicted"] += 1
+
+
+def stats() -> Dict:
+    """Hit/miss counters and current size."""
+    with _lock:
+        return dict(_stats, enabled=LLM_CACHE_ENABLED, entries=len(_entries), maxEntries=LLM_CACHE_MAX_ENTRIES)
@@ -1,27 +1,61 @@
+import asyncio
 import os
 import base64
 import uuid
-from typing import Dict, Optional, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from openai import OpenAI
 
+import chat_history
+import provider_clients
+import session_store
 from prompts import get_system_prompt
 
 load_dotenv()
 
-# In-memory storage for active chat sessions
-# Each session stores: {"client": OpenAI, "messages": list, "model": str}
-_sessions: Dict[str, dict] = {}
+# Model that condenses old follow-ups when OPENAI_HISTORY_STRATEGY=summarize
+OPENAI_SUMMARY_MODEL = os.getenv("OPENAI_SUMMARY_MODEL") or "gpt-4o-mini"
+
+# Sessions live in session_store as:
+# {"provider": "openai", "messages": list, "model": str, "temperature": float, "summary": str}
+# with messages compacted by chat_history after every turn
+
+
+async def _complete(**kwargs):
+    """Non-streaming chat completion on the shared client, counted in its gauges."""
+    async with provider_clients.track("openai"):
+        return await provider_clients.openai().chat.completions.create(**kwargs)
+
+
+async def _summarize(text: str) -> str:
+    response = await _complete(
+        model=OPENAI_SUMMARY_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Summarize this part of an audio mixing/production conversation in a few short "
+                    "bullet points. Keep every concrete setting, value, decision and open question."
+                ),
+            },
+            {"role": "user", "content": text},
+        ],
+        temperature=0,
+    )
+    return response.choices[0].message.content
 
 
-def _get_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key or api_key == "your_openai_api_key_here":
-        raise RuntimeError(
-            "Missing OPENAI_API_KEY. Update backend/.env with your OpenAI API key."
-        )
-    return OpenAI(api_key=api_key)
+async def _save_session(session_id: str, session: Dict) -> None:
+    await chat_history.compact(session, _summarize)
+    await asyncio.to_thread(session_store.save_session, session_id, dict(session, provider="openai"))
+
+
+async def _load_session(session_id: str, session: Optional[Dict] = None) -> Dict:
+    if session is None:
+        session = await asyncio.to_thread(session_store.get_session, session_id)
+    if not session:
+        raise ValueError("Session not found or expired.")
+    return session
 
 
 def _get_audio_mime_type(audio_path: str) -> str:
@@ -37,30 +71,20 @@ def _get_audio_mime_type(audio_path: str) -> str:
     return mime_map.get(ext, "audio/wav")
 
 
-def start_audio_chat_session(
-    audio_path: str,
-    spectrogram_png_bytes: bytes,  # Not used for OpenAI, kept for API compatibility
-    user_prompt: str,
-    model_id: str = "gpt-audio",
-    temperature: float = 0.2,
-    thinking_budget: Optional[int] = None,  # Not used for OpenAI, kept for API compatibility
-    mode: str = "engineer",
-) -> Tuple[str, str]:
-    """
-    Starts a new chat session with audio context using OpenAI.
-    Returns (session_id, initial_response_text).
-    Note: gpt-audio does not support image input, so spectrogram is not sent.
-    """
-    client = _get_client()
-
-    # Encode audio as base64
+def _read_audio_base64(audio_path: str) -> str:
     with open(audio_path, "rb") as f:
-        audio_data = base64.standard_b64encode(f.read()).decode("utf-8")
+        return base64.standard_b64encode(f.read()).decode("utf-8")
+
+
+async def _initial_messages(audio_path: str, user_prompt: str, mode: str) -> List[dict]:
+    """System prompt plus the first user turn carrying the base64 audio."""
+    # Encode audio as base64 off the event loop; regions can be tens of MB
+    audio_data = await asyncio.to_thread(_read_audio_base64, audio_path)
     
     audio_mime = _get_audio_mime_type(audio_path)
 
     # Build message with audio only (gpt-audio does not support images)
-    messages = [
+    return [
         {"role": "system", "content": get_system_prompt(mode)},
         {
             "role": "user",
@@ -69,7 +93,8 @@ def start_audio_chat_session(
                     "type": "input_audio",
                     "input_audio": {
                         "data": audio_data,
-                        "format": audio_mime.split("/")[-1],  # e.g., "wav", "mpeg", "flac"
+                        # input_audio names MP3 "mp3", not its MIME subtype "mpeg"
+                        "format": "mp3" if audio_mime == "audio/mpeg" else audio_mime.split("/")[-1],
                     }
                 },
                 {
@@ -80,7 +105,46 @@ def start_audio_chat_session(
         }
     ]
 
-    response = client.chat.completions.create(
+
+async def _stream_completion(model_id: str, messages: List[dict], temperature: float, on_done) -> AsyncIterator[str]:
+    """
+    Stream a chat completion, yielding content deltas.
+    on_done(full_text) is awaited only after the stream completed successfully.
+    """
+    parts = []
+    # The request holds its concurrency slot until the last delta
+    async with provider_clients.track("openai"):
+        stream = await provider_clients.openai().chat.completions.create(
+            model=model_id,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    await on_done("".join(parts))
+
+
+async def start_audio_chat_session(
+    audio_path: str,
+    spectrogram_png_bytes: bytes,  # Not used for OpenAI, kept for API compatibility
+    user_prompt: str,
+    model_id: str = "gpt-audio",
+    temperature: float = 0.2,
+    thinking_budget: Optional[int] = None,  # Not used for OpenAI, kept for API compatibility
+    mode: str = "engineer",
+) -> Tuple[str, str]:
+    """
+    Starts a new chat session with audio context using OpenAI.
+    Returns (session_id, initial_response_text).
+    Note: gpt-audio does not support image input, so spectrogram is not sent.
+    """
+    messages = await _initial_messages(audio_path, user_prompt, mode)
+
+    response = await _complete(
         model=model_id,
         messages=messages,
         temperature=temperature,
@@ -92,33 +156,82 @@ def start_audio_chat_session(
     session_id = str(uuid.uuid4())
     messages.append({"role": "assistant", "content": assistant_message})
     
-    _sessions[session_id] = {
-        "client": client,
+    await _save_session(session_id, {
         "messages": messages,
         "model": model_id,
         "temperature": temperature,
-    }
+    })
 
     return session_id, assistant_message
 
 
-def send_chat_message(session_id: str, user_message: str) -> str:
+async def stream_audio_chat_session(
+    audio_path: str,
+    spectrogram_png_bytes: bytes,  # Not used for OpenAI, kept for API compatibility
+    user_prompt: str,
+    model_id: str = "gpt-audio",
+    temperature: float = 0.2,
+    thinking_budget: Optional[int] = None,  # Not used for OpenAI, kept for API compatibility
+    mode: str = "engineer",
+) -> Tuple[str, AsyncIterator[str]]:
+    """
+    Streaming variant of start_audio_chat_session.
+    Returns (session_id, text_chunks); the session becomes available for
+    follow-ups once the iterator is exhausted.
+    """
+    messages = await _initial_messages(audio_path, user_prompt, mode)
+    session_id = str(uuid.uuid4())
+
+    async def _store(assistant_message: str) -> None:
+        messages.append({"role": "assistant", "content": assistant_message})
+        await _save_session(session_id, {
+            "messages": messages,
+            "model": model_id,
+            "temperature": temperature,
+        })
+
+    return session_id, _stream_completion(model_id, messages, temperature, _store)
+
+
+async def send_chat_message(session_id: str, user_message: str, session: Optional[Dict] = None) -> str:
     """
     Sends a follow-up message to an existing session.
+    Pass the already loaded session record to skip reading it again.
     """
-    session = _sessions.get(session_id)
-    if not session:
-        raise ValueError("Session not found or expired.")
+    session = await _load_session(session_id, session)
 
     session["messages"].append({"role": "user", "content": user_message})
 
-    response = session["client"].chat.completions.create(
+    response = await _complete(
         model=session["model"],
-        messages=session["messages"],
+        messages=chat_history.request_messages(session),
         temperature=session["temperature"],
     )
 
     assistant_message = response.choices[0].message.content
     session["messages"].append({"role": "assistant", "content": assistant_message})
+    await _save_session(session_id, session)
 
     return assistant_message
+
+
+async def stream_chat_message(session_id: str, user_message: str, session: Optional[Dict] = None) -> AsyncIterator[str]:
+    """
+    Streaming variant of send_chat_message. The turn is added to the history
+    only when the stream completes, so an aborted reply leaves the session as it was.
+    """
+    session = await _load_session(session_id, session)
+
+    user_turn = {"role": "user", "content": user_message}
+
+    async def _store(assistant_message: str) -> None:
+        session["messages"].extend([user_turn, {"role": "assistant", "content": assistant_message}])
+        await _save_session(session_id, session)
+
+    async for text in _stream_completion(
+        session["model"],
+        chat_history.request_messages(session) + [user_turn],
+        session["temperature"],
+        _store,
+    ):
+        yield text
@@ -0,0 +1,181 @@
+"""
+Raw PCM cache for very long recordings.
+
+Long sources are decoded once with ffmpeg into a headerless PCM file on disk.
+Region requests then slice it through ``numpy.memmap`` so nothing is decoded
+again and resident memory only grows with the region that is actually read.
+The cache directory is bounded by size with least-recently-used eviction.
+"""
+
+import hashlib
+import os
+import subprocess
+from typing import Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from pydub import AudioSegment
+
+from build_utils import lock_for, read_meta, write_meta
+
+load_dotenv()
+
+PCM_CACHE_DIR = os.getenv("PCM_CACHE_DIR") or "storage/pcm"
+# Total size the cache directory may use before old entries are evicted
+PCM_CACHE_MAX_BYTES = int(os.getenv("PCM_CACHE_MAX_BYTES") or 20 * 1024 ** 3)
+# Sources shorter than this are cheap to ranged-decode and skip the cache
+PCM_CACHE_MIN_SEC = float(os.getenv("PCM_CACHE_MIN_SEC") or "1200")
+# "float32" (zero-copy reads) or "int16" (half the disk footprint)
+PCM_CACHE_DTYPE = os.getenv("PCM_CACHE_DTYPE") or "float32"
+
+_DTYPES = {
+    "float32": ("f32le", "pcm_f32le"),
+    "int16": ("s16le", "pcm_s16le"),
+}
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+os.makedirs(PCM_CACHE_DIR, exist_ok=True)
+
+
+def _cache_key(audio_path: str) -> str:
+    st = os.stat(audio_path)
+    ident = f"{os.path.abspath(audio_path)}|{st.st_size}|{st.st_mtime_ns}|{PCM_CACHE_DTYPE}"
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+def _paths(key: str) -> Tuple[str, str]:
+    base = os.path.join(PCM_CACHE_DIR, key)
+    return base + ".pcm", base + ".json"
+
+
+def _build(audio_path: str, key: str, sr: int, channels: int) -> None:
+    """Stream a full ffmpeg decode to disk in fixed-size chunks."""
+    pcm_path, meta_path = _paths(key)
+    tmp_path = pcm_path + ".part"
+    fmt, codec = _DTYPES[PCM_CACHE_DTYPE]
+
+    cmd = [
+        AudioSegment.converter,
+        "-v", "error",
+        "-i", audio_path,
+        "-vn",
+        "-f", fmt,
+        "-acodec", codec,
+        "-ac", str(channels),
+        "-ar", str(sr),
+        "-",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = proc.stdout.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {stderr.decode(errors='replace')}")
+
+        itemsize = np.dtype(PCM_CACHE_DTYPE).itemsize
+        frames = os.path.getsize(tmp_path) // (itemsize * channels)
+        write_meta(meta_path, {
+            "sr": sr,
+            "channels": channels,
+            "frames": frames,
+            "dtype": PCM_CACHE_DTYPE,
+        })
+        os.replace(tmp_path, pcm_path)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _evict(keep_key: str) -> None:
+    """Drop least-recently-used entries until the directory fits the budget."""
+    entries = []
+    total = 0
+    for name in os.listdir(PCM_CACHE_DIR):
+        if not name.endswith(".pcm"):
+            continue
+        path = os.path.join(PCM_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name[:-4]))
+        total += st.st_size
+
+    for _, size, key in sorted(entries):
+        if total <= PCM_CACHE_MAX_BYTES:
+            break
+        if key == keep_key:
+            continue
+        for path in _paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already gone, or still mapped by a reader on Windows
+        total -= size
+
+
+def open_pcm(audio_path: str, sr: int, channels: int) -> Tuple[np.memmap, int]:
+    """
+    Memory-map the cached PCM for a source, decoding it first on a miss.
+
+    Returns:
+        Tuple of (memmap shaped (frames, channels), sample_rate)
+    """
+    key = _cache_key(audio_path)
+    pcm_path, meta_path = _paths(key)
+
+    # One build per source at a time; other requests for it wait on the same lock
+    with lock_for("pcm", key):
+        if not os.path.exists(pcm_path):
+            _build(audio_path, key, sr, channels)
+            _evict(keep_key=key)
+
+        meta = read_meta(meta_path)
+        # Mark as recently used for eviction
+        os.utime(pcm_path)
+
+    mm = np.memmap(
+        pcm_path,
+        dtype=meta["dtype"],
+        mode="r",
+        shape=(meta["frames"], meta["channels"]),
+    )
+    return mm, meta["sr"]
+
+
+def read_region(
+    audio_path: str,
+    start_frame: int,
+    frames: int,
+    sr: int,
+    channels: int,
+) -> Tuple[np.ndarray, int]:
+    """
+    Slice a region out of the PCM cache.
+
+    float32 caches return a view into the memmap (no copy); int16 caches are
+    converted for the region only.
+
+    Returns:
+        Tuple of (samples shaped (channels, frames) as float32, sample_rate)
+    """
+    mm, cached_sr = open_pcm(audio_path, sr, channels)
+    return to_float32(mm[start_frame:start_frame + frames]), cached_sr
+
+
+def to_float32(rows: np.ndarray) -> np.ndarray:
+    """
+    Turn cached rows shaped (frames, channels) into (channels, frames) float32.
+    float32 caches give a view (no copy); int16 rows are converted.
+    """
+    samples = rows.T
+    if samples.dtype != np.float32:
+        samples = samples.astype(np.float32) / 32768.0
+    return samples
@@ -0,0 +1,153 @@
+"""
+Shared LLM provider clients with bounded connection pools.
+
+One client per provider per process: sessions and requests reuse its pooled
+keep-alive connections instead of paying a TCP/TLS handshake each time. Pool
+sizes and keep-alive are tunable, and each provider has an optional
+concurrency cap plus in-flight gauges (in /health) to size them against.
+
+    PROVIDER_MAX_CONNECTIONS:  open connections per provider client (default 100)
+    PROVIDER_MAX_KEEPALIVE:    idle connections kept open (default 20)
+    PROVIDER_KEEPALIVE_SEC:    how long an idle connection is kept (default 30)
+    GEMINI_MAX_CONCURRENCY / OPENAI_MAX_CONCURRENCY:
+                               requests in flight per provider; extra ones wait
+                               (0 = unlimited, the default)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+load_dotenv()
+
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS") or "100")
+PROVIDER_MAX_KEEPALIVE = int(os.getenv("PROVIDER_MAX_KEEPALIVE") or "20")
+PROVIDER_KEEPALIVE_SEC = float(os.getenv("PROVIDER_KEEPALIVE_SEC") or "30")
+
+_MAX_CONCURRENCY = {
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY") or "0"),
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY") or "0"),
+}
+
+_clients_lock = threading.Lock()
+_gemini: Optional[genai.Client] = None
+_openai: Optional[AsyncOpenAI] = None
+
+# Created lazily: a semaphore belongs to the event loop that first uses it
+_semaphores: Dict[str, Optional[asyncio.Semaphore]] = {}
+
+_stats_lock = threading.Lock()
+_stats = {
+    provider: {"requests": 0, "errors": 0, "inFlight": 0, "peakInFlight": 0, "waiting": 0, "waitSec": 0.0}
+    for provider in _MAX_CONCURRENCY
+}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=PROVIDER_MAX_CONNECTIONS,
+        max_keepalive_connections=PROVIDER_MAX_KEEPALIVE,
+        keepalive_expiry=PROVIDER_KEEPALIVE_SEC,
+    )
+
+
+def gemini() -> genai.Client:
+    """The process-wide Gemini client."""
+    global _gemini
+    with _clients_lock:
+        if _gemini is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise RuntimeError(
+                    "Missing GEMINI_API_KEY. Create backend/.env with:\n\n"
+                    "GEMINI_API_KEY=YOUR_KEY_HERE\n"
+                )
+            # Extra kwargs for the SDK's own httpx clients (sync and client.aio)
+            pool = {"limits": _limits()}
+            _gemini = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(client_args=pool, async_client_args=pool),
+            )
+        return _gemini
+
+
+def openai() -> AsyncOpenAI:
+    """The process-wide OpenAI client."""
+    global _openai
+    with _clients_lock:
+        if _openai is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key or api_key == "your_openai_api_key_here":
+                raise RuntimeError(
+                    "Missing OPENAI_API_KEY. Update backend/.env with your OpenAI API key."
+                )
+            # DefaultAsyncHttpxClient keeps the SDK's timeouts and redirect handling
+            _openai = AsyncOpenAI(api_key=api_key, http_client=DefaultAsyncHttpxClient(limits=_limits()))
+        return _openai
+
+
+def _semaphore(provider: str) -> Optional[asyncio.Semaphore]:
+    if provider not in _semaphores:
+        limit = _MAX_CONCURRENCY[provider]
+        _semaphores[provider] = asyncio.Semaphore(limit) if limit > 0 else None
+    return _semaphores[provider]
+
+
+@asynccontextmanager
+async def track(provider: str):
+    """
+    Hold one of the provider's concurrency slots for the duration of a call
+    (for streams: until the last chunk) and keep its gauges current.
+    """
+    stats = _stats[provider]
+    semaphore = _semaphore(provider)
+    if semaphore is not None:
+        with _stats_lock:
+            stats["waiting"] += 1
+        t0 = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            with _stats_lock:
+                stats["waiting"] -= 1
+                stats["waitSec"] += time.perf_counter() - t0
+
+    with _stats_lock:
+        stats["requests"] += 1
+        stats["inFlight"] += 1
+        stats["peakInFlight"] = max(stats["peakInFlight"], stats["inFlight"])
+    try:
+        yield
+    except Exception:
+        with _stats_lock:
+            stats["errors"] += 1
+        raise
+    finally:
+        with _stats_lock:
+            stats["inFlight"] -= 1
+        if semaphore is not None:
+            semaphore.release()
+
+
+def stats() -> Dict:
+    """Per-provider request counters and in-flight gauges, plus the pool settings."""
+    with _stats_lock:
+        providers = {
+            provider: dict(values, waitSec=round(values["waitSec"], 3), maxConcurrency=_MAX_CONCURRENCY[provider])
+            for provider, values in _stats.items()
+        }
+    return dict(
+        providers,
+        maxConnections=PROVIDER_MAX_CONNECTIONS,
+        maxKeepalive=PROVIDER_MAX_KEEPALIVE,
+        keepaliveSec=PROVIDER_KEEPALIVE_SEC,
+    )
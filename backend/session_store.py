@@ -0,0 +1,206 @@
+"""
+Bounded, optionally shared storage for chat sessions.
+
+A session is a JSON-serialisable record: provider, model, generation settings
+and the conversation history. Provider clients rebuild their chat objects from
+it on every turn instead of keeping them in per-process dicts, so sessions are
+bounded, survive restarts (SQLite backend) and are visible to every uvicorn
+worker.
+
+Backends (SESSION_STORE):
+    memory: in-process, idle TTL + byte budget with LRU eviction (default)
+    sqlite: file at SESSION_STORE_PATH, shared across processes, same limits
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_STORE = (os.getenv("SESSION_STORE") or "memory").strip().lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH") or "storage/sessions.db"
+# Sessions idle for longer than this are dropped
+SESSION_TTL_SEC = float(os.getenv("SESSION_TTL_SEC") or 6 * 3600)
+# Total serialized size of all sessions before least-recently-used ones are evicted
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES") or 512 * 1024 ** 2)
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "saved": 0, "expired": 0, "evicted": 0}
+
+
+def _count(name: str, n: int = 1) -> None:
+    if n:
+        with _stats_lock:
+            _stats[name] += n
+
+
+class MemorySessionStore:
+    """Per-process store; the LRU order doubles as the idle order."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # session_id -> (last_access, serialized record)
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+
+    def _drop(self, session_id: str) -> None:
+        _, data = self._items.pop(session_id)
+        self._bytes -= len(data)
+
+    def _expire(self, now: float) -> None:
+        while self._items:
+            session_id, (last_access, _) = next(iter(self._items.items()))
+            if now - last_access <= SESSION_TTL_SEC:
+                break
+            self._drop(session_id)
+            _count("expired")
+
+    def get(self, session_id: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            item = self._items.get(session_id)
+            if item is None:
+                return None
+            self._items[session_id] = (now, item[1])
+            self._items.move_to_end(session_id)
+            return item[1]
+
+    def put(self, session_id: str, data: str) -> None:
+        now = time.time()
+        with self._lock:
+            if session_id in self._items:
+                self._drop(session_id)
+            self._items[session_id] = (now, data)
+            self._bytes += len(data)
+            self._expire(now)
+            while self._bytes > SESSION_MAX_BYTES and len(self._items) > 1:
+                self._drop(next(iter(self._items)))
+                _count("evicted")
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            if session_id in self._items:
+                self._drop(session_id)
+
+    def usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._items), "bytes": self._bytes}
+
+
+class SQLiteSessionStore:
+    """Store shared by every process that points at the same database file."""
+
+    def __init__(self, path: str):
+        self._path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation: safe across threads and processes
+        return sqlite3.connect(self._path, timeout=10)
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> None:
+        cur = conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - SESSION_TTL_SEC,))
+        _count("expired", cur.rowcount)
+
+    def get(self, session_id: str) -> Optional[str]:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT data, last_access FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > SESSION_TTL_SEC:
+                conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                _count("expired")
+                return None
+            conn.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+            return row[0]
+
+    def put(self, session_id: str, data: str) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, size, last_access) VALUES (?, ?, ?, ?)",
+                (session_id, data, len(data), now),
+            )
+            self._expire(conn, now)
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+            if total <= SESSION_MAX_BYTES:
+                return
+            # Oldest first, never the session that was just written
+            rows = conn.execute(
+                "SELECT id, size FROM sessions WHERE id != ? ORDER BY last_access", (session_id,)
+            ).fetchall()
+            for victim, size in rows:
+                if total <= SESSION_MAX_BYTES:
+                    break
+                conn.execute("DELETE FROM sessions WHERE id = ?", (victim,))
+                total -= size
+                _count("evicted")
+
+    def delete(self, session_id: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def usage(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn, conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        return {"sessions": count, "bytes": size}
+
+
+def _create_store():
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore(SESSION_STORE_PATH)
+    if SESSION_STORE != "memory":
+        print(f"Unknown SESSION_STORE '{SESSION_STORE}', using memory")
+    return MemorySessionStore()
+
+
+_store = _create_store()
+
+
+def get_session(session_id: str) -> Optional[Dict]:
+    """Session record, or None if it never existed, expired or was evicted. Refreshes its idle timer."""
+    data = _store.get(session_id)
+    if data is None:
+        _count("misses")
+        return None
+    _count("hits")
+    return json.loads(data)
+
+
+def save_session(session_id: str, record: Dict) -> None:
+    """Create or replace a session record."""
+    _store.put(session_id, json.dumps(record, separators=(",", ":")))
+    _count("saved")
+
+
+def delete_session(session_id: str) -> None:
+    _store.delete(session_id)
+
+
+def stats() -> Dict:
+    """Counters for this process plus the store's current size."""
+    with _stats_lock:
+        counters = dict(_stats)
+    return dict(counters, backend=SESSION_STORE, maxBytes=SESSION_MAX_BYTES, ttlSec=SESSION_TTL_SEC, **_store.usage())
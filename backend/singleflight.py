@@ -0,0 +1,72 @@
+"""
+Coalescing of identical concurrent work ("singleflight").
+
+When a shared link sends several people to /api/analyze with the same track,
+region and settings within seconds, only the first request (the leader)
+runs the computation; duplicates that arrive while it is in flight attach
+to it and receive the same result or exception. Nothing is kept once the
+computation finishes: later requests rely on the analysis cache instead.
+
+The computation runs in its own task, so a waiter whose client disconnects
+is cancelled alone; the leader's work continues for everyone else.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+_lock = threading.Lock()
+_in_flight: Dict[str, "asyncio.Task"] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def make_key(group: str, params: Dict) -> str:
+    """Key for one group ("prepare", "llm", ...) over JSON-serialisable parameters."""
+    ident = json.dumps({"group": group, "params": params}, sort_keys=True, default=str)
+    return f"{group}:{hashlib.sha256(ident.encode('utf-8')).hexdigest()}"
+
+
+def _count(group: str, name: str) -> None:
+    with _lock:
+        counters = _stats.setdefault(group, {"leaders": 0, "coalesced": 0, "failures": 0})
+        counters[name] += 1
+
+
+async def do(key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """
+    Run fn() unless an identical call (same key) is already in flight.
+
+    Args:
+        key: From make_key; the part before ":" names the counter group
+        fn: Zero-argument coroutine function doing the work
+
+    Returns:
+        Tuple of (result, shared) where shared is True for requests that
+        attached to another request's computation
+    """
+    group = key.split(":", 1)[0]
+    with _lock:
+        task = _in_flight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            _in_flight[key] = task
+            task.add_done_callback(lambda t: _forget(key, t))
+    _count(group, "coalesced" if shared else "leaders")
+    return await asyncio.shield(task), shared
+
+
+def _forget(key: str, task: "asyncio.Task") -> None:
+    with _lock:
+        if _in_flight.get(key) is task:
+            del _in_flight[key]
+    if not task.cancelled() and task.exception() is not None:
+        _count(key.split(":", 1)[0], "failures")
+
+
+def stats() -> Dict:
+    """Leader/coalesced/failure counters per group, plus computations in flight."""
+    with _lock:
+        return dict({group: dict(counters) for group, counters in _stats.items()}, inFlight=len(_in_flight))
@@ -0,0 +1,78 @@
+"""
+Compact binary encoding of mel spectrogram matrices for client-side rendering.
+
+Payload layout (little-endian):
+    4 bytes   magic b"MELS"
+    4 bytes   uint32 header length N
+    N bytes   UTF-8 JSON header (dtype, shape, frame/hop/mel-bin metadata)
+    rest      matrix values, row-major: n_mels rows (lowest band first) x frames
+"""
+
+import json
+import struct
+
+import numpy as np
+
+PAYLOAD_MAGIC = b"MELS"
+SUPPORTED_DTYPES = ("uint8", "float16")
+
+
+def encode_mel_payload(
+    S_dB: np.ndarray,
+    sr: int,
+    hop_length: int,
+    fmax: float,
+    start_sec: float = 0.0,
+    dtype: str = "uint8",
+) -> bytes:
+    """
+    Pack a mel dB matrix into the binary payload.
+
+    uint8 quantizes linearly over [dbMin, dbMax] (1 byte per bin); decode with
+    ``db = value * scale + dbMin``. float16 keeps the dB values directly.
+
+    Args:
+        S_dB: (n_mels, frames) dB matrix
+        sr: Sample rate the matrix was computed at
+        hop_length: STFT hop in samples (frame spacing)
+        fmax: Highest mel band frequency
+        start_sec: Region start, so clients can place frames on the track timeline
+        dtype: "uint8" or "float16"
+
+    Returns:
+        Payload bytes
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype!r}; expected one of {SUPPORTED_DTYPES}")
+
+    n_mels, frames = S_dB.shape
+    db_min, db_max = float(S_dB.min()), float(S_dB.max())
+
+    header = {
+        "dtype": dtype,
+        "nMels": n_mels,
+        "frames": frames,
+        "sr": sr,
+        "hopLength": hop_length,
+        "frameSec": hop_length / float(sr),
+        "fmin": 0.0,
+        "fmax": float(fmax),
+        "startSec": float(start_sec),
+        "dbMin": db_min,
+        "dbMax": db_max,
+    }
+
+    if dtype == "uint8":
+        scale = max(db_max - db_min, 1e-6) / 255.0
+        header["scale"] = scale
+        values = np.round((S_dB - db_min) / scale).clip(0, 255).astype(np.uint8)
+    else:
+        values = S_dB.astype("<f2")
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    return b"".join([
+        PAYLOAD_MAGIC,
+        struct.pack("<I", len(header_bytes)),
+        header_bytes,
+        np.ascontiguousarray(values).tobytes(),
+    ])
@@ -0,0 +1,246 @@
+"""
+Reentrant spectrogram renderer.
+
+Maps a dB matrix to RGB through a precomputed colormap lookup table with
+vectorized NumPy and encodes the PNG directly with Pillow. Nothing here touches
+pyplot's global figure state, so concurrent requests in FastAPI's threadpool
+render independently. Axis, title and colorbar overlays are optional.
+"""
+
+import io
+import os
+from typing import List, Tuple
+
+import librosa
+import numpy as np
+from matplotlib import colormaps
+from PIL import Image, ImageDraw, ImageFont
+
+# Same pixel size as the previous pyplot output (10x4 inches at 160 dpi)
+IMAGE_WIDTH = 1600
+IMAGE_HEIGHT = 640
+
+# "fast" (LUT + Pillow) or "matplotlib" (object-oriented Figure, no pyplot)
+SPECTROGRAM_RENDERER = os.getenv("SPECTROGRAM_RENDERER") or "fast"
+
+# specshow's default colormap for dB data; built once, read-only afterwards
+COLORMAP_LUT = (colormaps["magma"](np.linspace(0.0, 1.0, 256))[:, :3] * 255).round().astype(np.uint8)
+
+# Plot area placement when overlays are drawn (roughly the old tight_layout)
+_MARGIN_LEFT = 110
+_MARGIN_RIGHT = 190
+_MARGIN_TOP = 50
+_MARGIN_BOTTOM = 70
+_COLORBAR_GAP = 40
+_COLORBAR_WIDTH = 36
+
+_BACKGROUND = (255, 255, 255)
+_FOREGROUND = (0, 0, 0)
+
+# Mel-axis tick positions used by librosa's mel formatter
+_MEL_TICKS_HZ = [0, 512, 1024, 2048, 4096, 8192, 16384]
+_TIME_STEPS_SEC = [0.1, 0.2, 0.5, 1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600]
+
+
+def _load_font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only ships the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+_TITLE_FONT = _load_font(22)
+_LABEL_FONT = _load_font(18)
+_TICK_FONT = _load_font(15)
+
+
+def _nearest_indices(n_src: int, n_dst: int) -> np.ndarray:
+    """Nearest-neighbour source index for every destination pixel."""
+    return np.minimum((np.arange(n_dst) * n_src) // max(n_dst, 1), n_src - 1)
+
+
+def colorize(
+    S_dB: np.ndarray,
+    width: int,
+    height: int,
+    vmin: float,
+    vmax: float,
+) -> np.ndarray:
+    """
+    Map a (n_mels, frames) dB matrix to an RGB image of the given size.
+
+    Low frequencies end up at the bottom, as in specshow.
+
+    Returns:
+        uint8 array shaped (height, width, 3)
+    """
+    scale = 255.0 / max(vmax - vmin, 1e-6)
+    idx = np.clip((S_dB - vmin) * scale, 0, 255).astype(np.uint8)[::-1]
+    rows = _nearest_indices(idx.shape[0], height)
+    cols = _nearest_indices(idx.shape[1], width)
+    return COLORMAP_LUT[idx[np.ix_(rows, cols)]]
+
+
+def _encode_png(rgb: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(rgb, mode="RGB").save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def _draw_text(
+    draw: ImageDraw.ImageDraw,
+    xy: Tuple[float, float],
+    text: str,
+    font: ImageFont.ImageFont,
+    align: str = "center",
+) -> None:
+    """Draw text centered vertically on xy; align is left/center/right horizontally."""
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    w, h = right - left, bottom - top
+    x, y = xy
+    if align == "center":
+        x -= w / 2
+    elif align == "right":
+        x -= w
+    draw.text((x - left, y - h / 2 - top), text, fill=_FOREGROUND, font=font)
+
+
+def _format_time(t: float, step: float) -> str:
+    if step >= 60 or t >= 60:
+        return f"{int(t // 60)}:{int(round(t % 60)):02d}"
+    return f"{t:g}"
+
+
+def _time_ticks(duration: float) -> List[float]:
+    step = next((s for s in _TIME_STEPS_SEC if duration / s <= 10), _TIME_STEPS_SEC[-1])
+    return [i * step for i in range(int(duration // step) + 1)]
+
+
+def _draw_overlays(
+    canvas: np.ndarray,
+    S_dB: np.ndarray,
+    sr: int,
+    hop_length: int,
+    fmax: float,
+    vmin: float,
+    vmax: float,
+) -> Image.Image:
+    height, width = canvas.shape[:2]
+    plot_w = width - _MARGIN_LEFT - _MARGIN_RIGHT
+    plot_h = height - _MARGIN_TOP - _MARGIN_BOTTOM
+    x0, y0 = _MARGIN_LEFT, _MARGIN_TOP
+    x1, y1 = x0 + plot_w, y0 + plot_h
+
+    canvas[y0:y1, x0:x1] = colorize(S_dB, plot_w, plot_h, vmin, vmax)
+
+    # Colorbar: vertical gradient, top = vmax
+    cb_x0 = x1 + _COLORBAR_GAP
+    cb_x1 = cb_x0 + _COLORBAR_WIDTH
+    gradient = _nearest_indices(256, plot_h)[::-1]
+    canvas[y0:y1, cb_x0:cb_x1] = COLORMAP_LUT[gradient][:, None, :]
+
+    img = Image.fromarray(canvas, mode="RGB")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([x0 - 1, y0 - 1, x1, y1], outline=_FOREGROUND)
+    draw.rectangle([cb_x0 - 1, y0 - 1, cb_x1, y1], outline=_FOREGROUND)
+
+    _draw_text(draw, ((x0 + x1) / 2, y0 / 2), "Mel-frequency spectrogram", _TITLE_FONT)
+
+    # Time axis
+    duration = S_dB.shape[1] * hop_length / float(sr)
+    ticks = _time_ticks(duration)
+    step = ticks[1] - ticks[0] if len(ticks) > 1 else duration
+    for t in ticks:
+        x = x0 + (t / duration) * plot_w if duration > 0 else x0
+        draw.line([x, y1, x, y1 + 6], fill=_FOREGROUND)
+        _draw_text(draw, (x, y1 + 18), _format_time(t, step), _TICK_FONT)
+    _draw_text(draw, ((x0 + x1) / 2, y1 + 48), "Time", _LABEL_FONT)
+
+    # Mel axis labelled in Hz
+    mel_max = librosa.hz_to_mel(fmax)
+    for hz in _MEL_TICKS_HZ:
+        if hz > fmax:
+            break
+        y = y1 - (librosa.hz_to_mel(hz) / mel_max) * plot_h
+        draw.line([x0 - 6, y, x0, y], fill=_FOREGROUND)
+        _draw_text(draw, (x0 - 10, y), str(hz), _TICK_FONT, align="right")
+    _draw_text(draw, (30, (y0 + y1) / 2), "Hz", _LABEL_FONT)
+
+    # Colorbar ticks every 10 dB
+    span = max(vmax - vmin, 1e-6)
+    db = np.ceil(vmin / 10.0) * 10.0
+    while db <= vmax:
+        y = y1 - ((db - vmin) / span) * plot_h
+        draw.line([cb_x1, y, cb_x1 + 6, y], fill=_FOREGROUND)
+        _draw_text(draw, (cb_x1 + 10, y), f"{db:+2.0f} dB", _TICK_FONT, align="left")
+        db += 10.0
+
+    return img
+
+
+def _render_matplotlib(S_dB: np.ndarray, sr: int, hop_length: int, fmax: float) -> bytes:
+    """
+    The original specshow look, drawn on a standalone Figure.
+    Uses the object-oriented API so it stays thread-safe.
+    """
+    import librosa.display
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(IMAGE_WIDTH / 160, IMAGE_HEIGHT / 160))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    img = librosa.display.specshow(
+        S_dB, x_axis="time", y_axis="mel", sr=sr, hop_length=hop_length, fmax=fmax, ax=ax
+    )
+    fig.colorbar(img, ax=ax, format="%+2.0f dB")
+    ax.set_title("Mel-frequency spectrogram")
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=160)
+    return buf.getvalue()
+
+
+def render_spectrogram_png(
+    S_dB: np.ndarray,
+    sr: int,
+    hop_length: int = 512,
+    fmax: float = 16000,
+    overlays: bool = True,
+    width: int = IMAGE_WIDTH,
+    height: int = IMAGE_HEIGHT,
+) -> bytes:
+    """
+    Render a mel dB matrix to PNG bytes.
+
+    Args:
+        S_dB: (n_mels, frames) dB matrix
+        sr: Sample rate the matrix was computed at
+        hop_length: STFT hop used for the time axis
+        fmax: Highest mel band frequency, for the Hz axis
+        overlays: Draw title, axes and colorbar; otherwise the image is the bare spectrogram
+        width, height: Output size in pixels
+
+    Returns:
+        PNG bytes
+    """
+    if S_dB.size == 0:
+        raise ValueError("Spectrogram is empty.")
+
+    if SPECTROGRAM_RENDERER == "matplotlib" and overlays:
+        return _render_matplotlib(S_dB, sr, hop_length, fmax)
+
+    vmin, vmax = float(S_dB.min()), float(S_dB.max())
+
+    if not overlays:
+        return _encode_png(colorize(S_dB, width, height, vmin, vmax))
+
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = _BACKGROUND
+    img = _draw_overlays(canvas, S_dB, sr, hop_length, fmax, vmin, vmax)
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
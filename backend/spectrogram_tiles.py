@@ -0,0 +1,275 @@
+"""
+Full-track mel spectrogram and multi-resolution tile pyramid.
+
+The mel spectrogram of the whole track is computed once, block by block, and
+kept on disk next to the stored track. From it a zoom pyramid is built: level 0
+has one column per STFT frame, each further level halves the time resolution
+(max-pooled so transients stay visible). Tiles are PNG slices of a level,
+rendered lazily and cached, so zooming and panning never recompute the STFT.
+
+On-disk layout under the track directory:
+    spectrogram/meta.json
+    spectrogram/mel_db.npy        float16 absolute dB, (n_mels, frames)
+    spectrogram/level_<k>.npy     uint8 colormap indices per level
+    spectrogram/tiles/<k>/<i>.png
+"""
+
+import io
+import os
+import threading
+from typing import Dict, Tuple
+
+import librosa
+import numpy as np
+from PIL import Image
+
+import dsp_executor
+from audio_processor import MEL_HOP_LENGTH, probe_audio, stream_frames
+from build_utils import lock_for, read_meta, write_meta
+from spectrogram_renderer import COLORMAP_LUT
+from track_store import get_track_dir, get_track_path
+
+PYRAMID_N_MELS = 128
+PYRAMID_FMAX = 16000
+PYRAMID_N_FFT = 2048
+PYRAMID_TOP_DB = 80.0
+# Columns per tile image
+TILE_WIDTH = 256
+# STFT frames processed per block while streaming through the track
+_BLOCK_FRAMES = 4096
+
+
+def _spec_dir(track_id: str) -> str:
+    return os.path.join(get_track_dir(track_id), "spectrogram")
+
+
+class MelStream:
+    """
+    Centered mel STFT over a track fed front to back in mono blocks of any
+    size, written into a (n_mels, frames) array as it goes.
+
+    The signal is zero-padded by n_fft/2 at both ends like librosa's centered
+    STFT and each batch is computed with center=False on a window overlapping
+    the previous one by n_fft - hop samples, so frame boundaries and values
+    match a whole-file computation.
+    """
+
+    def __init__(self, out: np.ndarray, sr: int):
+        self.out = out
+        self.sr = sr
+        self.frames = 0
+        self._buf = np.zeros(PYRAMID_N_FFT // 2, dtype=np.float32)
+
+    def feed(self, y: np.ndarray) -> None:
+        self._buf = np.concatenate([self._buf, y])
+        batch = (_BLOCK_FRAMES - 1) * MEL_HOP_LENGTH + PYRAMID_N_FFT
+        while self._buf.size >= batch:
+            self._emit(_BLOCK_FRAMES)
+
+    def close(self) -> None:
+        """Flush the tail; frames the decode fell short of stay silent."""
+        self._buf = np.concatenate([self._buf, np.zeros(PYRAMID_N_FFT // 2, dtype=np.float32)])
+        if self._buf.size >= PYRAMID_N_FFT:
+            self._emit(1 + (self._buf.size - PYRAMID_N_FFT) // MEL_HOP_LENGTH)
+        if self.frames < self.out.shape[1]:
+            self.out[:, self.frames:] = librosa.power_to_db(np.zeros(1), ref=1.0, top_db=None)[0]
+
+    def _emit(self, n: int) -> None:
+        S = librosa.feature.melspectrogram(
+            y=self._buf[:(n - 1) * MEL_HOP_LENGTH + PYRAMID_N_FFT], sr=self.sr,
+            n_fft=PYRAMID_N_FFT, hop_length=MEL_HOP_LENGTH,
+            n_mels=PYRAMID_N_MELS, fmax=PYRAMID_FMAX, center=False,
+        )
+        f0 = self.frames
+        f1 = min(self.out.shape[1], f0 + n)
+        if f1 > f0:
+            self.out[:, f0:f1] = librosa.power_to_db(S, ref=1.0, top_db=None)[:, :f1 - f0]
+        self.frames += n
+        self._buf = self._buf[n * MEL_HOP_LENGTH:]
+
+
+def open_mel(out_path: str, sr: int, duration_sec: float) -> Tuple[np.memmap, MelStream]:
+    """
+    Create the float16 mel memmap for a track and a stream that fills it.
+    The frame count follows from the probed duration.
+    """
+    total_frames = 1 + int(duration_sec * sr) // MEL_HOP_LENGTH
+    mel = np.lib.format.open_memmap(
+        out_path, mode="w+", dtype=np.float16, shape=(PYRAMID_N_MELS, total_frames)
+    )
+    return mel, MelStream(mel, sr)
+
+
+def _compute_mel_db(audio_path: str, out_path: str) -> Tuple[int, int]:
+    """
+    Stream the track through the mel filterbank into a float16 memmap with a
+    single sequential decode.
+
+    Returns:
+        Tuple of (sample_rate, total_frames)
+    """
+    sr, channels, duration_sec = probe_audio(audio_path)
+    mel, stream = open_mel(out_path, sr, duration_sec)
+
+    for block in stream_frames(audio_path, sr, channels, duration_sec, _BLOCK_FRAMES * MEL_HOP_LENGTH):
+        stream.feed(block.mono())
+    stream.close()
+
+    mel.flush()
+    return sr, mel.shape[1]
+
+
+def _build_levels(spec_dir: str, mel_path: str) -> int:
+    """
+    Quantize the mel matrix to colormap indices and build the pyramid levels.
+
+    Returns:
+        Number of levels
+    """
+    mel = np.load(mel_path, mmap_mode="r")
+    n_mels, frames = mel.shape
+
+    db_max = max((float(mel[:, i:i + _BLOCK_FRAMES].max()) for i in range(0, frames, _BLOCK_FRAMES)), default=0.0)
+    db_min = db_max - PYRAMID_TOP_DB
+    scale = 255.0 / PYRAMID_TOP_DB
+
+    level0 = np.lib.format.open_memmap(
+        os.path.join(spec_dir, "level_0.npy"), mode="w+", dtype=np.uint8, shape=(n_mels, frames)
+    )
+    for i in range(0, frames, _BLOCK_FRAMES):
+        block = mel[:, i:i + _BLOCK_FRAMES].astype(np.float32)
+        level0[:, i:i + _BLOCK_FRAMES] = np.clip((block - db_min) * scale, 0, 255).astype(np.uint8)
+    level0.flush()
+
+    levels = 1
+    prev = level0
+    while prev.shape[1] > TILE_WIDTH:
+        cols = (prev.shape[1] + 1) // 2
+        cur = np.lib.format.open_memmap(
+            os.path.join(spec_dir, f"level_{levels}.npy"), mode="w+", dtype=np.uint8, shape=(n_mels, cols)
+        )
+        step = _BLOCK_FRAMES * 2
+        for i in range(0, prev.shape[1], step):
+            block = np.asarray(prev[:, i:i + step])
+            if block.shape[1] % 2:
+                block = np.concatenate([block, block[:, -1:]], axis=1)
+            cur[:, i // 2:i // 2 + block.shape[1] // 2] = block.reshape(n_mels, -1, 2).max(axis=2)
+        cur.flush()
+        prev = cur
+        levels += 1
+
+    return levels
+
+
+def mel_db_path(track_id: str) -> str:
+    """Path of the track's full-track mel dB matrix."""
+    return os.path.join(_spec_dir(track_id), "mel_db.npy")
+
+
+def pyramid_lock(track_id: str) -> threading.Lock:
+    """Held while a track's mel and pyramid are built."""
+    return lock_for("pyramid", track_id)
+
+
+def pyramid_ready(track_id: str) -> bool:
+    """True once the mel and pyramid of a track have been fully built."""
+    return os.path.exists(os.path.join(_spec_dir(track_id), "meta.json"))
+
+
+def finish_pyramid(track_id: str, sr: int, frames: int) -> Dict:
+    """
+    Build the pyramid levels from a freshly written mel_db.npy and write the
+    pyramid metadata. The caller holds ``pyramid_lock``.
+
+    Returns:
+        Pyramid metadata
+    """
+    spec_dir = _spec_dir(track_id)
+    levels = _build_levels(spec_dir, mel_db_path(track_id))
+
+    frame_sec = MEL_HOP_LENGTH / float(sr)
+    meta = {
+        "trackId": track_id,
+        "sr": sr,
+        "hopLength": MEL_HOP_LENGTH,
+        "nFft": PYRAMID_N_FFT,
+        "nMels": PYRAMID_N_MELS,
+        "fmax": PYRAMID_FMAX,
+        "topDb": PYRAMID_TOP_DB,
+        "frames": frames,
+        "frameSec": frame_sec,
+        "tileWidth": TILE_WIDTH,
+        "levels": [
+            {
+                "level": k,
+                "columns": (frames + (1 << k) - 1) >> k,
+                "secondsPerColumn": frame_sec * (1 << k),
+                "tiles": -(-((frames + (1 << k) - 1) >> k) // TILE_WIDTH),
+            }
+            for k in range(levels)
+        ],
+    }
+    write_meta(os.path.join(spec_dir, "meta.json"), meta)
+    return meta
+
+
+def _build_pyramid(track_id: str) -> None:
+    """DSP worker entry point: mel and pyramid for a track."""
+    sr, frames = _compute_mel_db(get_track_path(track_id), mel_db_path(track_id))
+    finish_pyramid(track_id, sr, frames)
+
+
+def ensure_pyramid(track_id: str) -> Dict:
+    """
+    Build the full-track mel and pyramid for a track if needed.
+
+    The build runs in the DSP process pool. It waits for a free slot rather
+    than failing, since its result is kept for good.
+
+    Returns:
+        Pyramid metadata (see ``/api/tracks/{id}/spectrogram/pyramid``)
+    """
+    spec_dir = _spec_dir(track_id)
+    meta_path = os.path.join(spec_dir, "meta.json")
+
+    with pyramid_lock(track_id):
+        if not os.path.exists(meta_path):
+            get_track_path(track_id)  # KeyError for unknown tracks before anything is created
+            os.makedirs(spec_dir, exist_ok=True)
+            dsp_executor.submit_call(_build_pyramid, track_id, timeout=None).result()
+
+    return read_meta(meta_path)
+
+
+def get_tile_path(track_id: str, level: int, index: int) -> str:
+    """
+    Path to a rendered tile PNG, rendering and caching it on first access.
+
+    Raises:
+        IndexError: if level or index is out of range
+    """
+    meta = ensure_pyramid(track_id)
+    if not 0 <= level < len(meta["levels"]):
+        raise IndexError(f"Level {level} out of range")
+    if not 0 <= index < meta["levels"][level]["tiles"]:
+        raise IndexError(f"Tile {index} out of range")
+
+    spec_dir = _spec_dir(track_id)
+    tile_path = os.path.join(spec_dir, "tiles", str(level), f"{index}.png")
+    if os.path.exists(tile_path):
+        return tile_path
+
+    data = np.load(os.path.join(spec_dir, f"level_{level}.npy"), mmap_mode="r")
+    cols = np.asarray(data[:, index * TILE_WIDTH:(index + 1) * TILE_WIDTH])
+    # Lowest band at the bottom
+    rgb = COLORMAP_LUT[cols[::-1]]
+
+    buf = io.BytesIO()
+    Image.fromarray(rgb, mode="RGB").save(buf, format="PNG", compress_level=1)
+
+    os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+    tmp_path = f"{tile_path}.{threading.get_ident()}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(tmp_path, tile_path)
+    return tile_path
@@ -0,0 +1,121 @@
+"""
+Content-addressed storage for uploaded audio tracks.
+
+Each upload is stored once under the SHA-256 of its bytes, so the frontend can
+upload a master a single time and refer to it by ``trackId`` for every region
+request afterwards. Uploading the same bytes again resolves to the same track.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Empty (as in a copied .env.example) means unset
+TRACK_STORE_DIR = os.getenv("TRACK_STORE_DIR") or "storage/tracks"
+os.makedirs(TRACK_STORE_DIR, exist_ok=True)
+
+_CHUNK_SIZE = 1024 * 1024
+_TRACK_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+_SOURCE_PREFIX = "source"
+_META_FILE = "meta.json"
+
+# Serializes the final rename so two identical uploads can't race each other
+_store_lock = threading.Lock()
+
+
+def is_valid_track_id(track_id: str) -> bool:
+    """Track IDs are lowercase hex SHA-256 digests."""
+    return bool(track_id) and bool(_TRACK_ID_RE.match(track_id))
+
+
+def get_track_dir(track_id: str) -> str:
+    """Directory holding the source file and any per-track artifacts."""
+    if not is_valid_track_id(track_id):
+        raise ValueError(f"Invalid track ID: {track_id!r}")
+    return os.path.join(TRACK_STORE_DIR, track_id)
+
+
+def save_track(fileobj: BinaryIO, filename: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    Stream an upload into the store, hashing it on the way.
+
+    Args:
+        fileobj: Readable binary file object (e.g. ``UploadFile.file``)
+        filename: Original filename, used only to keep the extension
+
+    Returns:
+        Tuple of (track_id, created) where created is False when the same
+        bytes were already stored
+    """
+    suffix = os.path.splitext(filename or "")[1].lower() or ".wav"
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=TRACK_STORE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = fileobj.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+
+        track_id = digest.hexdigest()
+        track_dir = get_track_dir(track_id)
+
+        with _store_lock:
+            if get_track_path(track_id, missing_ok=True):
+                return track_id, False
+
+            os.makedirs(track_dir, exist_ok=True)
+            os.replace(tmp_path, os.path.join(track_dir, _SOURCE_PREFIX + suffix))
+            with open(os.path.join(track_dir, _META_FILE), "w", encoding="utf-8") as f:
+                json.dump({
+                    "trackId": track_id,
+                    "filename": filename,
+                    "sizeBytes": size,
+                    "createdAt": time.time(),
+                }, f)
+        return track_id, True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_track_path(track_id: str, missing_ok: bool = False) -> Optional[str]:
+    """
+    Resolve a track ID to the stored source file.
+
+    Raises:
+        KeyError: if the track does not exist (unless missing_ok)
+    """
+    track_dir = get_track_dir(track_id)
+    if os.path.isdir(track_dir):
+        for name in os.listdir(track_dir):
+            if name.startswith(_SOURCE_PREFIX + "."):
+                return os.path.join(track_dir, name)
+    if missing_ok:
+        return None
+    raise KeyError(f"Track not found: {track_id}")
+
+
+def get_track_meta(track_id: str) -> Dict:
+    """Return stored metadata for a track."""
+    get_track_path(track_id)
+    meta_path = os.path.join(get_track_dir(track_id), _META_FILE)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {"trackId": track_id}
@@ -0,0 +1,126 @@
+"""
+Precomputed min/max waveform peaks at several zoom levels.
+
+One streaming pass over the decoded track produces the finest level; every
+further level halves the resolution by pairwise min/max. The result is cached
+next to the stored track, so the frontend can draw the waveform instantly
+instead of decoding the whole file in the browser.
+"""
+
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+from audio_processor import probe_audio, stream_frames
+from build_utils import lock_for, read_meta, write_meta
+from track_store import get_track_dir, get_track_path
+
+# Samples per peak at the finest level
+PEAKS_BASE_SAMPLES = 256
+# Coarsest level keeps at least this many peaks
+PEAKS_MIN_LENGTH = 512
+# Sample frames decoded per block (a multiple of PEAKS_BASE_SAMPLES)
+_BLOCK_SAMPLES = PEAKS_BASE_SAMPLES * 4096
+
+
+def _paths(track_id: str):
+    track_dir = get_track_dir(track_id)
+    return os.path.join(track_dir, "peaks.npz"), os.path.join(track_dir, "peaks.json")
+
+
+def _compute_peaks(audio_path: str) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """
+    Returns:
+        Tuple of (peaks metadata, arrays by name: min_<k>/max_<k> per level)
+    """
+    sr, channels, duration_sec = probe_audio(audio_path)
+
+    min_blocks, max_blocks = [], []
+    # Every block but the last is a whole multiple of PEAKS_BASE_SAMPLES
+    for block in stream_frames(audio_path, sr, channels, duration_sec, _BLOCK_SAMPLES):
+        y = block.mono()
+        if y.size == 0:
+            continue
+        pad = -y.size % PEAKS_BASE_SAMPLES
+        if pad:
+            y = np.concatenate([y, np.full(pad, y[-1], dtype=np.float32)])
+        blocks = y.reshape(-1, PEAKS_BASE_SAMPLES)
+        min_blocks.append(blocks.min(axis=1))
+        max_blocks.append(blocks.max(axis=1))
+
+    mins = np.concatenate(min_blocks) if min_blocks else np.zeros(0, dtype=np.float32)
+    maxs = np.concatenate(max_blocks) if max_blocks else np.zeros(0, dtype=np.float32)
+
+    levels = {"min_0": mins, "max_0": maxs}
+    level = 0
+    while mins.size > PEAKS_MIN_LENGTH:
+        if mins.size % 2:
+            mins = np.append(mins, mins[-1])
+            maxs = np.append(maxs, maxs[-1])
+        mins = mins.reshape(-1, 2).min(axis=1)
+        maxs = maxs.reshape(-1, 2).max(axis=1)
+        level += 1
+        levels[f"min_{level}"] = mins
+        levels[f"max_{level}"] = maxs
+
+    meta = {
+        "sampleRate": sr,
+        "duration": duration_sec,
+        "levels": [
+            {
+                "level": k,
+                "samplesPerPeak": PEAKS_BASE_SAMPLES << k,
+                "length": int(levels[f"min_{k}"].size),
+            }
+            for k in range(level + 1)
+        ],
+    }
+    return meta, levels
+
+
+def ensure_peaks(track_id: str) -> Dict:
+    """
+    Compute and cache peaks for a track if needed.
+
+    Returns:
+        Peaks metadata (sample rate, duration, per-level sizes)
+    """
+    npz_path, meta_path = _paths(track_id)
+    with lock_for("peaks", track_id):
+        if not os.path.exists(meta_path):
+            meta, levels = _compute_peaks(get_track_path(track_id))
+            tmp_path = npz_path + ".part.npz"
+            np.savez(tmp_path, **levels)
+            os.replace(tmp_path, npz_path)
+            write_meta(meta_path, meta)
+
+    return read_meta(meta_path)
+
+
+def get_peaks(track_id: str, max_peaks: int = 16000) -> Dict:
+    """
+    Peaks at the finest level with at most ``max_peaks`` points.
+
+    Returns:
+        Dict with duration, samplesPerPeak and per-point ``min``/``max`` lists
+    """
+    meta = ensure_peaks(track_id)
+    candidates = [l for l in meta["levels"] if l["length"] <= max_peaks]
+    chosen = candidates[0] if candidates else meta["levels"][-1]
+    k = chosen["level"]
+
+    npz_path, _ = _paths(track_id)
+    with np.load(npz_path) as data:
+        mins = data[f"min_{k}"]
+        maxs = data[f"max_{k}"]
+
+    return {
+        "sampleRate": meta["sampleRate"],
+        "duration": meta["duration"],
+        "level": k,
+        "samplesPerPeak": chosen["samplesPerPeak"],
+        "length": chosen["length"],
+        "min": np.round(mins, 4).tolist(),
+        "max": np.round(maxs, 4).tolist(),
+    }
@@ -1,12 +1,15 @@
 import React, { useMemo, useState, useCallback, useRef, useEffect } from "react";
 import Waveform from "./components/Waveform.jsx";
 import ChordDisplay from "./components/ChordDisplay.jsx";
-import { analyzeAudio, fetchSpectrogram, sendChatMessage } from "./api.js";
+import SpectrogramCanvas from "./components/SpectrogramCanvas.jsx";
+import { analyzeAudioStream, fetchSpectrogram, fetchSpectrogramData, sendChatMessageStream, uploadTrack } from "./api.js";
 import placeholderImg from "./assets/placeholder.png";
 import logoImg from "./assets/logo.png";
 
 export default function App() {
   const [file, setFile] = useState(null);
+  const [trackId, setTrackId] = useState(null);
+  const [uploading, setUploading] = useState(false);
   const [selection, setSelection] = useState({ startSec: 0, endSec: 0, durationSec: 0 });
 
   const [modelId, setModelId] = useState("gemini-3-pro-preview"); // Default to newer model
@@ -37,7 +40,7 @@ export default function App() {
 
   const SUGGESTIONS = mode === "engineer" ? ENGINEER_SUGGESTIONS : PRODUCER_SUGGESTIONS;
 
-  const [spectrogramB64, setSpectrogramB64] = useState("");
+  const [spectrogramData, setSpectrogramData] = useState(null); // Mel matrix rendered client-side
   const [bpm, setBpm] = useState(null);
   const [originalBpm, setOriginalBpm] = useState(null); // Store original detected BPM for ratio calculations
   const [chords, setChords] = useState([]);
@@ -60,18 +63,31 @@ export default function App() {
   }, [chatMessages]);
 
   const canAct = useMemo(() => {
-    return !!file && selection.endSec > selection.startSec;
-  }, [file, selection]);
+    return !!file && !!trackId && selection.endSec > selection.startSec;
+  }, [file, trackId, selection]);
 
-  const onPickFile = (e) => {
+  const onPickFile = async (e) => {
     const f = e.target.files?.[0] || null;
     setFile(f);
+    setTrackId(null);
     setChatMessages([]);
     setSessionId(null);
     setError("");
-    setSpectrogramB64("");
+    setSpectrogramData(null);
     setBpm(null);
     setChords([]);
+    if (!f) return;
+
+    // Upload once; every region request afterwards only sends the trackId
+    setUploading(true);
+    try {
+      const data = await uploadTrack(f);
+      setTrackId(data.trackId);
+    } catch (err) {
+      setError(err?.message || String(err));
+    } finally {
+      setUploading(false);
+    }
   };
 
   const onSelectionChange = useCallback((sel) => {
@@ -83,12 +99,13 @@ export default function App() {
     setError("");
     setLoadingSpec(true);
     try {
-      const data = await fetchSpectrogram({
-        file,
-        startSec: selection.startSec,
-        endSec: selection.endSec,
-      });
-      setSpectrogramB64(data.spectrogramPngBase64);
+      const region = { trackId, startSec: selection.startSec, endSec: selection.endSec };
+      // The matrix is rendered locally, so skip the base64 PNG
+      const [data, specData] = await Promise.all([
+        fetchSpectrogram({ ...region, includeImage: false }),
+        fetchSpectrogramData(region),
+      ]);
+      setSpectrogramData(specData);
       setBpm(data.bpm || null);
       setOriginalBpm(data.bpm || null); // Store original for ratio calculations
       setChords(data.chords || []);
@@ -99,6 +116,16 @@ export default function App() {
     }
   };
 
+  // Append streamed text to the model message that is still arriving
+  const appendToStreamingMessage = (text) => {
+    setChatMessages(prev => prev.map(m => (m.streaming ? { ...m, text: m.text + text } : m)));
+  };
+
+  // Replace the streamed text with the cleaned reply (MIDI blocks removed)
+  const finishStreamingMessage = (text, midiDownloadUrl) => {
+    setChatMessages(prev => prev.map(m => (m.streaming ? { role: "model", text, midiDownloadUrl } : m)));
+  };
+
   const runAnalysis = async () => {
     if (!canAct) return;
     setError("");
@@ -107,13 +134,15 @@ export default function App() {
     setSessionId(null);
 
     try {
-      // Optimistic update
-      setChatMessages([{ role: "user", text: prompt }]);
+      // Optimistic update; the model reply fills in as tokens stream
+      setChatMessages([{ role: "user", text: prompt }, { role: "model", text: "", streaming: true }]);
+
+      const region = { trackId, startSec: selection.startSec, endSec: selection.endSec };
+      const specDataPromise = fetchSpectrogramData(region).catch(() => null);
 
-      const data = await analyzeAudio({
-        file,
-        startSec: selection.startSec,
-        endSec: selection.endSec,
+      const data = await analyzeAudioStream({
+        ...region,
+        includeImage: false,
         prompt,
         modelId,
         temperature,
@@ -121,18 +150,17 @@ export default function App() {
         mode,
         bpm,      // Pass user-edited BPM
         chords,   // Pass user-edited chords
+      }, {
+        // Local analysis is done; show the spectrogram while the model answers
+        onPreamble: async () => setSpectrogramData(await specDataPromise),
+        onToken: appendToStreamingMessage,
       });
 
       setSessionId(data.sessionId);
-      setSpectrogramB64(data.spectrogramPngBase64);
-      setChatMessages(prev => [...prev, {
-        role: "model",
-        text: data.advice,
-        midiDownloadUrl: data.midiDownloadUrl
-      }]);
+      finishStreamingMessage(data.advice, data.midiDownloadUrl);
     } catch (e) {
       setError(e?.message || String(e));
-      setChatMessages(prev => prev.filter(m => m.text !== prompt)); // Remove failed prompt
+      setChatMessages(prev => prev.filter(m => m.text !== prompt && !m.streaming)); // Remove failed prompt
     } finally {
       setLoadingAnalyze(false);
     }
@@ -144,17 +172,14 @@ export default function App() {
     const msg = replyInput;
     setReplyInput("");
 
-    setChatMessages(prev => [...prev, { role: "user", text: msg }]);
+    setChatMessages(prev => [...prev, { role: "user", text: msg }, { role: "model", text: "", streaming: true }]);
 
     try {
-      const data = await sendChatMessage(sessionId, msg);
-      setChatMessages(prev => [...prev, {
-        role: "model",
-        text: data.reply,
-        midiDownloadUrl: data.midiDownloadUrl
-      }]);
+      const data = await sendChatMessageStream(sessionId, msg, { onToken: appendToStreamingMessage });
+      finishStreamingMessage(data.reply, data.midiDownloadUrl);
     } catch (e) {
       setError(e?.message || String(e));
+      setChatMessages(prev => prev.filter(m => !m.streaming));
     } finally {
       setLoadingReply(false);
     }
@@ -177,7 +202,7 @@ export default function App() {
               <label>1) Studio Source</label>
               <input type="file" accept="audio/*" onChange={onPickFile} />
               <div className="muted" style={{ marginTop: '8px' }}>
-                WAV / MP3 / FLAC supported.
+                {uploading ? "Uploading to studio..." : "WAV / MP3 / FLAC supported."}
               </div>
             </div>
 
@@ -186,7 +211,7 @@ export default function App() {
                 <div className="hr" />
                 <div>
                   <label>2) Signal Selection</label>
-                  <Waveform file={file} onSelectionChange={onSelectionChange} />
+                  <Waveform file={file} trackId={trackId} onSelectionChange={onSelectionChange} />
                 </div>
 
                 <div className="kpi">
@@ -201,8 +226,8 @@ export default function App() {
           {/* Spectrogram now lives in left column */}
           <section className="card spectrogram-card">
             <label>Spectrogram Reference</label>
-            {spectrogramB64 ? (
-              <img src={`data:image/png;base64,${spectrogramB64}`} alt="Spectrogram" />
+            {spectrogramData ? (
+              <SpectrogramCanvas data={spectrogramData} />
             ) : (
               <div className="spectrogram-placeholder">
                 <div className="muted">Visual data will appear after analysis</div>
@@ -1,10 +1,42 @@
+import { sha256File } from "./sha256.js";
+
 const API_BASE = "http://localhost:8000";
 
-export async function fetchSpectrogram({ file, startSec, endSec }) {
+/**
+ * Store the file on the backend once and return { trackId }.
+ * Region requests then reference the trackId instead of re-sending the audio.
+ */
+export async function uploadTrack(file) {
+  // Skip the upload entirely when the server already has these bytes
+  try {
+    const trackId = await sha256File(file);
+    const existing = await fetch(`${API_BASE}/api/tracks/${trackId}`);
+    if (existing.ok) return existing.json();
+  } catch {
+    // Fall through to a regular upload
+  }
+
   const fd = new FormData();
   fd.append("file", file);
+
+  const res = await fetch(`${API_BASE}/api/tracks`, {
+    method: "POST",
+    body: fd,
+  });
+
+  if (!res.ok) {
+    const msg = await res.text();
+    throw new Error(msg || "Failed to upload track.");
+  }
+  return res.json();
+}
+
+export async function fetchSpectrogram({ trackId, startSec, endSec, includeImage = true }) {
+  const fd = new FormData();
+  fd.append("trackId", trackId);
   fd.append("startSec", String(startSec));
   fd.append("endSec", String(endSec));
+  fd.append("includeImage", String(includeImage));
 
   const res = await fetch(`${API_BASE}/api/spectrogram`, {
     method: "POST",
@@ -18,9 +50,68 @@ export async function fetchSpectrogram({ file, startSec, endSec }) {
   return res.json();
 }
 
-export async function analyzeAudio({ file, startSec, endSec, prompt, modelId, temperature, thinkingBudget, mode, bpm, chords }) {
+function float16ToFloat32(bits) {
+  const out = new Float32Array(bits.length);
+  for (let i = 0; i < bits.length; i++) {
+    const h = bits[i];
+    const sign = h & 0x8000 ? -1 : 1;
+    const exp = (h >> 10) & 0x1f;
+    const frac = h & 0x3ff;
+    if (exp === 0) out[i] = sign * 2 ** -14 * (frac / 1024);
+    else if (exp === 0x1f) out[i] = frac ? NaN : sign * Infinity;
+    else out[i] = sign * 2 ** (exp - 15) * (1 + frac / 1024);
+  }
+  return out;
+}
+
+/**
+ * Decode the binary payload from /api/spectrogram/data.
+ * Returns { meta, db } where db is a Float32Array of nMels rows x frames (lowest band first).
+ */
+export function decodeSpectrogramPayload(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== "MELS") throw new Error("Unexpected spectrogram payload.");
+
+  const headerLen = view.getUint32(4, true);
+  const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLen)));
+  const offset = 8 + headerLen;
+  const count = meta.nMels * meta.frames;
+
+  let db;
+  if (meta.dtype === "uint8") {
+    const q = new Uint8Array(buffer, offset, count);
+    db = new Float32Array(count);
+    for (let i = 0; i < count; i++) db[i] = q[i] * meta.scale + meta.dbMin;
+  } else {
+    // Copy so the 2-byte view is aligned regardless of header length
+    db = float16ToFloat32(new Uint16Array(buffer.slice(offset, offset + count * 2)));
+  }
+  return { meta, db };
+}
+
+export async function fetchSpectrogramData({ trackId, startSec, endSec, dtype = "uint8" }) {
   const fd = new FormData();
-  fd.append("file", file);
+  fd.append("trackId", trackId);
+  fd.append("startSec", String(startSec));
+  fd.append("endSec", String(endSec));
+  fd.append("dtype", dtype);
+
+  const res = await fetch(`${API_BASE}/api/spectrogram/data`, {
+    method: "POST",
+    body: fd,
+  });
+
+  if (!res.ok) {
+    const msg = await res.text();
+    throw new Error(msg || "Failed to fetch spectrogram data.");
+  }
+  return decodeSpectrogramPayload(await res.arrayBuffer());
+}
+
+function analyzeForm({ trackId, startSec, endSec, prompt, modelId, temperature, thinkingBudget, mode, bpm, chords, includeImage = true }) {
+  const fd = new FormData();
+  fd.append("trackId", trackId);
   fd.append("startSec", String(startSec));
   fd.append("endSec", String(endSec));
   fd.append("prompt", prompt);
@@ -28,14 +119,18 @@ export async function analyzeAudio({ file, startSec, endSec, prompt, modelId, te
   fd.append("temperature", String(temperature));
   if (thinkingBudget) fd.append("thinkingBudget", String(thinkingBudget));
   fd.append("mode", mode || "engineer");
+  fd.append("includeImage", String(includeImage));
 
   // Pass user-edited BPM and chords for Producer mode
   if (bpm) fd.append("bpm", String(bpm));
   if (chords && chords.length > 0) fd.append("chords", JSON.stringify(chords));
+  return fd;
+}
 
+export async function analyzeAudio(params) {
   const res = await fetch(`${API_BASE}/api/analyze`, {
     method: "POST",
-    body: fd,
+    body: analyzeForm(params),
   });
 
   if (!res.ok) {
@@ -45,6 +140,62 @@ export async function analyzeAudio({ file, startSec, endSec, prompt, modelId, te
   return res.json();
 }
 
+/**
+ * Read a server-sent-event response, calling handlers[event](data) per event.
+ * Resolves with the "done" payload; rejects on an "error" event or a cut-off stream.
+ */
+async function readEventStream(res, handlers = {}) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) >= 0) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      const dataLines = [];
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) dataLines.push(line.slice(5).trimStart());
+      }
+      const data = dataLines.length ? JSON.parse(dataLines.join("\n")) : null;
+
+      if (event === "error") throw new Error(data?.detail || "Stream failed.");
+      if (event === "done") return data;
+      handlers[event]?.(data);
+    }
+  }
+  throw new Error("Stream ended unexpectedly.");
+}
+
+/**
+ * Streaming analysis: onPreamble({ trackId, spectrogramPngBase64, bpm, chords }) fires
+ * before the model answers, onToken(text) per chunk. Resolves with
+ * { sessionId, advice, midiDownloadUrl }.
+ */
+export async function analyzeAudioStream(params, { onPreamble, onToken } = {}) {
+  const res = await fetch(`${API_BASE}/api/analyze/stream`, {
+    method: "POST",
+    body: analyzeForm(params),
+  });
+
+  if (!res.ok) {
+    const msg = await res.text();
+    throw new Error(msg || "Failed to analyze audio.");
+  }
+  return readEventStream(res, {
+    preamble: onPreamble,
+    token: (data) => onToken?.(data.text),
+  });
+}
+
 export async function sendChatMessage(sessionId, message) {
   const fd = new FormData();
   fd.append("sessionId", sessionId);
@@ -61,3 +212,45 @@ export async function sendChatMessage(sessionId, message) {
   }
   return res.json();
 }
+
+/**
+ * Streaming follow-up: onToken(text) per chunk, resolves with { reply, midiDownloadUrl }.
+ */
+export async function sendChatMessageStream(sessionId, message, { onToken } = {}) {
+  const fd = new FormData();
+  fd.append("sessionId", sessionId);
+  fd.append("message", message);
+
+  const res = await fetch(`${API_BASE}/api/chat/stream`, {
+    method: "POST",
+    body: fd,
+  });
+
+  if (!res.ok) {
+    const msg = await res.text();
+    throw new Error(msg || "Failed to send message.");
+  }
+  return readEventStream(res, { token: (data) => onToken?.(data.text) });
+}
+
+export async function fetchSpectrogramPyramid(trackId) {
+  const res = await fetch(`${API_BASE}/api/tracks/${trackId}/spectrogram/pyramid`);
+  if (!res.ok) {
+    const msg = await res.text();
+    throw new Error(msg || "Failed to load spectrogram pyramid.");
+  }
+  return res.json();
+}
+
+export function spectrogramTileUrl(trackId, level, index) {
+  return `${API_BASE}/api/tracks/${trackId}/spectrogram/tiles/${level}/${index}.png`;
+}
+
+export async function fetchWaveformPeaks(trackId, maxPeaks = 16000) {
+  const res = await fetch(`${API_BASE}/api/tracks/${trackId}/peaks?maxPeaks=${maxPeaks}`);
+  if (!res.ok) {
+    const msg = await res.text();
+    throw new Error(msg || "Failed to load waveform peaks.");
+  }
+  return res.json();
+}
@@ -0,0 +1,114 @@
+import React, { useEffect, useMemo, useRef, useState } from "react";
+
+// Colormap control points (evenly spaced), interpolated into 256-entry LUTs
+const COLORMAPS = {
+  magma: ["#000004", "#1c1044", "#4f127b", "#812581", "#b5367a", "#e55064", "#fb8761", "#fec287", "#fcfdbf"],
+  viridis: ["#440154", "#482878", "#3e4989", "#31688e", "#26828e", "#1f9e89", "#35b779", "#6ece58", "#b5de2b", "#fde725"],
+  gray: ["#000000", "#ffffff"],
+};
+
+function buildLut(stops) {
+  const rgb = stops.map((hex) => [1, 3, 5].map((i) => parseInt(hex.slice(i, i + 2), 16)));
+  const lut = new Uint8ClampedArray(256 * 3);
+  for (let i = 0; i < 256; i++) {
+    const pos = (i / 255) * (rgb.length - 1);
+    const lo = Math.floor(pos);
+    const hi = Math.min(lo + 1, rgb.length - 1);
+    const t = pos - lo;
+    for (let c = 0; c < 3; c++) lut[i * 3 + c] = rgb[lo][c] + (rgb[hi][c] - rgb[lo][c]) * t;
+  }
+  return lut;
+}
+
+/**
+ * Client-side Mel spectrogram renderer for /api/spectrogram/data payloads.
+ * - Scroll to zoom the time axis around the cursor, double-click to reset
+ * - Colormap can be switched without a server round trip
+ */
+export default function SpectrogramCanvas({ data }) {
+  const canvasRef = useRef(null);
+  const [colormap, setColormap] = useState("magma");
+  const [view, setView] = useState({ start: 0, end: 0 });
+
+  const lut = useMemo(() => buildLut(COLORMAPS[colormap]), [colormap]);
+  const { meta, db } = data;
+
+  // Reset zoom whenever a new region is loaded
+  useEffect(() => {
+    setView({ start: 0, end: meta.frames });
+  }, [meta]);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas || view.end <= view.start) return;
+
+    const { nMels, frames, dbMin, dbMax } = meta;
+    const width = view.end - view.start;
+    canvas.width = width;
+    canvas.height = nMels;
+
+    const ctx = canvas.getContext("2d");
+    const img = ctx.createImageData(width, nMels);
+    const span = Math.max(dbMax - dbMin, 1e-6);
+
+    for (let row = 0; row < nMels; row++) {
+      // Lowest band at the bottom of the canvas
+      const src = row * frames + view.start;
+      const dst = (nMels - 1 - row) * width;
+      for (let x = 0; x < width; x++) {
+        const v = Math.max(0, Math.min(255, Math.round(((db[src + x] - dbMin) / span) * 255)));
+        const p = (dst + x) * 4;
+        img.data[p] = lut[v * 3];
+        img.data[p + 1] = lut[v * 3 + 1];
+        img.data[p + 2] = lut[v * 3 + 2];
+        img.data[p + 3] = 255;
+      }
+    }
+    ctx.putImageData(img, 0, 0);
+  }, [meta, db, lut, view]);
+
+  // Non-passive listener so the page doesn't scroll while zooming
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas) return;
+
+    const onWheel = (e) => {
+      e.preventDefault();
+      const rect = canvas.getBoundingClientRect();
+      const ratio = (e.clientX - rect.left) / rect.width;
+      const factor = e.deltaY > 0 ? 1.25 : 0.8;
+
+      setView((v) => {
+        const anchor = v.start + ratio * (v.end - v.start);
+        const width = Math.max(16, Math.min(meta.frames, Math.round((v.end - v.start) * factor)));
+        let start = Math.round(anchor - ratio * width);
+        start = Math.max(0, Math.min(meta.frames - width, start));
+        return { start, end: start + width };
+      });
+    };
+
+    canvas.addEventListener("wheel", onWheel, { passive: false });
+    return () => canvas.removeEventListener("wheel", onWheel);
+  }, [meta]);
+
+  const toSec = (frame) => (meta.startSec + frame * meta.frameSec).toFixed(2);
+
+  return (
+    <div className="stack" style={{ gap: "6px" }}>
+      <canvas
+        ref={canvasRef}
+        onDoubleClick={() => setView({ start: 0, end: meta.frames })}
+        style={{ width: "100%", height: "256px", imageRendering: "pixelated", borderRadius: "8px" }}
+      />
+      <div className="kpi">
+        <span className="pill">{toSec(view.start)}s – {toSec(view.end)}s</span>
+        <span className="pill">{meta.nMels} mel bins · 0–{Math.round(meta.fmax)} Hz</span>
+        <select value={colormap} onChange={(e) => setColormap(e.target.value)} style={{ width: "auto" }}>
+          {Object.keys(COLORMAPS).map((name) => (
+            <option key={name} value={name}>{name}</option>
+          ))}
+        </select>
+      </div>
+    </div>
+  );
+}
@@ -0,0 +1,64 @@
+import React, { useEffect, useState } from "react";
+import { fetchSpectrogramPyramid, spectrogramTileUrl } from "../api.js";
+
+/**
+ * Full-track spectrogram strip aligned with the waveform's visible window.
+ * Picks the coarsest pyramid level that still has >= 1 column per pixel and
+ * only requests the tiles that intersect [startSec, endSec].
+ */
+export default function SpectrogramTiles({ trackId, startSec, endSec, width, height = 96 }) {
+  const [pyramid, setPyramid] = useState(null);
+
+  useEffect(() => {
+    if (!trackId) return;
+    let cancelled = false;
+    setPyramid(null);
+    fetchSpectrogramPyramid(trackId)
+      .then((p) => !cancelled && setPyramid(p))
+      .catch(() => !cancelled && setPyramid(null));
+    return () => {
+      cancelled = true;
+    };
+  }, [trackId]);
+
+  if (!pyramid || !width || endSec <= startSec) return null;
+
+  const pxPerSec = width / (endSec - startSec);
+  let level = 0;
+  for (const l of pyramid.levels) {
+    if (1 / l.secondsPerColumn >= pxPerSec) level = l.level;
+  }
+
+  const { secondsPerColumn, tiles, columns } = pyramid.levels[level];
+  const tileSec = pyramid.tileWidth * secondsPerColumn;
+  const first = Math.max(0, Math.floor(startSec / tileSec));
+  const last = Math.min(tiles - 1, Math.floor(endSec / tileSec));
+
+  const items = [];
+  for (let i = first; i <= last; i++) {
+    // The last tile of a level is usually narrower
+    const tileCols = Math.min(pyramid.tileWidth, columns - i * pyramid.tileWidth);
+    items.push(
+      <img
+        key={`${level}-${i}`}
+        src={spectrogramTileUrl(trackId, level, i)}
+        alt=""
+        draggable={false}
+        style={{
+          position: "absolute",
+          top: 0,
+          left: `${(i * tileSec - startSec) * pxPerSec}px`,
+          width: `${tileCols * secondsPerColumn * pxPerSec}px`,
+          height: "100%",
+          imageRendering: "pixelated",
+        }}
+      />
+    );
+  }
+
+  return (
+    <div style={{ position: "relative", overflow: "hidden", width: "100%", height: `${height}px`, borderRadius: "8px", background: "#000" }}>
+      {items}
+    </div>
+  );
+}
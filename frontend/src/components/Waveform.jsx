@@ -1,14 +1,18 @@
 import React, { useEffect, useMemo, useRef, useState } from "react";
 import WaveSurfer from "wavesurfer.js";
 import RegionsPlugin from "wavesurfer.js/dist/plugins/regions.esm.js";
+import SpectrogramTiles from "./SpectrogramTiles.jsx";
+import { fetchWaveformPeaks } from "../api.js";
 
 /**
- * Waveform player + region selection (no backend calls).
- * - Loads a local File via object URL
+ * Waveform player + region selection.
+ * - Loads a local File via object URL for playback
+ * - Draws from server-side precomputed peaks, so the browser never decodes the full file
  * - Creates a draggable + resizable region
  * - Emits selection changes up to parent
+ * - Shows the server-side spectrogram pyramid for the visible window once the track is uploaded
  */
-export default function Waveform({ file, onSelectionChange }) {
+export default function Waveform({ file, trackId, onSelectionChange }) {
   const containerRef = useRef(null);
   const wsRef = useRef(null);
   const regionRef = useRef(null);
@@ -16,9 +20,13 @@ export default function Waveform({ file, onSelectionChange }) {
   const [isReady, setIsReady] = useState(false);
   const [isPlaying, setIsPlaying] = useState(false);
   const [duration, setDuration] = useState(0);
+  const [zoom, setZoom] = useState(0);
+  const [visible, setVisible] = useState({ startSec: 0, endSec: 0, width: 0 });
 
   useEffect(() => {
-    if (!containerRef.current || !file) return;
+    // Wait for the upload so the waveform can be drawn from server peaks
+    if (!containerRef.current || !file || !trackId) return;
+    let cancelled = false;
 
     // 1. Create Object URL locally within the effect
     const audioUrl = URL.createObjectURL(file);
@@ -49,6 +57,19 @@ export default function Waveform({ file, onSelectionChange }) {
 
     wsRef.current = ws;
 
+    // Track the visible time window so the spectrogram strip follows zoom/scroll
+    const updateVisible = () => {
+      const dur = ws.getDuration();
+      const width = ws.getWidth();
+      if (!dur || !width) return;
+      const pxPerSec = Math.max(ws.options.minPxPerSec || 0, width / dur);
+      const startSec = ws.getScroll() / pxPerSec;
+      setVisible({ startSec, endSec: Math.min(dur, startSec + width / pxPerSec), width });
+    };
+    ws.on("zoom", updateVisible);
+    ws.on("scroll", updateVisible);
+    ws.on("redraw", updateVisible);
+
     ws.on("ready", () => {
       // Guard: if destroyed in the meantime
       if (!wsRef.current) return;
@@ -56,6 +77,8 @@ export default function Waveform({ file, onSelectionChange }) {
       setIsReady(true);
       const dur = ws.getDuration();
       setDuration(dur);
+      setZoom(0);
+      updateVisible();
 
       // Default region: full duration (capped at 10 minutes for safety)
       const start = 0;
@@ -96,14 +119,22 @@ export default function Waveform({ file, onSelectionChange }) {
       });
     });
 
-    ws.load(audioUrl);
+    // Peaks are [max, min] channels: WaveSurfer draws the first above the axis, the second below.
+    // If they can't be fetched, WaveSurfer falls back to decoding the file itself.
+    fetchWaveformPeaks(trackId)
+      .then((p) => [[p.max, p.min], p.duration])
+      .catch(() => [undefined, undefined])
+      .then(([peaks, dur]) => {
+        if (!cancelled) ws.load(audioUrl, peaks, dur);
+      });
 
     return () => {
       // Cleanup: Destroy WS first, then revoke the URL
+      cancelled = true;
       if (ws) ws.destroy();
       URL.revokeObjectURL(audioUrl);
     };
-  }, [file, onSelectionChange]);
+  }, [file, trackId, onSelectionChange]);
 
   const toggle = () => {
     if (!wsRef.current) return;
@@ -117,6 +148,12 @@ export default function Waveform({ file, onSelectionChange }) {
     ws.play(region.start, region.end);
   };
 
+  const onZoom = (e) => {
+    const value = Number(e.target.value);
+    setZoom(value);
+    wsRef.current?.zoom(value);
+  };
+
   const selectFull = () => {
     const ws = wsRef.current;
     const region = regionRef.current;
@@ -128,7 +165,16 @@ export default function Waveform({ file, onSelectionChange }) {
 
   return (
     <div className="stack">
+      {!trackId && <div className="muted">Preparing waveform...</div>}
       <div ref={containerRef} className="card" />
+      {trackId && (
+        <SpectrogramTiles
+          trackId={trackId}
+          startSec={visible.startSec}
+          endSec={visible.endSec}
+          width={visible.width}
+        />
+      )}
       <div className="kpi">
         <button className="btn secondary" disabled={!isReady} onClick={toggle}>
           {isPlaying ? "Pause" : "Play/Pause"}
@@ -140,6 +186,17 @@ export default function Waveform({ file, onSelectionChange }) {
           Select Full
         </button>
         <span className="pill">Duration: {duration.toFixed(2)}s</span>
+        <input
+          type="range"
+          min={0}
+          max={500}
+          step={10}
+          value={zoom}
+          disabled={!isReady}
+          onChange={onZoom}
+          title="Zoom"
+          style={{ width: "120px" }}
+        />
         <span className="pill">Drag/resize region to select</span>
       </div>
       <div className="muted">